@@ -1,8 +1,17 @@
 import os
+import json
+import time
+import hashlib
 import logging
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
+import threading
+import uuid
+import click
+from datetime import datetime
+from flask import (Flask, render_template, stream_template, request, redirect, url_for, flash,
+                   get_flashed_messages, jsonify, session, Response, stream_with_context)
 from flask_login import LoginManager, current_user, login_required
 from werkzeug.utils import secure_filename
+from urllib.parse import quote
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.middleware.proxy_fix import ProxyFix
 from sqlalchemy.orm import DeclarativeBase
@@ -62,17 +71,340 @@ def create_app(config_class=None):
     app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
     
     # Import services after initializing app
-    from drive_service import DriveService
-    from youtube_service import YouTubeService
+    from youtube_service import YouTubeService, MAX_HEIGHTS, VIDEO_CONTAINERS, AUDIO_CONTAINERS
+    from archive_import import ArchiveImporter, archive_format
+    from thumbnail_cache import ThumbnailCache
+    from listing_validator import ListingValidatorCache
+    from mime_detection import registry as mime_registry, SNIFF_BYTES
+    import chunked_upload
+    from chunked_upload import ChunkedUploadStore, UploadAborted
+    from transfer_jobs import TransferQueue, TransferWorker, RUNNING as JOB_RUNNING
+    from bulk_import import BulkUrlImporter, parse_url_list
+    from playlist_import import PlaylistImporter
+    from transfer_history import TransferHistory, throughput_stats, phase as transfer_phase
+    from scratch_space import scratch, ScratchSpaceExhausted
     import utils
     
+    thumbnail_cache = ThumbnailCache(
+        app.config['THUMBNAIL_CACHE_DIR'], app.config['THUMBNAIL_CACHE_MAX_BYTES']
+    )
+    
+    listing_validators = ListingValidatorCache(app.config['FILES_VALIDATOR_TTL'])
+    chunked_uploads = ChunkedUploadStore(app, scratch)
+    scratch.start_janitor()
+    transfer_history = TransferHistory(app)
+    
+    def listing_user_key():
+        """Identify whose Drive a listing shows (OAuth user or session API key)."""
+        if current_user.is_authenticated and current_user.google_access_token:
+            return f"user:{current_user.id}"
+        api_key = session.get('api_key') or ''
+        return "key:" + hashlib.sha1(api_key.encode('utf-8')).hexdigest()
+    
+    def has_drive_access():
+        """Whether the caller is logged in with Google or has set up API credentials."""
+        if current_user.is_authenticated and current_user.google_access_token:
+            return True
+        return bool(session.get('api_key') and session.get('client_id') and session.get('client_secret'))
+    
+    def listing_etag(view):
+        """Compute the ETag of a listing view, or None if Drive can't tell us.
+        
+        The Drive validator is cached per user for FILES_VALIDATOR_TTL, so a
+        reload within that window needs no Drive API call at all.
+        """
+        user_key = listing_user_key()
+        validator = listing_validators.get(user_key)
+        if validator is None:
+            try:
+                validator = get_drive_service().get_listing_validator(
+                    max_results=app.config['FILES_MAX_RESULTS']
+                )
+            except Exception as e:
+                logger.warning(f"No listing validator available: {str(e)}")
+                return None
+            listing_validators.set(user_key, validator)
+        raw = (f"{view}:{user_key}:{validator}:{app.config['FILES_MAX_RESULTS']}:"
+               f"{listing_validators.salt(user_key)}")
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+    
+    def not_modified(etag):
+        """Build a 304 response for a listing."""
+        response = Response(status=304)
+        response.set_etag(etag)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+    
+    @app.after_request
+    def invalidate_listing_validator(response):
+        """Any state-changing request may change the user's listing."""
+        if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            listing_validators.invalidate(listing_user_key())
+        return response
+    
+    def track_transfer(source_kind, source_url=None, job=None):
+        """Record a transfer's timings and outcome for /api/transfers/stats.
+        
+        Args:
+            source_kind (str): 'file', 'url' or 'youtube'
+            source_url (str, optional): Where the content comes from
+            job (TransferJob, optional): Queued job running the transfer, if any
+        """
+        return transfer_tracker(source_kind, job)(source_url)
+    
+    def transfer_tracker(source_kind, job=None):
+        """Return track(source_url) for importers that record each item on their own threads.
+        
+        The owner is captured now, on the request (or job) thread, because
+        the importer's pool threads have no request context.
+        """
+        owner = (job.user_id, job.owner_key) if job is not None else transfer_owner()
+        return lambda source_url: transfer_history.track(source_kind, source_url, *owner)
+    
+    def transfer_owner():
+        """(user_id, owner_key) of the caller, for transfers tracked outside the request."""
+        user_id = current_user.id if current_user.is_authenticated else None
+        return user_id, listing_user_key()
+    
+    def new_drive_service(*args, **kwargs):
+        """Create a DriveService, importing the Google API client on first use."""
+        from drive_service import DriveService
+        return DriveService(*args, **kwargs)
+    
+    def get_drive_service():
+        """Return a DriveService for the logged-in user or the session's API credentials."""
+        global drive_service
+        
+        # Try to use OAuth if user is logged in
+        if current_user.is_authenticated and current_user.google_access_token:
+            drive_service = new_drive_service(
+                user_credentials={
+                    'token': current_user.google_access_token,
+                    'refresh_token': current_user.google_refresh_token
+                }
+            )
+        elif not drive_service:
+            drive_service = new_drive_service(
+                session.get('api_key'),
+                session.get('client_id'),
+                session.get('client_secret')
+            )
+        return drive_service
+    
+    def form_flag(name, default=False):
+        """Read a checkbox-style boolean from the submitted form."""
+        value = request.form.get(name)
+        if value is None:
+            return default
+        return value.lower() in ('1', 'true', 'on', 'yes')
+    
+    def wants_archive_expansion():
+        """Whether the submitted form asked for archives to be expanded."""
+        return form_flag('expand_archive')
+    
+    def archive_summary(filename, result):
+        """Describe an expanded archive for the JSON responses."""
+        message = f"Archive {filename} expanded: {result['uploaded']} file(s) uploaded, " \
+                  f"{result['failed']} failed"
+        if result['error']:
+            message += f"; stopped early: {result['error']}"
+        return {
+            "success": result['failed'] == 0 and not result['error'],
+            "message": message,
+            "error": result['error'],
+            "folder_id": result['folder_id'],
+            "folders_created": result['folders_created'],
+            "uploaded": result['uploaded'],
+            "failed": result['failed'],
+            "results": result['results']
+        }
+    
+    def archive_response(filename, result):
+        """Build the JSON response for an expanded archive."""
+        return jsonify(archive_summary(filename, result))
+    
+    def import_url(service, url, expand_archive=False, job=None):
+        """Copy a URL into Drive, optionally expanding archives.
+        
+        Returns:
+            dict: JSON-serialisable outcome
+        """
+        with track_transfer('url', url, job) as transfer:
+            if expand_archive:
+                # Download once, then either expand or upload what we already have
+                filename, body, content_type = utils.download_with_cloudscraper(url)
+                size = body.getbuffer().nbytes
+                if archive_format(filename):
+                    # Entries upload on pool threads; time the whole import as the upload
+                    with transfer_phase('upload'):
+                        result = ArchiveImporter(service).import_archive(body, filename)
+                    transfer.bytes = size
+                    return archive_summary(filename, result)
+                file_id = service.upload_stream(body, filename, content_type, size)
+            else:
+                # Download from URL and upload to Drive
+                file_id = service.upload_from_url(url)
+            transfer.file_id = file_id
+        return {
+            "success": True,
+            "message": "File uploaded from URL successfully",
+            "file_id": file_id
+        }
+    
+    def get_youtube_service():
+        """Return the process-wide YouTubeService."""
+        global youtube_service
+        if not youtube_service:
+            youtube_service = YouTubeService()
+        return youtube_service
+    
+    def youtube_options():
+        """Read the format options (quality, container, audio only) from the form."""
+        try:
+            max_height = int(request.form.get('max_height') or 0)
+        except ValueError:
+            max_height = 0
+        container = request.form.get('container', '').lower()
+        return {
+            'max_height': max_height if max_height in MAX_HEIGHTS else None,
+            'container': container if container in VIDEO_CONTAINERS + AUDIO_CONTAINERS else None,
+            'audio_only': form_flag('audio_only')
+        }
+    
+    def import_youtube(service, youtube_url, playlist=False, own_folder=True, options=None,
+                       job=None):
+        """Copy a YouTube video, or every video of a playlist, into Drive.
+        
+        Returns:
+            dict: JSON-serialisable outcome
+        """
+        if playlist:
+            return PlaylistImporter(
+                service, get_youtube_service(), track=transfer_tracker('youtube', job)
+            ).import_playlist(youtube_url, own_folder, options=options)
+        selected = {}
+        with track_transfer('youtube', youtube_url, job) as transfer:
+            file_id = utils.upload_from_youtube(
+                youtube_url, service, get_youtube_service(), options=options, on_info=selected.update
+            )
+            transfer.file_id = file_id
+        return {
+            "success": True,
+            "message": "YouTube video uploaded successfully",
+            "file_id": file_id,
+            "format": selected
+        }
+    
+    # Durable transfer queue shared by all instances (see transfer_jobs.py)
+    transfer_queue = TransferQueue()
+    
+    def drive_service_for_job(job, cancelled=None):
+        """Build a DriveService with the credentials of the job's owner.
+        
+        Ends the database session once the credentials are read, so no
+        connection stays in a transaction for the rest of the transfer.
+        """
+        try:
+            if job.user_id:
+                user = db.session.get(User, job.user_id)
+                if user is None or not user.google_access_token:
+                    raise Exception("The job's owner is no longer connected to Google")
+                user_credentials = {
+                    'token': user.google_access_token,
+                    'refresh_token': user.google_refresh_token
+                }
+                return new_drive_service(user_credentials=user_credentials, cancelled=cancelled)
+        finally:
+            db.session.close()
+        credentials = json.loads(job.credentials or '{}')
+        return new_drive_service(
+            credentials.get('api_key'),
+            credentials.get('client_id'),
+            credentials.get('client_secret'),
+            cancelled=cancelled
+        )
+    
+    transfer_handlers = {
+        'url': lambda job, payload, cancelled: import_url(
+            drive_service_for_job(job, cancelled), payload['url'],
+            payload.get('expand_archive', False), job
+        ),
+        'youtube': lambda job, payload, cancelled: import_youtube(
+            drive_service_for_job(job, cancelled), payload['youtube_url'],
+            payload.get('playlist', False), payload.get('own_folder', True),
+            payload.get('options'), job
+        ),
+        'bulk_url': lambda job, payload, cancelled: BulkUrlImporter(
+            drive_service_for_job(job, cancelled), track=transfer_tracker('url', job)
+        ).import_urls(payload['urls']),
+    }
+    
+    # Runs transfers in the background of this instance when no queue
+    # workers do; those runs are not retried, so an instance that stops
+    # mid-transfer fails the job once its lease expires
+    local_transfers = TransferWorker(app, TransferQueue(max_attempts=1), transfer_handlers)
+    
+    def enqueue_transfer(kind, payload):
+        """Queue a transfer and answer 202 Accepted.
+        
+        With TRANSFER_QUEUE_ENABLED the job goes to any instance's workers;
+        otherwise it runs on a background thread of this instance. Either way
+        the client polls the returned status URL.
+        """
+        if current_user.is_authenticated and current_user.google_access_token:
+            job = transfer_queue.enqueue(kind, payload, listing_user_key(), user_id=current_user.id)
+        else:
+            job = transfer_queue.enqueue(kind, payload, listing_user_key(), credentials={
+                'api_key': session.get('api_key'),
+                'client_id': session.get('client_id'),
+                'client_secret': session.get('client_secret')
+            })
+        if not app.config['TRANSFER_QUEUE_ENABLED']:
+            local_transfers.run(job)
+        return jsonify({
+            "success": True,
+            "queued": True,
+            "message": "Transfer queued",
+            "job_id": job.id,
+            "status_url": url_for('job_status', job_id=job.id)
+        }), 202
+    
     # Register blueprints
     from google_auth import google_auth
     app.register_blueprint(google_auth)
     
     # Create database tables if they don't exist
-    with app.app_context():
-        db.create_all()
+    def create_tables():
+        with app.app_context():
+            db.create_all()
+    
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create missing database tables (run at deploy time with DB_SCHEMA_SETUP=off)."""
+        create_tables()
+        print('Database tables are up to date.')
+    
+    def start_transfer_workers():
+        if app.config['TRANSFER_QUEUE_ENABLED']:
+            TransferWorker(app, transfer_queue, transfer_handlers).start()
+    
+    def prepare_database():
+        """Create missing tables, then start the workers that depend on them."""
+        try:
+            create_tables()
+        except Exception as e:
+            logger.error(f"Error creating database tables: {str(e)}")
+        start_transfer_workers()
+    
+    schema_setup = app.config['DB_SCHEMA_SETUP']
+    if schema_setup == 'startup':
+        prepare_database()
+    elif schema_setup == 'background':
+        # Keep the database round trips off the path to the first response
+        threading.Thread(target=prepare_database, name='schema-setup', daemon=True).start()
+    else:
+        start_transfer_workers()
     
     # Routes
     @app.route('/')
@@ -100,7 +432,7 @@ def create_app(config_class=None):
                 session['client_secret'] = client_secret
                 
                 # Initialize drive service with these credentials
-                drive_service = DriveService(api_key, client_id, client_secret)
+                drive_service = new_drive_service(api_key, client_id, client_secret)
                 
                 flash('Google Drive API credentials saved successfully!', 'success')
                 return redirect(url_for('uploads'))
@@ -126,76 +458,127 @@ def create_app(config_class=None):
     
     @app.route('/files')
     def files():
-        """View files in Google Drive."""
-        global drive_service
+        """View files in Google Drive.
         
-        try:
-            # Try to use OAuth if user is logged in
-            if current_user.is_authenticated and current_user.google_access_token:
-                from drive_service import DriveService
-                drive_service = DriveService(
-                    user_credentials={
-                        'token': current_user.google_access_token,
-                        'refresh_token': current_user.google_refresh_token
-                    }
-                )
-                files_list = drive_service.list_files()
-                return render_template('files.html', files=files_list)
-            
-            # Fall back to API key method
+        The page is streamed: the header is sent right away and rows are
+        rendered as each page of the Drive listing arrives.
+        """
+        # Fall back to API key method if the user isn't logged in with Google
+        if not (current_user.is_authenticated and current_user.google_access_token):
             if not session.get('api_key') or not session.get('client_id') or not session.get('client_secret'):
                 flash('Please set up your Google Drive API credentials or login with Google.', 'warning')
                 return redirect(url_for('setup'))
-            
-            if not drive_service:
-                drive_service = DriveService(
-                    session.get('api_key'),
-                    session.get('client_id'),
-                    session.get('client_secret')
-                )
-            
-            files_list = drive_service.list_files()
-            return render_template('files.html', files=files_list)
+        
+        # A page with pending flash messages differs from the cached one
+        etag = None if session.get('_flashes') else listing_etag('files-html')
+        if etag and etag in request.if_none_match:
+            return not_modified(etag)
+        
+        try:
+            listing = get_drive_service().iter_files(
+                first_page_size=app.config['FILES_FIRST_PAGE_SIZE'],
+                page_size=app.config['FILES_PAGE_SIZE'],
+                max_results=app.config['FILES_MAX_RESULTS']
+            )
         except Exception as e:
             logger.error(f"Error listing files: {str(e)}")
             flash(f'Error listing files: {str(e)}', 'danger')
             return render_template('files.html', files=[])
+        
+        # Pop flashed messages now: the session cookie is written before a
+        # streamed body, so popping them during rendering would not persist.
+        get_flashed_messages(with_categories=True)
+        user_key = listing_user_key()
+        stream = stream_template('files.html', files=listing)
+        
+        def render():
+            try:
+                yield from stream
+            finally:
+                # The ETag went out before the listing failed; make sure the
+                # next If-None-Match doesn't keep serving the error
+                if etag and listing.error:
+                    listing_validators.reject(user_key)
+        
+        response = Response(render())
+        if etag:
+            response.set_etag(etag)
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+        return response
+    
+    @app.route('/api/files')
+    def api_files():
+        """List files in Google Drive as JSON (honours If-None-Match)."""
+        if not has_drive_access():
+            return jsonify({"error": "Not authenticated"}), 401
+        
+        etag = listing_etag('files-json')
+        if etag and etag in request.if_none_match:
+            return not_modified(etag)
+        
+        try:
+            listing = get_drive_service().iter_files(
+                first_page_size=app.config['FILES_PAGE_SIZE'],
+                page_size=app.config['FILES_PAGE_SIZE'],
+                max_results=app.config['FILES_MAX_RESULTS']
+            )
+            files_json = [{
+                "id": file.id,
+                "name": file.name,
+                "mimeType": file.mime_type,
+                "fileType": file.file_type,
+                "size": file.size,
+                "createdTime": file.created_time,
+                "modifiedTime": file.modified_time,
+                "webViewLink": file.web_view_link
+            } for file in listing]
+            if listing.error:
+                raise Exception(listing.error)
+        except Exception as e:
+            logger.error(f"Error listing files: {str(e)}")
+            return jsonify({"error": str(e)}), 500
+        
+        response = jsonify({"files": files_json})
+        if etag:
+            response.set_etag(etag)
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+        return response
     
     @app.route('/upload/file', methods=['POST'])
     def upload_file():
         """Handle direct file upload."""
-        global drive_service
-        
-        # Try to use OAuth if user is logged in
-        if current_user.is_authenticated and current_user.google_access_token:
-            drive_service = DriveService(
-                user_credentials={
-                    'token': current_user.google_access_token,
-                    'refresh_token': current_user.google_refresh_token
-                }
-            )
-        elif not drive_service:
-            drive_service = DriveService(
-                session.get('api_key'),
-                session.get('client_id'),
-                session.get('client_secret')
-            )
+        drive_service = get_drive_service()
         
         try:
+            # Reading the form receives the whole request body
+            started = time.monotonic()
             if 'file' not in request.files:
                 return jsonify({"error": "No file part"}), 400
+            received_seconds = time.monotonic() - started
             
             file = request.files['file']
             
             if file.filename == '':
                 return jsonify({"error": "No file selected"}), 400
             
-            # Secure the filename and determine MIME type
+            # Secure the filename and determine MIME type from the content
             filename = secure_filename(file.filename)
-            mime_type = utils.get_mime_type(filename)
+            mime_type = mime_registry.detect_stream(file.stream, filename, file.mimetype)
             
-            # Upload to Google Drive
-            file_id = drive_service.upload_file(file, filename, mime_type)
+            with track_transfer('file') as transfer:
+                transfer.download_seconds = received_seconds
+                # Expand archives into a folder tree if requested
+                if wants_archive_expansion() and archive_format(filename):
+                    with transfer_phase('upload'):
+                        result = ArchiveImporter(drive_service).import_archive(file.stream, filename)
+                    transfer.bytes = request.content_length or 0
+                    return archive_response(filename, result)
+                
+                # Upload to Google Drive
+                file_id = drive_service.upload_file(file, filename, mime_type)
+                transfer.file_id = file_id
             
             return jsonify({
                 "success": True,
@@ -206,102 +589,316 @@ def create_app(config_class=None):
             logger.error(f"Error uploading file: {str(e)}")
             return jsonify({"error": str(e)}), 500
     
-    @app.route('/upload/url', methods=['POST'])
-    def upload_from_url():
-        """Handle upload from a direct URL."""
-        global drive_service
+    @app.route('/upload/direct/session', methods=['POST'])
+    def create_direct_upload():
+        """Start a resumable upload that the browser sends straight to Drive.
         
-        # Try to use OAuth if user is logged in
-        if current_user.is_authenticated and current_user.google_access_token:
-            drive_service = DriveService(
-                user_credentials={
-                    'token': current_user.google_access_token,
-                    'refresh_token': current_user.google_refresh_token
-                }
+        Only the session URI is returned; upload.js PUTs the chunks to Google
+        and reports the resulting file ID to /upload/direct/complete, so the
+        content never passes through this server. Without a signed-in Google
+        account the response asks the client to fall back to /upload/file.
+        """
+        data = request.get_json(silent=True) or {}
+        filename = secure_filename(data.get('name') or '')
+        size = data.get('size')
+        if not filename:
+            return jsonify({"error": "No file selected"}), 400
+        if not isinstance(size, int) or size < 0:
+            return jsonify({"error": "Invalid file size"}), 400
+        if not (current_user.is_authenticated and current_user.google_access_token):
+            return jsonify({"error": "Direct uploads need a signed-in Google account",
+                            "fallback": True}), 409
+        
+        try:
+            mime_type = data.get('mime_type') or mime_registry.guess_type(filename) \
+                or 'application/octet-stream'
+            # Google only answers the browser's chunk requests from this origin
+            origin = request.headers.get('Origin') or request.host_url.rstrip('/')
+            upload_url = get_drive_service().create_upload_session(
+                filename, mime_type, size, origin=origin
             )
-        elif not drive_service:
-            drive_service = DriveService(
-                session.get('api_key'),
-                session.get('client_id'),
-                session.get('client_secret')
+            # Remember when the upload started, keyed by a token the client
+            # echoes to /upload/direct/complete; the time itself stays here
+            token = uuid.uuid4().hex[:16]
+            started = dict(session.get('direct_uploads') or {})
+            while len(started) >= 20:
+                del started[min(started, key=started.get)]
+            started[token] = time.time()
+            session['direct_uploads'] = started
+            return jsonify({
+                "upload_url": upload_url,
+                "upload_token": token,
+                "chunk_size": app.config['DIRECT_UPLOAD_CHUNK_SIZE'],
+                "max_retries": app.config['DIRECT_UPLOAD_MAX_RETRIES']
+            })
+        except Exception as e:
+            logger.error(f"Error starting direct upload: {str(e)}")
+            return jsonify({"error": str(e), "fallback": True}), 502
+    
+    @app.route('/upload/direct/complete', methods=['POST'])
+    def complete_direct_upload():
+        """Confirm a browser-to-Drive upload once Google has returned its file ID."""
+        from metrics import metrics
+        
+        data = request.get_json(silent=True) or {}
+        file_id = data.get('file_id')
+        if not file_id:
+            return jsonify({"error": "No file ID"}), 400
+        
+        try:
+            drive_service = get_drive_service()
+            # The browser created the file, so shared listings are out of date
+            drive_service.invalidate_reads()
+            with track_transfer('file') as transfer:
+                file = drive_service.get_file(file_id)
+                transfer.bytes = file.size
+                transfer.file_id = file.id
+                # Browser to Drive, from the session's creation
+                started = dict(session.get('direct_uploads') or {})
+                started_at = started.pop(str(data.get('upload_token')), None)
+                if started_at is not None:
+                    session['direct_uploads'] = started
+                    transfer.upload_seconds = time.time() - started_at
+            metrics.incr('upload.direct.completed')
+            metrics.incr('upload.direct.bytes', file.size)
+            return jsonify({
+                "success": True,
+                "message": f"File {file.name} uploaded successfully",
+                "file_id": file.id
+            })
+        except Exception as e:
+            logger.error(f"Error completing direct upload: {str(e)}")
+            return jsonify({"error": str(e)}), 500
+    
+    @app.route('/upload/chunked', methods=['POST'])
+    def start_chunked_upload():
+        """Start a chunked upload to this server.
+        
+        The client then PUTs numbered chunks to /upload/chunked/<id>/<index>
+        (several at a time, each retried on its own) and POSTs .../finalize.
+        Those requests may reach any instance (see ChunkedUploadStore). The
+        Drive upload starts right away and consumes chunks as soon as they
+        are contiguous; an archive to expand is imported once it is complete.
+        """
+        if not has_drive_access():
+            return jsonify({"error": "Not authenticated"}), 401
+        data = request.get_json(silent=True) or {}
+        filename = secure_filename(data.get('name') or '')
+        size = data.get('size')
+        if not filename:
+            return jsonify({"error": "No file selected"}), 400
+        if not isinstance(size, int) or size < 0:
+            return jsonify({"error": "Invalid file size"}), 400
+        if size > app.config['CHUNKED_UPLOAD_MAX_SIZE']:
+            return jsonify({"error": "File is too large"}), 413
+        
+        try:
+            drive_service = get_drive_service()
+            expand_archive = bool(data.get('expand_archive')) and archive_format(filename) is not None
+            upload = chunked_uploads.create(
+                listing_user_key(), filename, data.get('mime_type'), size,
+                app.config['CHUNKED_UPLOAD_CHUNK_SIZE'], expand_archive
             )
+            owner = transfer_owner()
+            
+            def consume(fh):
+                # Runs on the upload's own thread, outside this request
+                with transfer_history.track('file', None, *owner) as transfer:
+                    if expand_archive:
+                        with transfer_phase('download'):
+                            upload.wait_until_available(size)
+                        with open(upload.path, 'rb') as archive, transfer_phase('upload'):
+                            result = ArchiveImporter(drive_service).import_archive(archive, filename)
+                        transfer.bytes = size
+                        return archive_summary(filename, result)
+                    mime_type = mime_registry.detect(filename, fh.read(SNIFF_BYTES), upload.mime_type)
+                    fh.seek(0)
+                    file_id = drive_service.upload_stream(fh, filename, mime_type, size)
+                    transfer.file_id = file_id
+                return {
+                    "success": True,
+                    "message": f"File {filename} uploaded successfully",
+                    "file_id": file_id
+                }
+            chunked_uploads.start(upload, consume)
+            
+            return jsonify(dict(
+                upload.to_dict(),
+                url=url_for('chunked_upload_status', upload_id=upload.id),
+                parallel=app.config['CHUNKED_UPLOAD_PARALLEL'],
+                max_retries=app.config['CHUNKED_UPLOAD_MAX_RETRIES']
+            )), 201
+        except ScratchSpaceExhausted as e:
+            return jsonify({"error": str(e)}), 507
+        except Exception as e:
+            logger.error(f"Error starting chunked upload: {str(e)}")
+            return jsonify({"error": str(e)}), 500
+    
+    def chunked_upload_gone(state):
+        """410 for an upload whose holding instance stopped; the client starts over."""
+        return jsonify({"error": state.error, "lost": True}), 410
+    
+    @app.route('/upload/chunked/<upload_id>', methods=['GET', 'DELETE'])
+    def chunked_upload_status(upload_id):
+        """Report which chunks of an upload are missing, or cancel it."""
+        if not has_drive_access():
+            return jsonify({"error": "Not authenticated"}), 401
+        state = chunked_uploads.get(upload_id, listing_user_key())
+        if state is None:
+            return jsonify({"error": "Upload not found"}), 404
+        if request.method == 'DELETE':
+            chunked_uploads.cancel(state)
+            return jsonify({"success": True})
+        return jsonify(chunked_uploads.describe(state))
+    
+    @app.route('/upload/chunked/<upload_id>/<int:index>', methods=['PUT'])
+    def upload_chunk(upload_id, index):
+        """Store one chunk; sending the same chunk again is harmless."""
+        if not has_drive_access():
+            return jsonify({"error": "Not authenticated"}), 401
+        state = chunked_uploads.get(upload_id, listing_user_key())
+        if state is None:
+            return jsonify({"error": "Upload not found"}), 404
+        if state.status == chunked_upload.LOST:
+            return chunked_upload_gone(state)
+        
+        try:
+            chunked_uploads.write_chunk(state, index, request.stream)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except UploadAborted as e:
+            return jsonify({"error": str(e)}), 409
+        progress = chunked_uploads.describe(state)
+        return jsonify({
+            "received": progress['received'],
+            "total_chunks": progress['total_chunks'],
+            "contiguous_bytes": progress['contiguous_bytes']
+        })
+    
+    @app.route('/upload/chunked/<upload_id>/finalize', methods=['POST'])
+    def finalize_chunked_upload(upload_id):
+        """Report the outcome of an upload once every chunk has arrived.
+        
+        Waits at most CHUNKED_UPLOAD_FINALIZE_WAIT seconds for Drive to
+        receive the tail of the file (or for the archive to be expanded),
+        then answers 202; the client simply finalizes again.
+        """
+        if not has_drive_access():
+            return jsonify({"error": "Not authenticated"}), 401
+        state = chunked_uploads.get(upload_id, listing_user_key())
+        if state is None:
+            return jsonify({"error": "Upload not found"}), 404
+        if state.status == chunked_upload.RECEIVING:
+            missing = chunked_uploads.describe(state)['missing']
+            if missing:
+                return jsonify({"error": f"{len(missing)} chunk(s) missing", "missing": missing}), 409
+            state = chunked_uploads.wait(state, app.config['CHUNKED_UPLOAD_FINALIZE_WAIT'])
+        
+        if state.status == chunked_upload.RECEIVING:
+            return jsonify({"pending": True}), 202
+        if state.status == chunked_upload.SUCCEEDED:
+            return jsonify(json.loads(state.result))
+        if state.status == chunked_upload.LOST:
+            return chunked_upload_gone(state)
+        if state.status == chunked_upload.CANCELLED:
+            return jsonify({"error": state.error}), 409
+        return jsonify({"error": state.error}), 500
+    
+    @app.route('/upload/url', methods=['POST'])
+    def upload_from_url():
+        """Handle upload from a direct URL."""
+        drive_service = get_drive_service()
         
         try:
             url = request.form.get('url')
             if not url:
                 return jsonify({"error": "No URL provided"}), 400
             
-            # Download from URL and upload to Drive
-            file_id = drive_service.upload_from_url(url)
+            if app.config['TRANSFER_QUEUE_ENABLED']:
+                return enqueue_transfer('url', {
+                    'url': url, 'expand_archive': wants_archive_expansion()
+                })
             
-            return jsonify({
-                "success": True,
-                "message": "File uploaded from URL successfully",
-                "file_id": file_id
-            })
+            return jsonify(import_url(drive_service, url, wants_archive_expansion()))
         except Exception as e:
             logger.error(f"Error uploading from URL: {str(e)}")
             return jsonify({"error": str(e)}), 500
     
+    @app.route('/upload/bulk', methods=['POST'])
+    def upload_bulk():
+        """Handle a batch of URLs pasted or uploaded as a .txt/CSV list.
+        
+        A batch can take far longer than a request may, so it always runs as
+        a background job whose status the client polls.
+        """
+        if not has_drive_access():
+            return jsonify({"error": "Not authenticated"}), 401
+        
+        try:
+            text = request.form.get('urls', '')
+            url_file = request.files.get('url_file')
+            if url_file and url_file.filename:
+                text += '\n' + url_file.read().decode('utf-8-sig', errors='replace')
+            
+            urls = parse_url_list(text)
+            if not urls:
+                return jsonify({"error": "No URLs provided"}), 400
+            if len(urls) > app.config['BULK_IMPORT_MAX_URLS']:
+                return jsonify({
+                    "error": f"Too many URLs: at most {app.config['BULK_IMPORT_MAX_URLS']} per batch"
+                }), 400
+            
+            return enqueue_transfer('bulk_url', {'urls': urls})
+        except Exception as e:
+            logger.error(f"Error importing URL list: {str(e)}")
+            return jsonify({"error": str(e)}), 500
+    
     @app.route('/upload/youtube', methods=['POST'])
     def upload_from_youtube():
         """Handle upload from a YouTube URL."""
-        global drive_service, youtube_service
-        
-        # Try to use OAuth if user is logged in
-        if current_user.is_authenticated and current_user.google_access_token:
-            drive_service = DriveService(
-                user_credentials={
-                    'token': current_user.google_access_token,
-                    'refresh_token': current_user.google_refresh_token
-                }
-            )
-        elif not drive_service:
-            drive_service = DriveService(
-                session.get('api_key'),
-                session.get('client_id'),
-                session.get('client_secret')
-            )
-        
-        if not youtube_service:
-            youtube_service = YouTubeService()
+        drive_service = get_drive_service()
         
         try:
             youtube_url = request.form.get('youtube_url')
             if not youtube_url:
                 return jsonify({"error": "No YouTube URL provided"}), 400
             
-            # Download YouTube video and upload to Drive
-            file_id = utils.upload_from_youtube(youtube_url, drive_service, youtube_service)
+            # Playlist and channel URLs import every video; a video URL that
+            # also names a playlist does so only if asked to
+            playlist = get_youtube_service().is_playlist_url(
+                youtube_url, include_video_lists=form_flag('import_playlist')
+            )
+            own_folder = form_flag('playlist_folder', default=True)
+            options = youtube_options()
             
-            return jsonify({
-                "success": True,
-                "message": "YouTube video uploaded successfully",
-                "file_id": file_id
-            })
+            if app.config['TRANSFER_QUEUE_ENABLED']:
+                return enqueue_transfer('youtube', {
+                    'youtube_url': youtube_url, 'playlist': playlist, 'own_folder': own_folder,
+                    'options': options
+                })
+            
+            # Download YouTube video(s) and upload to Drive
+            return jsonify(import_youtube(drive_service, youtube_url, playlist, own_folder, options))
         except Exception as e:
             logger.error(f"Error uploading from YouTube: {str(e)}")
             return jsonify({"error": str(e)}), 500
     
+    @app.route('/api/youtube/info', methods=['POST'])
+    def youtube_info():
+        """Describe the format and expected size a YouTube import would download."""
+        youtube_url = request.form.get('youtube_url')
+        if not youtube_url:
+            return jsonify({"error": "No YouTube URL provided"}), 400
+        try:
+            return jsonify(get_youtube_service().probe(youtube_url, youtube_options()))
+        except Exception as e:
+            logger.error(f"Error probing YouTube video: {str(e)}")
+            return jsonify({"error": str(e)}), 500
+    
     @app.route('/file/delete/<file_id>', methods=['POST'])
     def delete_file(file_id):
         """Delete a file from Google Drive."""
-        global drive_service
-        
-        # Try to use OAuth if user is logged in
-        if current_user.is_authenticated and current_user.google_access_token:
-            drive_service = DriveService(
-                user_credentials={
-                    'token': current_user.google_access_token,
-                    'refresh_token': current_user.google_refresh_token
-                }
-            )
-        elif not drive_service:
-            drive_service = DriveService(
-                session.get('api_key'),
-                session.get('client_id'),
-                session.get('client_secret')
-            )
+        drive_service = get_drive_service()
         
         try:
             drive_service.delete_file(file_id)
@@ -312,6 +909,157 @@ def create_app(config_class=None):
         
         return redirect(url_for('files'))
     
+    @app.route('/file/download/<file_id>')
+    def download_file(file_id):
+        """Stream a file's content from Google Drive.
+        
+        The media is relayed chunk by chunk, never buffered, and Range requests
+        are forwarded to Drive so video seeking and download managers get 206
+        responses. `?inline=1` asks the browser to display the file instead of
+        saving it.
+        """
+        if not has_drive_access():
+            flash('Please set up your Google Drive API credentials or login with Google.', 'warning')
+            return redirect(url_for('setup'))
+        
+        try:
+            result = get_drive_service().open_download(file_id, request.headers.get('Range'))
+        except Exception as e:
+            logger.error(f"Error downloading file: {str(e)}")
+            flash(f'Error downloading file: {str(e)}', 'danger')
+            return redirect(url_for('files'))
+        
+        headers = {'Accept-Ranges': 'bytes'}
+        if result['content_length'] is not None:
+            headers['Content-Length'] = str(result['content_length'])
+        if result['content_range']:
+            headers['Content-Range'] = result['content_range']
+        if result['status'] != 416:
+            disposition = 'inline' if request.args.get('inline') else 'attachment'
+            name = result['name'] or file_id
+            fallback = secure_filename(name) or 'download'
+            # Plain name for old clients, RFC 5987 form for non-ASCII names
+            headers['Content-Disposition'] = (
+                f"{disposition}; filename=\"{fallback}\"; filename*=UTF-8''{quote(name, safe='')}"
+            )
+        response = Response(stream_with_context(result['chunks']), status=result['status'],
+                            mimetype=result['mime_type'], headers=headers, direct_passthrough=True)
+        response.cache_control.private = True
+        return response
+    
+    @app.route('/thumbnail/<file_id>')
+    def thumbnail(file_id):
+        """Serve a file's Drive thumbnail through the local disk cache.
+        
+        The `v` query argument (the file's modifiedTime) versions the URL, so
+        browsers may keep the image for THUMBNAIL_BROWSER_MAX_AGE and only
+        revalidate with If-None-Match, which is answered without touching
+        the cache or Drive. Cache entries and ETags are per user, so a cached
+        thumbnail is only served to someone who could fetch it from Drive.
+        """
+        if not has_drive_access():
+            return Response(status=401)
+        
+        version = request.args.get('v', '')
+        size = min(max(request.args.get('s', app.config['THUMBNAIL_SIZE'], type=int), 32), 1600)
+        key = f"{listing_user_key()}:{file_id}:{version}:{size}"
+        etag = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        
+        def cache_headers(response):
+            response.set_etag(etag)
+            response.cache_control.private = True
+            response.cache_control.max_age = app.config['THUMBNAIL_BROWSER_MAX_AGE'] if version else 300
+            return response
+        
+        if etag in request.if_none_match:
+            return cache_headers(Response(status=304))
+        
+        try:
+            entry = thumbnail_cache.get(key)
+            if entry is None or time.time() - entry['fetched_at'] > app.config['THUMBNAIL_CACHE_TTL']:
+                result = get_drive_service().fetch_thumbnail(
+                    file_id,
+                    size,
+                    etag=entry and entry.get('etag'),
+                    last_modified=entry and entry.get('last_modified')
+                )
+                if result is None:
+                    return Response(status=404)
+                if result['status'] == 304 and entry is not None:
+                    entry = thumbnail_cache.refresh(key) or entry
+                else:
+                    entry = thumbnail_cache.put(
+                        key,
+                        result['content'],
+                        content_type=result['content_type'],
+                        etag=result['etag'],
+                        last_modified=result['last_modified']
+                    )
+            
+            with open(entry['path'], 'rb') as f:
+                content = f.read()
+            return cache_headers(Response(content, mimetype=entry['content_type']))
+        except Exception as e:
+            logger.error(f"Error serving thumbnail: {str(e)}")
+            return Response(status=502)
+    
+    @app.route('/api/jobs/<int:job_id>')
+    def job_status(job_id):
+        """Report the state of a queued transfer to its owner."""
+        job = transfer_queue.get(job_id)
+        if job is None or job.owner_key != listing_user_key():
+            return jsonify({"error": "Job not found"}), 404
+        if (not app.config['TRANSFER_QUEUE_ENABLED'] and job.status == JOB_RUNNING
+                and job.lease_expires_at and job.lease_expires_at < datetime.utcnow()):
+            # No workers reclaim leases here; fail the job its instance left behind
+            local_transfers.queue.reclaim_expired()
+            db.session.refresh(job)
+        return jsonify(job.to_dict())
+    
+    @app.route('/api/transfers/stats')
+    def transfer_stats():
+        """Throughput of the caller's recent transfers per source host or per hour.
+        
+        Query arguments: `by` ('host' or 'hour') and `hours` (how far back).
+        """
+        if not (current_user.is_authenticated and current_user.google_access_token):
+            if not session.get('api_key'):
+                return jsonify({"error": "Not authenticated"}), 401
+        
+        group_by = request.args.get('by', 'host')
+        if group_by not in ('host', 'hour'):
+            return jsonify({"error": "by must be 'host' or 'hour'"}), 400
+        hours = min(max(request.args.get('hours', 24, type=int), 1),
+                    app.config['TRANSFER_STATS_MAX_HOURS'])
+        
+        try:
+            stats = throughput_stats(group_by, hours, owner_key=listing_user_key())
+        except Exception as e:
+            logger.error(f"Error aggregating transfer history: {str(e)}")
+            return jsonify({"error": str(e)}), 500
+        return jsonify({"by": group_by, "hours": hours, "stats": stats})
+    
+    @app.cli.command('transfer-stats')
+    @click.option('--by', 'group_by', type=click.Choice(['host', 'hour']), default='host')
+    @click.option('--hours', type=int, default=24, help='How far back to look')
+    def transfer_stats_command(group_by, hours):
+        """Print throughput of all users' transfers per source host or per hour."""
+        stats = throughput_stats(group_by, hours)
+        print(f"{group_by:<32} {'transfers':>9} {'failed':>6} {'retries':>7} {'MB':>10} "
+              f"{'down MB/s':>9} {'up MB/s':>8}")
+        for row in stats:
+            label = row[group_by] or '(browser upload)'
+            down, up = (f"{row[k]:.2f}" if row[k] is not None else '-'
+                        for k in ('download_mb_s', 'upload_mb_s'))
+            print(f"{label:<32} {row['transfers']:>9} {row['failed']:>6} {row['retries']:>7} "
+                  f"{row['bytes'] / (1024 * 1024):>10.1f} {down:>9} {up:>8}")
+    
+    @app.route('/metrics')
+    def metrics_view():
+        """Expose this worker's in-process metrics as JSON."""
+        from metrics import metrics
+        return jsonify(metrics.snapshot())
+    
     @app.errorhandler(404)
     def page_not_found(e):
         """Handle 404 errors."""
@@ -0,0 +1,345 @@
+import io
+import posixpath
+import logging
+import tarfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from mime_detection import registry, SNIFF_BYTES
+
+logger = logging.getLogger(__name__)
+
+TAR_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+# Metadata folders added by archivers that users never want in Drive
+IGNORED_PREFIXES = ('__MACOSX/',)
+
+
+def archive_format(filename):
+    """Return the archive format for a filename.
+
+    Args:
+        filename (str): Name of the archive
+
+    Returns:
+        str: 'zip', 'tar' or None if the file cannot be expanded
+    """
+    lower = (filename or '').lower()
+    if lower.endswith('.zip'):
+        return 'zip'
+    if lower.endswith(TAR_SUFFIXES):
+        return 'tar'
+    return None
+
+
+def archive_stem(filename):
+    """Return the archive name without its archive extension(s)."""
+    lower = filename.lower()
+    for suffix in ('.zip',) + TAR_SUFFIXES:
+        if lower.endswith(suffix):
+            return filename[:-len(suffix)] or filename
+    return filename
+
+
+def _clean_path(name):
+    """Normalise an entry path, dropping absolute and parent components.
+
+    Args:
+        name (str): Path as stored in the archive
+
+    Returns:
+        str: Safe relative path with '/' separators ('' if nothing is left)
+    """
+    parts = [p for p in name.replace('\\', '/').split('/') if p not in ('', '.', '..')]
+    return '/'.join(parts)
+
+
+class _EntryStream(io.RawIOBase):
+    """Seekable view of an archive member with a known size.
+
+    MediaIoBaseUpload seeks to the end to learn the size and back to the start
+    before reading; on a compressed member that would decompress it twice.
+    Seeks here only move a logical position, and the underlying member is only
+    sought when a read really needs a different offset (a retried chunk). The
+    first bytes are kept once peeked, so sniffing the content type does not
+    need a backward seek on a forward-only tar stream.
+    """
+
+    def __init__(self, raw, size):
+        self._raw = raw
+        self._size = size
+        self._pos = 0
+        self._raw_pos = 0
+        self._head = None
+
+    def head(self):
+        """Return the first SNIFF_BYTES of the member without moving the position."""
+        if self._head is None:
+            if self._raw_pos != 0:
+                self._raw.seek(0)
+            self._head = self._raw.read(min(SNIFF_BYTES, self._size))
+            self._raw_pos = len(self._head)
+        return self._head
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        else:
+            self._pos = self._size + offset
+        return self._pos
+
+    def read(self, size=-1):
+        if self._pos >= self._size:
+            return b''
+        if size is None or size < 0:
+            size = self._size - self._pos
+        size = min(size, self._size - self._pos)
+        prefix = b''
+        if self._head is not None and self._pos < len(self._head):
+            prefix = self._head[self._pos:self._pos + size]
+            self._pos += len(prefix)
+            size -= len(prefix)
+            if not size:
+                return prefix
+        if self._pos != self._raw_pos:
+            self._raw.seek(self._pos)
+            self._raw_pos = self._pos
+        data = self._raw.read(size)
+        self._pos += len(data)
+        self._raw_pos = self._pos
+        return prefix + data
+
+
+class _FolderCache:
+    """Creates each Drive folder of the mirrored tree exactly once."""
+
+    def __init__(self, drive_service, root_id):
+        self.drive_service = drive_service
+        self._ids = {'': root_id}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def ensure(self, path):
+        """Return the Drive folder ID for a directory path, creating it if needed.
+
+        Args:
+            path (str): Clean relative directory path ('' for the root)
+
+        Returns:
+            str: Drive folder ID
+        """
+        folder_id = self._ids.get(path)
+        if folder_id:
+            return folder_id
+
+        parent_id = self.ensure(posixpath.dirname(path))
+        with self._lock:
+            path_lock = self._locks.setdefault(path, threading.Lock())
+        with path_lock:
+            folder_id = self._ids.get(path)
+            if not folder_id:
+                folder_id = self.drive_service.create_folder(posixpath.basename(path), parent_id)
+                self._ids[path] = folder_id
+        return folder_id
+
+    @property
+    def created(self):
+        return len(self._ids) - 1
+
+
+class ArchiveImporter:
+    """Expands zip/tar archives into a Drive folder tree.
+
+    Entries are streamed out of the archive (nothing is extracted to disk) and
+    uploaded concurrently by a bounded thread pool. Zip members are read
+    directly by the workers; tar archives can only be read front to back, so
+    tar members up to ARCHIVE_BUFFER_BYTES are buffered in memory (bounded by
+    the same budget in total) and bigger members are uploaded inline.
+    """
+
+    def __init__(self, drive_service, max_workers=None):
+        """Initialize the importer.
+
+        Args:
+            drive_service (DriveService): Drive service used for folders and uploads
+            max_workers (int, optional): Concurrent uploads (defaults to ARCHIVE_IMPORT_WORKERS)
+        """
+        self.drive_service = drive_service
+        self.max_workers = max_workers or Config.ARCHIVE_IMPORT_WORKERS
+        self.buffer_budget = Config.ARCHIVE_BUFFER_BYTES
+        self.max_entries = Config.ARCHIVE_MAX_ENTRIES
+        self._buffered = 0
+        self._buffer_cond = threading.Condition()
+
+    def import_archive(self, fh, archive_name, parent_id=None):
+        """Expand an archive into a new Drive folder named after it.
+
+        Args:
+            fh (io.Base): Archive stream (must be seekable for zip files)
+            archive_name (str): Archive filename, used to detect the format
+            parent_id (str, optional): Folder to create the tree in
+
+        Returns:
+            dict: folder_id, folders_created, uploaded, failed, per-entry results
+                and error (why expansion stopped early, or None)
+
+        Raises:
+            Exception: If the archive can't be expanded at all; the new folder
+                is deleted again in that case
+        """
+        fmt = archive_format(archive_name)
+        if fmt is None:
+            raise Exception(f"Unsupported archive format: {archive_name}")
+
+        root_id = self.drive_service.create_folder(archive_stem(archive_name), parent_id)
+        folders = _FolderCache(self.drive_service, root_id)
+        futures = []
+        error = None
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            try:
+                if fmt == 'zip':
+                    self._expand_zip(fh, folders, pool, futures)
+                else:
+                    self._expand_tar(fh, folders, pool, futures)
+            except Exception as e:
+                # A corrupt archive or an exceeded limit stops the expansion;
+                # whatever was already submitted still finishes
+                logger.error(f"Error expanding archive {archive_name}: {str(e)}")
+                error = str(e)
+            results = [r for r in (future.result() for future in futures) if r is not None]
+
+        failed = sum(1 for r in results if not r['success'])
+        if error is not None and failed == len(results):
+            # Nothing made it into Drive: don't leave an orphan folder behind
+            self._discard(root_id)
+            raise Exception(f"Failed to expand archive {archive_name}: {error}")
+        return {
+            'folder_id': root_id,
+            'folders_created': folders.created + 1,
+            'uploaded': len(results) - failed,
+            'failed': failed,
+            'results': results,
+            'error': error,
+        }
+
+    def _discard(self, folder_id):
+        try:
+            self.drive_service.delete_file(folder_id)
+        except Exception as e:
+            logger.error(f"Error removing folder of failed archive: {str(e)}")
+
+    def _entries_allowed(self, count):
+        if count > self.max_entries:
+            raise Exception(f"Archive has more than {self.max_entries} entries")
+
+    def _upload_entry(self, folders, path, size, stream, head):
+        """Upload one member; failures are reported, not raised."""
+        try:
+            parent_id = folders.ensure(posixpath.dirname(path))
+            name = posixpath.basename(path)
+            file_id = self.drive_service.upload_stream(
+                stream, name, registry.detect(name, head), size, parent_id
+            )
+            return {'path': path, 'size': size, 'success': True, 'file_id': file_id}
+        except Exception as e:
+            logger.error(f"Error importing archive entry {path}: {str(e)}")
+            return {'path': path, 'size': size, 'success': False, 'error': str(e)}
+
+    def _ensure_folder(self, folders, path):
+        """Create a directory member's folder; failures are reported, not raised."""
+        try:
+            folders.ensure(path)
+            return None
+        except Exception as e:
+            logger.error(f"Error creating archive folder {path}: {str(e)}")
+            return {'path': path + '/', 'size': 0, 'success': False, 'error': str(e)}
+
+    def _expand_zip(self, fh, folders, pool, futures):
+        archive = zipfile.ZipFile(fh)
+        infos = archive.infolist()
+        self._entries_allowed(len(infos))
+
+        def upload(info, path):
+            with archive.open(info) as member:
+                stream = _EntryStream(member, info.file_size)
+                return self._upload_entry(folders, path, info.file_size, stream, stream.head())
+
+        for info in infos:
+            path = _clean_path(info.filename)
+            if not path or info.filename.startswith(IGNORED_PREFIXES):
+                continue
+            if info.is_dir():
+                futures.append(pool.submit(self._ensure_folder, folders, path))
+                continue
+            futures.append(pool.submit(upload, info, path))
+
+    def _expand_tar(self, fh, folders, pool, futures):
+        entries = 0
+        with tarfile.open(fileobj=fh, mode='r|*') as archive:
+            for member in archive:
+                entries += 1
+                self._entries_allowed(entries)
+                path = _clean_path(member.name)
+                if not path or member.name.startswith(IGNORED_PREFIXES):
+                    continue
+                if member.isdir():
+                    futures.append(pool.submit(self._ensure_folder, folders, path))
+                    continue
+                if not member.isfile():
+                    # Links, devices and fifos have no content to upload
+                    continue
+
+                stream = archive.extractfile(member)
+                if member.size > self.buffer_budget:
+                    # Too big to buffer: upload straight from the archive stream
+                    # before moving on to the next member.
+                    stream = _EntryStream(stream, member.size)
+                    futures.append(_Done(self._upload_entry(
+                        folders, path, member.size, stream, stream.head()
+                    )))
+                    continue
+
+                self._reserve(member.size)
+                data = stream.read()
+                futures.append(pool.submit(self._upload_buffered, folders, path, data))
+
+    def _upload_buffered(self, folders, path, data):
+        try:
+            return self._upload_entry(folders, path, len(data), io.BytesIO(data),
+                                      data[:SNIFF_BYTES])
+        finally:
+            self._release(len(data))
+
+    def _reserve(self, size):
+        """Block until `size` more bytes fit in the in-memory buffer budget."""
+        with self._buffer_cond:
+            while self._buffered and self._buffered + size > self.buffer_budget:
+                self._buffer_cond.wait()
+            self._buffered += size
+
+    def _release(self, size):
+        with self._buffer_cond:
+            self._buffered -= size
+            self._buffer_cond.notify_all()
+
+
+class _Done:
+    """Already-completed stand-in for a Future."""
+
+    def __init__(self, value):
+        self._value = value
+
+    def result(self):
+        return self._value
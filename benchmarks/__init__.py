@@ -0,0 +1,12 @@
+"""Offline benchmark suite for the Drive upload pipeline.
+
+The suite runs the real ``DriveService`` / ``utils`` code paths against local
+stand-ins for the Google Drive v3 API (``fake_drive``) and for arbitrary
+origin web servers (``fake_origin``), so results are reproducible without
+network access or Google credentials.
+
+Run ``python -m benchmarks.run --help`` for the available cases and
+``python -m benchmarks.compare old.json new.json`` to diff two runs.
+``python -m benchmarks.loadtest`` drives the whole Flask app with a mixed
+workload and reports per-route latency, error rates and thread saturation.
+"""
@@ -0,0 +1,70 @@
+"""Compare two benchmark result files.
+
+    python -m benchmarks.compare baseline.json candidate.json [--threshold 10]
+
+Prints per-combination changes in throughput, p50/p95 latency and peak RSS,
+and exits non-zero when any throughput drops (or p95 grows) by more than
+``--threshold`` percent.
+"""
+import argparse
+import json
+import sys
+
+
+def _key(result):
+    params = result.get('params', {})
+    return (result['case'], str(params.get('size', params.get('files', ''))),
+            result['concurrency'])
+
+
+def _change(old, new):
+    if not old:
+        return None
+    return (new - old) / old * 100.0
+
+
+def _fmt(pct):
+    return '     n/a' if pct is None else f'{pct:+7.1f}%'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare two benchmark runs.')
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='regression threshold in percent')
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = {_key(r): r for r in json.load(f)['results']}
+    with open(args.candidate) as f:
+        candidate = {_key(r): r for r in json.load(f)['results']}
+
+    regressions = []
+    print(f"{'case':<16} {'size':>10} {'conc':>4} {'MB/s':>8} {'op/s':>8} "
+          f"{'p50':>8} {'p95':>8} {'rss':>8}")
+    for key in sorted(set(baseline) & set(candidate)):
+        old, new = baseline[key], candidate[key]
+        tput = _change(old['throughput_mb_s'], new['throughput_mb_s'])
+        rate = _change(old['ops_per_s'], new['ops_per_s'])
+        p50 = _change(old['latency_ms']['p50'], new['latency_ms']['p50'])
+        p95 = _change(old['latency_ms']['p95'], new['latency_ms']['p95'])
+        rss = _change(old['rss_peak_mb'], new['rss_peak_mb'])
+        print(f'{key[0]:<16} {key[1]:>10} {key[2]:>4} {_fmt(tput)} {_fmt(rate)} '
+              f'{_fmt(p50)} {_fmt(p95)} {_fmt(rss)}')
+        if (rate is not None and rate < -args.threshold) or \
+                (p95 is not None and p95 > args.threshold):
+            regressions.append(key)
+
+    for key in sorted(set(baseline) ^ set(candidate)):
+        side = 'baseline' if key in baseline else 'candidate'
+        print(f'{key[0]:<16} {key[1]:>10} {key[2]:>4}  only in {side}')
+
+    if regressions:
+        print(f'\n{len(regressions)} regression(s) beyond {args.threshold}%')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,504 @@
+"""Local stand-in for the subset of the Google Drive v3 REST API used by the app.
+
+Supports:
+    * ``files.list`` with ``pageSize`` / ``pageToken`` paging and a small
+      subset of the ``q`` query language
+    * ``files.get`` (metadata) and ``files.create`` (metadata only)
+    * ``files.get?alt=media`` downloads with single ``Range`` support
+    * media uploads: ``uploadType=media``, ``multipart`` and the resumable
+      protocol (session POST, chunked ``PUT`` with ``Content-Range``, 308
+      status replies)
+    * ``files.delete``
+    * ``changes.getStartPageToken`` (advances on every create/delete)
+    * batch requests (``multipart/mixed`` to ``/batch/drive/v3``)
+    * ``thumbnailLink`` for image files, served from ``/thumbnails/<id>=s<N>``
+      with ``ETag`` / ``If-None-Match`` support
+
+``latency`` delays every request (simulated RTT) and ``chunk_failure_rate``
+makes that fraction of resumable chunk PUTs fail with 503.
+
+Point ``DriveService`` at it by exporting ``GOOGLE_DRIVE_ROOT_URL`` set to
+``FakeDriveServer.root_url``.
+"""
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+
+
+def _now():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')[:-4] + 'Z'
+
+
+def _error(status, message, reason='invalid'):
+    body = {'error': {'code': status, 'message': message,
+                      'errors': [{'message': message, 'domain': 'global', 'reason': reason}]}}
+    return status, {'Content-Type': 'application/json; charset=UTF-8'}, json.dumps(body).encode()
+
+
+def _json(status, payload, headers=None):
+    out = {'Content-Type': 'application/json; charset=UTF-8'}
+    out.update(headers or {})
+    return status, out, json.dumps(payload).encode()
+
+
+_PATTERN = bytes(range(256)) * 4096
+
+
+def _pattern(start, stop, chunk_size=1024 * 1024):
+    """Yield the synthetic content bytes ``[start, stop)`` in chunks."""
+    while start < stop:
+        offset = start % 256
+        piece = _PATTERN[offset:offset + min(chunk_size, stop - start)]
+        yield piece
+        start += len(piece)
+
+
+def _split_headers(raw):
+    """Split a raw header block + body on the first blank line."""
+    for sep in (b'\r\n\r\n', b'\n\n'):
+        idx = raw.find(sep)
+        if idx != -1:
+            head, body = raw[:idx], raw[idx + len(sep):]
+            break
+    else:
+        head, body = raw, b''
+    headers = {}
+    for line in head.decode('latin-1').splitlines():
+        if ':' in line:
+            key, value = line.split(':', 1)
+            headers[key.strip().lower()] = value.strip()
+    return headers, body
+
+
+def _split_multipart(body, content_type):
+    """Split a multipart body into ``(headers, payload)`` tuples."""
+    match = re.search(r'boundary="?([^";]+)"?', content_type)
+    if not match:
+        return []
+    delimiter = b'--' + match.group(1).encode()
+    parts = []
+    for chunk in body.split(delimiter)[1:]:
+        if chunk.startswith(b'--'):
+            break
+        # Each part starts with the line break after the delimiter and ends
+        # with the line break that precedes the next one.
+        if chunk.startswith(b'\r\n'):
+            chunk = chunk[2:]
+        elif chunk.startswith(b'\n'):
+            chunk = chunk[1:]
+        if chunk.endswith(b'\r\n'):
+            chunk = chunk[:-2]
+        elif chunk.endswith(b'\n'):
+            chunk = chunk[:-1]
+        parts.append(_split_headers(chunk))
+    return parts
+
+
+class FakeDrive:
+    """In-memory Drive state plus a transport-independent request dispatcher."""
+
+    def __init__(self, root_url='', latency=0.0, store_content=False, max_page_size=1000,
+                 chunk_failure_rate=0.0, seed=0):
+        self.root_url = root_url
+        self.latency = latency
+        self.chunk_failure_rate = chunk_failure_rate
+        self._random = random.Random(seed)
+        self.store_content = store_content
+        self.max_page_size = max_page_size
+        self.files = {}
+        self.sessions = {}
+        self.stats = {}
+        self.bytes_received = 0
+        self.change_counter = 1
+        self._lock = threading.Lock()
+
+    # -- state helpers -------------------------------------------------
+
+    def _count(self, kind):
+        with self._lock:
+            self.stats[kind] = self.stats.get(kind, 0) + 1
+
+    def add_file(self, name, mime_type='application/octet-stream', content=b'', size=None,
+                 parents=None):
+        """Insert a file directly into the store and return its metadata."""
+        file_id = uuid.uuid4().hex[:28]
+        created = _now()
+        meta = {
+            'kind': 'drive#file',
+            'id': file_id,
+            'name': name,
+            'mimeType': mime_type,
+            'createdTime': created,
+            'modifiedTime': created,
+            'parents': parents or ['root'],
+            'webViewLink': f'{self.root_url}file/d/{file_id}/view',
+        }
+        if mime_type != FOLDER_MIME_TYPE:
+            meta['size'] = str(len(content) if size is None else size)
+        if mime_type.startswith('image/'):
+            meta['thumbnailLink'] = f'{self.root_url}thumbnails/{file_id}=s220'
+        with self._lock:
+            # Size-only files keep no content; their media is synthesised
+            stored = self.store_content and (content or size is None)
+            self.files[file_id] = {'meta': meta, 'content': bytes(content) if stored else None}
+            self.change_counter += 1
+        return meta
+
+    def seed(self, count, size=1024, mime_type='application/pdf', prefix='file'):
+        """Populate the store with ``count`` synthetic files."""
+        for i in range(count):
+            self.add_file(f'{prefix}-{i:06d}.bin', mime_type=mime_type, size=size)
+
+    def reset(self):
+        with self._lock:
+            self.files.clear()
+            self.sessions.clear()
+            self.stats.clear()
+            self.bytes_received = 0
+
+    # -- dispatch ------------------------------------------------------
+
+    def dispatch(self, method, target, headers, body):
+        """Handle one request and return ``(status, headers, body)``."""
+        parsed = urlparse(target)
+        path = parsed.path
+        query = {k: v[-1] for k, v in parse_qs(parsed.query, keep_blank_values=True).items()}
+
+        match = re.fullmatch(r'/thumbnails/([^/=]+)=s(\d+)', path)
+        if match:
+            return self._thumbnail(match.group(1), int(match.group(2)), headers)
+        if path == '/drive/v3/changes/startPageToken':
+            self._count('start_page_token')
+            return _json(200, {'kind': 'drive#startPageToken',
+                               'startPageToken': str(self.change_counter)})
+        if path.startswith('/batch/'):
+            return self._batch(headers, body)
+        if path == '/upload/drive/v3/files':
+            return self._upload(method, query, headers, body)
+        if path == '/drive/v3/files':
+            if method == 'GET':
+                return self._list(query)
+            if method == 'POST':
+                return self._create_metadata(body)
+        match = re.fullmatch(r'/drive/v3/files/([^/]+)/copy', path)
+        if match and method == 'POST':
+            return self._copy(match.group(1), body)
+        match = re.fullmatch(r'/drive/v3/files/([^/]+)', path)
+        if match:
+            file_id = match.group(1)
+            if method == 'GET':
+                if query.get('alt') == 'media':
+                    return self._media(file_id, headers)
+                return self._get(file_id)
+            if method == 'DELETE':
+                return self._delete(file_id)
+        return _error(404, f'No route for {method} {path}', 'notFound')
+
+    def _list(self, query):
+        self._count('list')
+        page_size = min(int(query.get('pageSize') or 100), self.max_page_size)
+        offset = int(query.get('pageToken') or 0)
+        with self._lock:
+            metas = [f['meta'] for f in self.files.values()]
+        metas = [m for m in metas if self._matches(m, query.get('q', ''))]
+        page = metas[offset:offset + page_size]
+        payload = {'kind': 'drive#fileList', 'files': page}
+        if offset + page_size < len(metas):
+            payload['nextPageToken'] = str(offset + page_size)
+        return _json(200, payload)
+
+    @staticmethod
+    def _matches(meta, q):
+        """Evaluate the handful of ``q`` clauses the app uses (joined by 'and')."""
+        for clause in filter(None, (c.strip() for c in re.split(r'\s+and\s+', q))):
+            m = re.fullmatch(r"'([^']*)'\s+in\s+parents", clause)
+            if m:
+                if m.group(1) not in meta.get('parents', []):
+                    return False
+                continue
+            m = re.fullmatch(r"(name|mimeType)\s*(=|!=)\s*'((?:[^'\\]|\\.)*)'", clause)
+            if m:
+                field, op, value = m.group(1), m.group(2), m.group(3).replace("\\'", "'")
+                if (meta.get(field) == value) != (op == '='):
+                    return False
+        return True
+
+    def _get(self, file_id):
+        self._count('get')
+        with self._lock:
+            entry = self.files.get(file_id)
+        if not entry:
+            return _error(404, f'File not found: {file_id}.', 'notFound')
+        return _json(200, entry['meta'])
+
+    def _media(self, file_id, headers):
+        """Serve file content, honouring a single ``Range: bytes=`` header.
+
+        Files stored without content get a synthetic body (byte ``i`` is
+        ``i % 256``) produced lazily, so multi-gigabyte downloads cost no memory.
+        """
+        self._count('media')
+        with self._lock:
+            entry = self.files.get(file_id)
+        if not entry:
+            return _error(404, f'File not found: {file_id}.', 'notFound')
+        content = entry['content']
+        size = len(content) if content is not None else int(entry['meta'].get('size', 0))
+        start, end, status = 0, size - 1, 200
+        match = re.fullmatch(r'bytes=(\d*)-(\d*)', headers.get('range', '').strip())
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2) or size - 1), size - 1)
+            else:
+                start = max(size - int(match.group(2)), 0)
+            if start >= size or start > end:
+                return 416, {'Content-Range': f'bytes */{size}'}, b''
+            status = 206
+        resp_headers = {'Content-Type': entry['meta']['mimeType'],
+                        'Content-Length': str(end - start + 1)}
+        if status == 206:
+            resp_headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+        if content is not None:
+            return status, resp_headers, content[start:end + 1]
+        return status, resp_headers, _pattern(start, end + 1)
+
+    def _copy(self, file_id, body):
+        """Copy a file; files with ``copyRequiresWriterPermission`` refuse like Drive does."""
+        self._count('copy')
+        with self._lock:
+            entry = self.files.get(file_id)
+        if not entry:
+            return _error(404, f'File not found: {file_id}.', 'notFound')
+        if entry['meta'].get('copyRequiresWriterPermission'):
+            return _error(403, 'The user does not have sufficient permissions for this file.',
+                          'cannotCopyFile')
+        overrides = json.loads(body or b'{}')
+        source = entry['meta']
+        copied = self.add_file(overrides.get('name', source['name']), source['mimeType'],
+                               content=entry['content'] or b'', size=int(source.get('size', 0)),
+                               parents=overrides.get('parents'))
+        return _json(200, copied)
+
+    def _thumbnail(self, file_id, size, headers):
+        self._count('thumbnail')
+        with self._lock:
+            entry = self.files.get(file_id)
+        if not entry or 'thumbnailLink' not in entry['meta']:
+            return 404, {'Content-Type': 'text/plain'}, b'not found'
+        etag = f'"{file_id}-{entry["meta"]["modifiedTime"]}-{size}"'
+        if headers.get('if-none-match') == etag:
+            return 304, {'ETag': etag}, b''
+        # A fake PNG whose size grows with the requested edge length
+        body = b'\x89PNG\r\n\x1a\n' + file_id.encode() * (size // 4)
+        return 200, {'Content-Type': 'image/png', 'ETag': etag}, body
+
+    def _delete(self, file_id):
+        self._count('delete')
+        with self._lock:
+            entry = self.files.pop(file_id, None)
+            if entry:
+                self.change_counter += 1
+        if not entry:
+            return _error(404, f'File not found: {file_id}.', 'notFound')
+        return 204, {}, b''
+
+    def _create_metadata(self, body):
+        self._count('create')
+        meta = json.loads(body or b'{}')
+        created = self.add_file(meta.get('name', 'Untitled'),
+                                meta.get('mimeType', 'application/octet-stream'),
+                                parents=meta.get('parents'))
+        return _json(200, created)
+
+    def _finish_upload(self, metadata, content, size, mime_type):
+        with self._lock:
+            self.bytes_received += size
+        meta = self.add_file(metadata.get('name', 'Untitled'),
+                             metadata.get('mimeType') or mime_type or 'application/octet-stream',
+                             content=content if self.store_content else b'',
+                             size=size, parents=metadata.get('parents'))
+        return _json(200, meta)
+
+    def _upload(self, method, query, headers, body):
+        upload_type = query.get('uploadType', 'media')
+        content_type = headers.get('content-type', 'application/octet-stream')
+
+        if upload_type == 'media':
+            self._count('upload_media')
+            return self._finish_upload({}, body, len(body), content_type)
+
+        if upload_type == 'multipart':
+            self._count('upload_multipart')
+            parts = _split_multipart(body, content_type)
+            if len(parts) != 2:
+                return _error(400, 'Malformed multipart body')
+            metadata = json.loads(parts[0][1] or b'{}')
+            media_headers, media = parts[1]
+            return self._finish_upload(metadata, media, len(media),
+                                       media_headers.get('content-type'))
+
+        if upload_type != 'resumable':
+            return _error(400, f'Unsupported uploadType {upload_type}')
+
+        if method == 'POST':
+            self._count('upload_session')
+            session_id = uuid.uuid4().hex
+            total = headers.get('x-upload-content-length')
+            with self._lock:
+                self.sessions[session_id] = {
+                    'metadata': json.loads(body or b'{}'),
+                    'mime_type': headers.get('x-upload-content-type'),
+                    'total': int(total) if total else None,
+                    'received': 0,
+                    'content': bytearray() if self.store_content else None,
+                }
+            location = (f'{self.root_url}upload/drive/v3/files'
+                        f'?uploadType=resumable&upload_id={session_id}')
+            return 200, {'Location': location, 'Content-Length': '0'}, b''
+
+        self._count('upload_chunk')
+        with self._lock:
+            session = self.sessions.get(query.get('upload_id', ''))
+        if session is None:
+            return _error(404, 'Upload session not found', 'notFound')
+
+        match = re.fullmatch(r'bytes (\*|(\d+)-(\d+))/(\*|\d+)',
+                             headers.get('content-range', 'bytes */*'))
+        if not match:
+            return _error(400, 'Invalid Content-Range')
+        if match.group(4) != '*':
+            session['total'] = int(match.group(4))
+        if match.group(1) != '*':
+            if self.chunk_failure_rate and self._random.random() < self.chunk_failure_rate:
+                self._count('upload_chunk_failed')
+                return _error(503, 'Injected chunk failure', 'backendError')
+            start = int(match.group(2))
+            if start != session['received']:
+                return self._resume_status(session)
+            session['received'] += len(body)
+            if session['content'] is not None:
+                session['content'].extend(body)
+
+        if session['total'] is not None and session['received'] >= session['total']:
+            with self._lock:
+                self.sessions.pop(query['upload_id'], None)
+            return self._finish_upload(session['metadata'], bytes(session['content'] or b''),
+                                       session['received'], session['mime_type'])
+        return self._resume_status(session)
+
+    @staticmethod
+    def _resume_status(session):
+        headers = {'Content-Length': '0'}
+        if session['received']:
+            headers['Range'] = f"bytes=0-{session['received'] - 1}"
+        return 308, headers, b''
+
+    def _batch(self, headers, body):
+        self._count('batch')
+        content_type = headers.get('content-type', '')
+        boundary = 'batch_' + uuid.uuid4().hex
+        out = []
+        for part_headers, payload in _split_multipart(body, content_type):
+            request_line, _, rest = payload.partition(b'\n')
+            method, target = request_line.decode('latin-1').split()[:2]
+            inner_headers, inner_body = _split_headers(rest)
+            status, resp_headers, resp_body = self.dispatch(
+                method, urlparse(target)._replace(scheme='', netloc='').geturl(),
+                inner_headers, inner_body)
+            lines = [f'HTTP/1.1 {status} {"OK" if status < 300 else "Error"}']
+            lines += [f'{k}: {v}' for k, v in resp_headers.items()]
+            lines.append(f'Content-Length: {len(resp_body)}')
+            content_id = part_headers.get('content-id', '').strip('<>')
+            out.append(
+                f'--{boundary}\r\nContent-Type: application/http\r\n'
+                f'Content-ID: <response-{content_id}>\r\n\r\n'.encode()
+                + '\r\n'.join(lines).encode() + b'\r\n\r\n' + resp_body + b'\r\n'
+            )
+        out.append(f'--{boundary}--\r\n'.encode())
+        return 200, {'Content-Type': f'multipart/mixed; boundary={boundary}'}, b''.join(out)
+
+
+class FakeDriveServer(FakeDrive):
+    """``FakeDrive`` served over HTTP on a background thread.
+
+    Usage::
+
+        with FakeDriveServer() as drive:
+            os.environ['GOOGLE_DRIVE_ROOT_URL'] = drive.root_url
+            ...
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, **kwargs):
+        super().__init__(**kwargs)
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self.root_url = f'http://{host}:{self._httpd.server_address[1]}/'
+        self._thread = None
+
+    def _handler_class(self):
+        drive = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _handle(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                if drive.latency:
+                    time.sleep(drive.latency)
+                headers = {k.lower(): v for k, v in self.headers.items()}
+                try:
+                    status, resp_headers, resp_body = drive.dispatch(
+                        self.command, self.path, headers, body)
+                except Exception as e:  # pragma: no cover - surfaced to the client
+                    status, resp_headers, resp_body = _error(500, str(e), 'backendError')
+                self.send_response(status)
+                streamed = not isinstance(resp_body, (bytes, bytearray))
+                for key, value in resp_headers.items():
+                    if streamed or key.lower() != 'content-length':
+                        self.send_header(key, value)
+                if not streamed:
+                    self.send_header('Content-Length', str(len(resp_body)))
+                self.end_headers()
+                if self.command == 'HEAD':
+                    return
+                if streamed:
+                    # Generated bodies carry their own Content-Length header
+                    try:
+                        for piece in resp_body:
+                            self.wfile.write(piece)
+                    except (BrokenPipeError, ConnectionResetError):
+                        self.close_connection = True
+                else:
+                    self.wfile.write(resp_body)
+
+            do_GET = do_POST = do_PUT = do_DELETE = do_PATCH = do_HEAD = _handle
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
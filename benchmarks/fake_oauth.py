@@ -0,0 +1,140 @@
+"""Local stand-in for Google's OpenID Connect provider, as used by ``google_auth``.
+
+Endpoints::
+
+    /.well-known/openid-configuration   discovery document pointing at the routes below
+    /authorize                          302 back to ``redirect_uri`` with a code for
+                                        ``login_hint`` (any address is accepted)
+    /token                              exchanges a code for access/refresh tokens
+    /userinfo                           profile of the bearer token's user
+
+Point the app at it by exporting ``GOOGLE_DISCOVERY_URL`` set to
+``FakeOAuthServer.discovery_url`` (and ``OAUTHLIB_INSECURE_TRANSPORT=1``, since
+it speaks plain HTTP).
+"""
+import hashlib
+import json
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, urlencode
+
+
+class FakeOAuthServer:
+    """Threaded OpenID Connect provider; use as a context manager."""
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self._codes = {}
+        self._tokens = {}
+        self._lock = threading.Lock()
+        self.stats = {}
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self.base_url = f'http://{host}:{self._httpd.server_address[1]}'
+        self.discovery_url = f'{self.base_url}/.well-known/openid-configuration'
+        self._thread = None
+
+    def _count(self, kind):
+        with self._lock:
+            self.stats[kind] = self.stats.get(kind, 0) + 1
+
+    def _issue_code(self, email):
+        code = uuid.uuid4().hex
+        with self._lock:
+            self._codes[code] = email
+        return code
+
+    def _exchange(self, code):
+        with self._lock:
+            email = self._codes.pop(code, None)
+            if email is None:
+                return None
+            token = f'fake-access-{uuid.uuid4().hex}'
+            self._tokens[token] = email
+        return {'access_token': token, 'refresh_token': f'fake-refresh-{email}',
+                'token_type': 'Bearer', 'expires_in': 3600}
+
+    def _userinfo(self, token):
+        with self._lock:
+            email = self._tokens.get(token)
+        if email is None:
+            return None
+        return {'sub': hashlib.sha1(email.encode()).hexdigest()[:21], 'email': email,
+                'email_verified': True, 'given_name': email.split('@')[0]}
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, payload=None, headers=None):
+                body = json.dumps(payload).encode() if payload is not None else b''
+                self.send_response(status)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                if payload is not None:
+                    self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                query = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+                if parsed.path == '/.well-known/openid-configuration':
+                    server._count('discovery')
+                    return self._send(200, {
+                        'issuer': server.base_url,
+                        'authorization_endpoint': f'{server.base_url}/authorize',
+                        'token_endpoint': f'{server.base_url}/token',
+                        'userinfo_endpoint': f'{server.base_url}/userinfo',
+                    })
+                if parsed.path == '/authorize':
+                    server._count('authorize')
+                    code = server._issue_code(query.get('login_hint') or 'user@example.com')
+                    params = {'code': code}
+                    if 'state' in query:
+                        params['state'] = query['state']
+                    return self._send(302, headers={
+                        'Location': f"{query['redirect_uri']}?{urlencode(params)}"})
+                if parsed.path == '/userinfo':
+                    server._count('userinfo')
+                    token = self.headers.get('Authorization', '').replace('Bearer ', '', 1)
+                    info = server._userinfo(token)
+                    if info is None:
+                        return self._send(401, {'error': 'invalid_token'})
+                    return self._send(200, info)
+                self._send(404, {'error': 'not_found'})
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                form = {k: v[-1] for k, v in
+                        parse_qs(self.rfile.read(length).decode()).items()}
+                if urlparse(self.path).path == '/token':
+                    server._count('token')
+                    tokens = server._exchange(form.get('code', ''))
+                    if tokens is None:
+                        return self._send(400, {'error': 'invalid_grant'})
+                    return self._send(200, tokens)
+                self._send(404, {'error': 'not_found'})
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,203 @@
+"""Configurable origin HTTP server standing in for the sites users import from.
+
+URL scheme (all sizes accept ``K``/``M``/``G`` suffixes)::
+
+    /blob/<size>/<name>           deterministic payload of <size> bytes
+    /redirect/<n>/<rest>          302 chain of length n, ending at /<rest>
+    /status/<code>/<rest>         always answer <code>
+
+Query parameters understood by ``/blob``:
+
+    rate=<bytes/s>    throttle the response body
+    fail=<n>          answer 503 to the first n requests for this exact URL
+    cut=<bytes>       drop the connection after <bytes> of the body, on the first request
+                      for this exact URL
+    ranges=0          ignore ``Range`` headers and never advertise byte ranges
+    cd=1              send a ``Content-Disposition: attachment`` header
+    type=<mime>       override the Content-Type (default: guessed from name)
+    latency=<s>       delay before the status line
+
+Server-wide defaults for ``rate`` / ``latency`` / ``ranges`` can be passed to
+``FakeOriginServer``.
+"""
+import mimetypes
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+_BLOCK = random.Random(1234).randbytes(64 * 1024)
+_SIZE_SUFFIXES = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def parse_size(text):
+    """Parse ``'64K'`` / ``'16M'`` / ``'1024'`` into a byte count."""
+    match = re.fullmatch(r'(\d+)([KMG]?)B?', str(text).strip().upper())
+    if not match:
+        raise ValueError(f'Invalid size: {text}')
+    return int(match.group(1)) * _SIZE_SUFFIXES[match.group(2)]
+
+
+def payload_bytes(start, end):
+    """Return bytes [start, end) of the deterministic payload."""
+    out = bytearray()
+    pos = start
+    while pos < end:
+        offset = pos % len(_BLOCK)
+        take = min(len(_BLOCK) - offset, end - pos)
+        out += _BLOCK[offset:offset + take]
+        pos += take
+    return bytes(out)
+
+
+class FakeOriginServer:
+    """Threaded origin server; use as a context manager."""
+
+    def __init__(self, host='127.0.0.1', port=0, rate=None, latency=0.0, ranges=True):
+        self.rate = rate
+        self.latency = latency
+        self.ranges = ranges
+        self.requests = 0
+        self.bytes_sent = 0
+        self._failures = {}
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self.base_url = f'http://{host}:{self._httpd.server_address[1]}'
+        self._thread = None
+
+    def url(self, size, name='file.bin', **params):
+        """Build a ``/blob`` URL for this server."""
+        query = '&'.join(f'{k}={v}' for k, v in params.items())
+        return f'{self.base_url}/blob/{size}/{name}' + (f'?{query}' if query else '')
+
+    def _should_fail(self, key, count):
+        with self._lock:
+            seen = self._failures.get(key, 0)
+            self._failures[key] = seen + 1
+        return seen < count
+
+    def _handler_class(self):
+        origin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _simple(self, status, headers=None, body=b''):
+                self.send_response(status)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(body)
+
+            def do_GET(self):
+                with origin._lock:
+                    origin.requests += 1
+                parsed = urlparse(self.path)
+                query = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+                latency = float(query.get('latency', origin.latency) or 0)
+                if latency:
+                    time.sleep(latency)
+
+                match = re.fullmatch(r'/redirect/(\d+)/(.*)', parsed.path)
+                if match:
+                    remaining = int(match.group(1))
+                    rest = match.group(2)
+                    target = f'/redirect/{remaining - 1}/{rest}' if remaining > 1 else f'/{rest}'
+                    if parsed.query:
+                        target += f'?{parsed.query}'
+                    return self._simple(302, {'Location': target})
+
+                match = re.fullmatch(r'/status/(\d+)/.*', parsed.path)
+                if match:
+                    return self._simple(int(match.group(1)), {'Content-Type': 'text/plain'},
+                                        b'status')
+
+                match = re.fullmatch(r'/blob/([^/]+)/(.+)', parsed.path)
+                if not match:
+                    return self._simple(404, {'Content-Type': 'text/plain'}, b'not found')
+
+                if origin._should_fail(self.path, int(query.get('fail', 0))):
+                    return self._simple(503, {'Content-Type': 'text/plain', 'Retry-After': '0'},
+                                        b'try again')
+
+                size = parse_size(match.group(1))
+                name = match.group(2)
+                rate = float(query.get('rate', origin.rate) or 0)
+                ranges = query.get('ranges', '1' if origin.ranges else '0') != '0'
+                content_type = (query.get('type') or mimetypes.guess_type(name)[0]
+                                or 'application/octet-stream')
+
+                start, end, status = 0, size, 200
+                range_header = self.headers.get('Range')
+                if ranges and range_header:
+                    m = re.fullmatch(r'bytes=(\d*)-(\d*)', range_header.strip())
+                    if m and (m.group(1) or m.group(2)):
+                        if m.group(1):
+                            start = int(m.group(1))
+                            end = min(size, int(m.group(2)) + 1) if m.group(2) else size
+                        else:
+                            start = max(0, size - int(m.group(2)))
+                        if start >= size:
+                            return self._simple(416, {'Content-Range': f'bytes */{size}'})
+                        status = 206
+
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(end - start))
+                if ranges:
+                    self.send_header('Accept-Ranges', 'bytes')
+                if status == 206:
+                    self.send_header('Content-Range', f'bytes {start}-{end - 1}/{size}')
+                if query.get('cd') == '1':
+                    self.send_header('Content-Disposition', f'attachment; filename="{name}"')
+                self.end_headers()
+                if self.command == 'HEAD':
+                    return
+                if 'cut' in query and origin._should_fail(('cut', self.path), 1):
+                    end = min(end, start + parse_size(query['cut']))
+                    self.close_connection = True
+
+                chunk = 64 * 1024
+                started = time.monotonic()
+                pos = start
+                while pos < end:
+                    data = payload_bytes(pos, min(end, pos + chunk))
+                    try:
+                        self.wfile.write(data)
+                    except (BrokenPipeError, ConnectionResetError):
+                        return
+                    pos += len(data)
+                    with origin._lock:
+                        origin.bytes_sent += len(data)
+                    if rate:
+                        ahead = (pos - start) / rate - (time.monotonic() - started)
+                        if ahead > 0:
+                            time.sleep(ahead)
+
+            def do_HEAD(self):
+                self.do_GET()
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,115 @@
+"""Stand-in for the ``youtube-dl`` executable, for offline load tests.
+
+Understands the invocations ``youtube_service`` makes::
+
+    youtube-dl --flat-playlist --dump-single-json <url>
+    youtube-dl --no-playlist -f <selector> --dump-json <url>
+    youtube-dl --no-playlist -f <selector> -o <template> <url>
+
+Behaviour is set through the environment:
+
+    FAKE_YOUTUBE_DL_SIZE        bytes written per download (K/M/G suffixes, default 1M)
+    FAKE_YOUTUBE_DL_LATENCY     seconds each invocation takes before answering
+    FAKE_YOUTUBE_DL_RATE        download speed in bytes/s (default unlimited)
+    FAKE_YOUTUBE_DL_PLAYLIST    entries in every playlist (default 5)
+
+Video IDs starting with ``private`` fail like private videos do. ``install()``
+puts an executable wrapper named ``youtube-dl`` into a directory, ready to be
+prepended to ``PATH``.
+"""
+import json
+import os
+import re
+import stat
+import sys
+import time
+
+_SUFFIXES = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def _size(text):
+    match = re.fullmatch(r'(\d+)([KMG]?)B?', text.strip().upper())
+    return int(match.group(1)) * _SUFFIXES[match.group(2)]
+
+
+def _video_id(url):
+    match = re.search(r'(?:v=|youtu\.be/|shorts/)([\w-]+)', url)
+    return match.group(1) if match else 'video0000001'
+
+
+def _info(video_id, selector, size):
+    audio = selector.startswith('bestaudio')
+    ext = 'webm' if 'webm' in selector else ('m4a' if audio else 'mp4')
+    height = re.search(r'height<=\??(\d+)', selector)
+    return {
+        'id': video_id,
+        'title': f'Video {video_id}',
+        'ext': ext,
+        'format_id': '140' if audio else '18',
+        'vcodec': 'none' if audio else 'avc1.42001E',
+        'height': None if audio else int(height.group(1)) if height else 720,
+        'filesize': size,
+    }
+
+
+def main(argv=None):
+    args = list(sys.argv[1:] if argv is None else argv)
+    url = args[-1]
+    size = _size(os.environ.get('FAKE_YOUTUBE_DL_SIZE', '1M'))
+    rate = float(os.environ.get('FAKE_YOUTUBE_DL_RATE') or 0)
+    time.sleep(float(os.environ.get('FAKE_YOUTUBE_DL_LATENCY') or 0))
+
+    if '--flat-playlist' in args:
+        count = int(os.environ.get('FAKE_YOUTUBE_DL_PLAYLIST', '5'))
+        print(json.dumps({
+            'id': 'PLfake', 'title': 'Fake playlist', '_type': 'playlist',
+            'entries': [{'id': f'fake{i:07d}', 'title': f'Video {i}', 'url': f'fake{i:07d}'}
+                        for i in range(count)],
+        }))
+        return 0
+
+    video_id = _video_id(url)
+    if video_id.startswith('private'):
+        sys.stderr.write('ERROR: Private video\nSign in if you\'ve been granted access to this video\n')
+        return 1
+
+    selector = args[args.index('-f') + 1] if '-f' in args else 'best'
+    info = _info(video_id, selector, size)
+    if '--dump-json' in args:
+        print(json.dumps(info))
+        return 0
+
+    template = args[args.index('-o') + 1]
+    path = template.replace('%(title)s', info['title']).replace('%(ext)s', info['ext'])
+    # A container signature so MIME sniffing sees the right type
+    header = b'\x1a\x45\xdf\xa3' if info['ext'] == 'webm' else b'\x00\x00\x00\x18ftypmp42'
+    block = header + bytes(1024 * 1024 - len(header))
+    started = time.monotonic()
+    written = 0
+    with open(path, 'wb') as f:
+        while written < size:
+            data = block[:size - written]
+            f.write(data)
+            written += len(data)
+            if rate:
+                ahead = written / rate - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+    return 0
+
+
+def install(directory):
+    """Write an executable ``youtube-dl`` wrapper into ``directory``.
+
+    Returns:
+        str: Path of the wrapper
+    """
+    path = os.path.join(directory, 'youtube-dl')
+    with open(path, 'w') as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.abspath(__file__)}" "$@"\n')
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return path
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,162 @@
+"""Measurement helpers shared by the benchmark runner and the load tester."""
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def current_rss():
+    """Return the current resident set size of this process in bytes."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        # ru_maxrss is the lifetime peak (KB on Linux, bytes on macOS); the
+        # best we can do where /proc is unavailable.
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class RSSSampler:
+    """Sample RSS on a background thread and keep the peak.
+
+    Usage::
+
+        with RSSSampler() as rss:
+            work()
+        rss.peak, rss.baseline
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.baseline = 0
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.baseline = self.peak = current_rss()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+
+def percentile(values, pct):
+    """Linear-interpolated percentile of ``values`` (0-100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100.0
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+def latency_summary(latencies):
+    """Summarise a list of latencies (seconds) in milliseconds."""
+    ms = [v * 1000.0 for v in latencies]
+    return {
+        'count': len(ms),
+        'mean': round(sum(ms) / len(ms), 3) if ms else 0.0,
+        'p50': round(percentile(ms, 50), 3),
+        'p90': round(percentile(ms, 90), 3),
+        'p95': round(percentile(ms, 95), 3),
+        'p99': round(percentile(ms, 99), 3),
+        'max': round(max(ms), 3) if ms else 0.0,
+    }
+
+
+def run_case(name, operation, ops, concurrency, bytes_per_op=0, params=None):
+    """Run ``operation(i)`` ``ops`` times over ``concurrency`` threads.
+
+    Args:
+        name (str): Case name
+        operation (callable): Called with the operation index
+        ops (int): Number of operations
+        concurrency (int): Worker threads
+        bytes_per_op (int, optional): Payload bytes moved per operation
+        params (dict, optional): Extra parameters recorded with the result
+
+    Returns:
+        dict: Machine-readable result record
+    """
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def timed(i):
+        started = time.perf_counter()
+        try:
+            operation(i)
+        except Exception as e:
+            with lock:
+                errors.append(f'{type(e).__name__}: {e}')
+            return
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+
+    with RSSSampler() as rss:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(timed, range(ops)))
+        wall = time.perf_counter() - started
+
+    succeeded = len(latencies)
+    moved = succeeded * bytes_per_op
+    return {
+        'case': name,
+        'params': params or {},
+        'concurrency': concurrency,
+        'ops': ops,
+        'succeeded': succeeded,
+        'errors': len(errors),
+        'error_samples': errors[:3],
+        'wall_s': round(wall, 4),
+        'ops_per_s': round(succeeded / wall, 3) if wall else 0.0,
+        'bytes': moved,
+        'throughput_mb_s': round(moved / wall / (1024 * 1024), 3) if wall else 0.0,
+        'latency_ms': latency_summary(latencies),
+        'rss_baseline_mb': round(rss.baseline / (1024 * 1024), 2),
+        'rss_peak_mb': round(rss.peak / (1024 * 1024), 2),
+        'rss_delta_mb': round((rss.peak - rss.baseline) / (1024 * 1024), 2),
+    }
+
+
+def environment():
+    """Describe the machine and checkout a result was produced on."""
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                  text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'git_revision': revision,
+    }
+
+
+def bypass_proxies():
+    """Make sure loopback traffic never goes through an HTTP(S) proxy."""
+    for var in ('NO_PROXY', 'no_proxy'):
+        current = os.environ.get(var, '')
+        if '127.0.0.1' not in current:
+            os.environ[var] = ','.join(filter(None, [current, '127.0.0.1', 'localhost']))
@@ -0,0 +1,449 @@
+"""End-to-end load test of the Flask app.
+
+Examples::
+
+    python -m benchmarks.loadtest
+    python -m benchmarks.loadtest --rate 40 --duration 60 --threads 4,8,16 \\
+        --mix files=50,upload_file=20,upload_url=15,upload_youtube=5,delete=10
+    python -m benchmarks.loadtest --drive-latency 0.05 --output load.json
+
+The app is built with ``create_app`` and served by a WSGI server with a fixed
+pool of request threads, like one gunicorn ``gthread`` worker with
+``--threads N``. Google OAuth, Drive and the origin sites are local stand-ins
+(``fake_oauth``, ``fake_drive``, ``fake_origin``) and ``youtube-dl`` is
+``fake_youtube_dl``, so no network access or credentials are needed.
+
+Virtual users sign in through the app's real OAuth routes. Requests then
+arrive open-loop at ``--rate`` per second, in the ``--mix`` proportions, for
+``--duration`` seconds. Latency is measured from each request's scheduled
+arrival, so time spent queueing for a server thread counts.
+
+Each ``--threads`` level produces one record per route, with p50/p95/p99
+latency and the error rate. The server's thread report is printed and stored under ``servers``, with:
+- thread utilisation
+- the share of samples in which every thread was busy
+- how long requests waited for a thread
+
+``--output`` writes the records as JSON, which ``benchmarks.compare`` can
+diff. The command exits non-zero when a level's error rate exceeds
+``--max-error-rate``.
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, urlencode
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler
+
+from benchmarks.fake_drive import FakeDriveServer
+from benchmarks.fake_oauth import FakeOAuthServer
+from benchmarks.fake_origin import FakeOriginServer, parse_size, payload_bytes
+from benchmarks import fake_youtube_dl
+from benchmarks.harness import latency_summary, percentile, environment, bypass_proxies
+
+ROUTES = ('files', 'upload_file', 'upload_url', 'upload_youtube', 'delete')
+DEFAULT_MIX = 'files=50,upload_file=15,upload_url=15,upload_youtube=5,delete=15'
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class PooledWSGIServer(WSGIServer):
+    """WSGI server that handles requests on a fixed pool of threads.
+
+    Accepted connections wait in the pool's queue while every thread is busy,
+    as they do in a gunicorn gthread worker, and the server records how busy
+    the threads were and how long requests queued.
+    """
+
+    request_queue_size = 512
+
+    def __init__(self, app, threads, host='127.0.0.1', port=0, sample_interval=0.05):
+        super().__init__((host, port), _QuietHandler)
+        self.set_app(app)
+        self.threads = threads
+        self.base_url = f'http://{host}:{self.server_address[1]}'
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='wsgi')
+        self._lock = threading.Lock()
+        self._busy = 0
+        self._queued = 0
+        self._busy_seconds = 0.0
+        self._waits = []
+        self._samples = []
+        self._sample_interval = sample_interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._sampler = None
+        self._started = None
+
+    def process_request(self, request, client_address):
+        accepted = time.perf_counter()
+        with self._lock:
+            self._queued += 1
+        self._pool.submit(self._handle, request, client_address, accepted)
+
+    def _handle(self, request, client_address, accepted):
+        started = time.perf_counter()
+        with self._lock:
+            self._queued -= 1
+            self._busy += 1
+            self._waits.append(started - accepted)
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self._lock:
+                self._busy -= 1
+                self._busy_seconds += time.perf_counter() - started
+
+    def _sample(self):
+        while not self._stop.wait(self._sample_interval):
+            with self._lock:
+                self._samples.append((self._busy, self._queued))
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self.shutdown()
+        self._pool.shutdown(wait=True)
+        self.server_close()
+
+    def report(self):
+        """Thread utilisation and queueing since start()."""
+        wall = time.perf_counter() - self._started
+        with self._lock:
+            samples = list(self._samples)
+            waits_ms = [w * 1000.0 for w in self._waits]
+            busy_seconds = self._busy_seconds
+        queue_lengths = [q for _, q in samples]
+        return {
+            'threads': self.threads,
+            'utilisation': round(busy_seconds / (wall * self.threads), 4) if wall else 0.0,
+            'saturated_share': round(
+                sum(1 for busy, _ in samples if busy >= self.threads) / len(samples), 4
+            ) if samples else 0.0,
+            'peak_busy': max((b for b, _ in samples), default=0),
+            'queue_p95': round(percentile(queue_lengths, 95), 1),
+            'queue_max': max(queue_lengths, default=0),
+            'queue_wait_ms': {
+                'p50': round(percentile(waits_ms, 50), 3),
+                'p95': round(percentile(waits_ms, 95), 3),
+                'p99': round(percentile(waits_ms, 99), 3),
+                'max': round(max(waits_ms, default=0.0), 3),
+            },
+        }
+
+
+def parse_mix(text):
+    """Parse ``'files=50,delete=10'`` into ``{'files': 50.0, 'delete': 10.0}``."""
+    mix = {}
+    for part in filter(None, (p.strip() for p in text.split(','))):
+        route, _, weight = part.partition('=')
+        if route not in ROUTES:
+            raise ValueError(f'Unknown route {route!r} (choose from {", ".join(ROUTES)})')
+        mix[route] = float(weight or 1)
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError('The mix needs at least one route with a positive weight')
+    return mix
+
+
+def _configure_environment(args, workdir, drive, oauth, bindir):
+    """Point the app at the stand-ins; must run before the app is imported."""
+    os.environ.update({
+        'GOOGLE_DRIVE_ROOT_URL': drive.root_url,
+        'GOOGLE_DISCOVERY_URL': oauth.discovery_url,
+        'OAUTHLIB_INSECURE_TRANSPORT': '1',
+        'GOOGLE_OAUTH_CLIENT_ID': 'loadtest-client',
+        'GOOGLE_OAUTH_CLIENT_SECRET': 'loadtest-secret',
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'loadtest.db')}",
+        'DB_SCHEMA_SETUP': 'startup',
+        'TRANSFER_QUEUE_ENABLED': '',
+        'SESSION_SECRET': 'loadtest',
+        'THUMBNAIL_CACHE_DIR': os.path.join(workdir, 'thumbnails'),
+        'SCRATCH_DIR': os.path.join(workdir, 'scratch'),
+        'PATH': bindir + os.pathsep + os.environ.get('PATH', ''),
+        'FAKE_YOUTUBE_DL_SIZE': str(parse_size(args.youtube_size)),
+        'FAKE_YOUTUBE_DL_LATENCY': str(args.youtube_latency),
+    })
+
+
+def sign_in(session, base_url, email):
+    """Log a virtual user in through /google_login and the fake provider."""
+    response = session.get(f'{base_url}/google_login', allow_redirects=False)
+    authorize = response.headers['Location']
+    response = session.get(f"{authorize}&{urlencode({'login_hint': email})}",
+                           allow_redirects=False)
+    # The app asks for an https redirect URI; call the callback on our http server
+    callback = urlparse(response.headers['Location'])
+    response = session.get(f'{base_url}{callback.path}?{callback.query}', allow_redirects=False)
+    if 'session' not in session.cookies:
+        raise RuntimeError(f'Login failed for {email}: {response.status_code}')
+
+
+class Workload:
+    """Builds and checks one request of each route."""
+
+    def __init__(self, args, drive, origin):
+        self.args = args
+        self.drive = drive
+        self.origin = origin
+        self.upload_body = payload_bytes(0, parse_size(args.upload_size))
+        self.url_size = parse_size(args.url_size)
+        self._deletable = []
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+
+    def _file_to_delete(self):
+        with self._lock:
+            if self._deletable:
+                return self._deletable.pop()
+        return self.drive.add_file(f'delete-me-{next(self._counter)}.bin', size=1024)['id']
+
+    def run(self, route, session, base_url):
+        """Send one request; raise if the app reports a failure."""
+        n = next(self._counter)
+        if route == 'files':
+            response = session.get(f'{base_url}/files')
+            response.raise_for_status()
+            if 'Error listing files' in response.text:
+                raise RuntimeError('listing failed')
+            return
+        if route == 'delete':
+            file_id = self._file_to_delete()
+            response = session.post(f'{base_url}/file/delete/{file_id}', allow_redirects=False)
+            response.raise_for_status()
+            if file_id in self.drive.files:
+                raise RuntimeError(f'file {file_id} was not deleted')
+            return
+
+        if route == 'upload_file':
+            response = session.post(f'{base_url}/upload/file', files={
+                'file': (f'load-{n}.bin', self.upload_body, 'application/octet-stream')})
+        elif route == 'upload_url':
+            response = session.post(f'{base_url}/upload/url', data={
+                'url': self.origin.url(self.url_size, f'remote-{n}.bin')})
+        else:
+            response = session.post(f'{base_url}/upload/youtube', data={
+                'youtube_url': f'https://www.youtube.com/watch?v=load{n:07d}'})
+        data = response.json()
+        if response.status_code >= 400 or data.get('error'):
+            raise RuntimeError(f"{response.status_code}: {data.get('error')}")
+        if data.get('file_id'):
+            with self._lock:
+                self._deletable.append(data['file_id'])
+
+
+def run_level(app, threads, args, workload, users):
+    """Replay the workload against a server with ``threads`` request threads.
+
+    Returns:
+        tuple: (one record per route, the server's thread report)
+    """
+    import requests
+
+    server = PooledWSGIServer(app, threads).start()
+    mix = parse_mix(args.mix)
+    routes, weights = list(mix), list(mix.values())
+    rng = random.Random(args.seed)
+
+    sessions = []
+    for email in users:
+        session = requests.Session()
+        sign_in(session, server.base_url, email)
+        sessions.append(session)
+
+    results = {route: {'latencies': [], 'errors': [], 'lags': []} for route in routes}
+    lock = threading.Lock()
+
+    def fire(route, session, scheduled):
+        lag = time.perf_counter() - scheduled
+        try:
+            workload.run(route, session, server.base_url)
+            error = None
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+        elapsed = time.perf_counter() - scheduled
+        with lock:
+            record = results[route]
+            record['lags'].append(lag)
+            if error:
+                record['errors'].append(error)
+            else:
+                record['latencies'].append(elapsed)
+
+    # Each client thread holds a connection, so allow plenty of them
+    clients = ThreadPoolExecutor(max_workers=args.clients)
+    start = time.perf_counter()
+    scheduled = start
+    sent = 0
+    while True:
+        gap = rng.expovariate(args.rate) if args.arrival == 'poisson' else 1.0 / args.rate
+        scheduled += gap
+        if scheduled - start > args.duration:
+            break
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        route = rng.choices(routes, weights)[0]
+        clients.submit(fire, route, sessions[sent % len(sessions)], scheduled)
+        sent += 1
+    clients.shutdown(wait=True)
+    wall = time.perf_counter() - start
+    server_report = server.report()
+    server.stop()
+
+    records = []
+    for route in routes:
+        record = results[route]
+        total = len(record['latencies']) + len(record['errors'])
+        lags_ms = [lag * 1000.0 for lag in record['lags']]
+        records.append({
+            'case': route,
+            'params': {'rate': args.rate, 'threads': threads},
+            'concurrency': threads,
+            'ops': total,
+            'succeeded': len(record['latencies']),
+            'errors': len(record['errors']),
+            'error_rate': round(len(record['errors']) / total, 4) if total else 0.0,
+            'error_samples': sorted(set(record['errors']))[:3],
+            'wall_s': round(wall, 3),
+            'ops_per_s': round(len(record['latencies']) / wall, 3) if wall else 0.0,
+            'throughput_mb_s': 0.0,
+            'latency_ms': latency_summary(record['latencies']),
+            'client_lag_p99_ms': round(percentile(lags_ms, 99), 3),
+            'rss_peak_mb': 0.0,
+        })
+    server_report.update(sent=sent, offered_rate=round(sent / wall, 3) if wall else 0.0)
+    return records, server_report
+
+
+def _print_level(records, server):
+    print(f"threads={server['threads']}: offered {server['offered_rate']:.1f} req/s, "
+          f"utilisation {server['utilisation'] * 100:.0f}%, all busy "
+          f"{server['saturated_share'] * 100:.0f}% of the time, queue wait "
+          f"p95={server['queue_wait_ms']['p95']:.1f}ms p99={server['queue_wait_ms']['p99']:.1f}ms "
+          f"(max queue {server['queue_max']})", flush=True)
+    for record in records:
+        lat = record['latency_ms']
+        print(f"  {record['case']:<15} n={record['ops']:<5} err={record['error_rate'] * 100:5.1f}% "
+              f"p50={lat['p50']:>9.1f}ms p95={lat['p95']:>9.1f}ms p99={lat['p99']:>9.1f}ms "
+              f"max={lat['max']:>9.1f}ms", flush=True)
+        for sample in record['error_samples']:
+            print(f'      error: {sample}', flush=True)
+        if record['client_lag_p99_ms'] > 50:
+            print(f"      warning: requests started up to {record['client_lag_p99_ms']:.0f}ms late "
+                  f"(p99); raise --clients or lower --rate", flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rate', type=float, default=10.0, help='requests per second')
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds per level')
+    parser.add_argument('--threads', default='4,8',
+                        help='comma-separated server thread counts to test')
+    parser.add_argument('--mix', default=DEFAULT_MIX,
+                        help=f'route weights, from {", ".join(ROUTES)}')
+    parser.add_argument('--arrival', choices=('poisson', 'uniform'), default='poisson')
+    parser.add_argument('--users', type=int, default=10, help='signed-in virtual users')
+    parser.add_argument('--clients', type=int, default=128,
+                        help='load generator threads (requests in flight at most)')
+    parser.add_argument('--seed-files', type=int, default=200,
+                        help='files in the fake Drive listing')
+    parser.add_argument('--upload-size', default='256K', help='body of each /upload/file')
+    parser.add_argument('--url-size', default='1M', help='file served for each /upload/url')
+    parser.add_argument('--youtube-size', default='2M', help='video written by youtube-dl')
+    parser.add_argument('--youtube-latency', type=float, default=0.2,
+                        help='seconds each youtube-dl call takes before answering')
+    parser.add_argument('--drive-latency', type=float, default=0.0,
+                        help='seconds added to every fake Drive request (simulated RTT)')
+    parser.add_argument('--origin-rate', default=None,
+                        help='origin bandwidth cap per response, e.g. 20M (bytes/s)')
+    parser.add_argument('--max-error-rate', type=float, default=0.01,
+                        help='fail when a level has a higher share of failed requests')
+    parser.add_argument('--seed', type=int, default=1, help='random seed for arrivals and mix')
+    parser.add_argument('--label', default='', help='free-form label stored with the run')
+    parser.add_argument('--output', help='write JSON results to this path')
+    args = parser.parse_args(argv)
+
+    try:
+        parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    levels = [int(t) for t in args.threads.split(',') if t.strip()]
+
+    bypass_proxies()
+    workdir = tempfile.mkdtemp(prefix='loadtest-')
+    bindir = os.path.join(workdir, 'bin')
+    os.makedirs(bindir)
+    fake_youtube_dl.install(bindir)
+    drive = FakeDriveServer(latency=args.drive_latency).start()
+    origin = FakeOriginServer(rate=parse_size(args.origin_rate) if args.origin_rate else None).start()
+    oauth = FakeOAuthServer().start()
+    _configure_environment(args, workdir, drive, oauth, bindir)
+
+    from app import create_app
+    app = create_app()
+    # The app configures DEBUG logging; keep the report readable
+    logging.getLogger().setLevel(logging.WARNING)
+
+    users = [f'load{i:03d}@example.com' for i in range(args.users)]
+    results = []
+    servers = []
+    failed = False
+    try:
+        for threads in levels:
+            drive.reset()
+            drive.seed(args.seed_files)
+            workload = Workload(args, drive, origin)
+            records, server = run_level(app, threads, args, workload, users)
+            _print_level(records, server)
+            results.extend(records)
+            servers.append(server)
+            total = sum(r['ops'] for r in records)
+            errors = sum(r['errors'] for r in records)
+            if total and errors / total > args.max_error_rate:
+                print(f'FAIL: {errors} of {total} requests failed at threads={threads}')
+                failed = True
+    finally:
+        drive.stop()
+        origin.stop()
+        oauth.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'label': args.label,
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'environment': environment(),
+        'config': vars(args),
+        'results': results,
+        'servers': servers,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Wrote {len(results)} results to {args.output}')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,196 @@
+"""Benchmark runner.
+
+Examples::
+
+    python -m benchmarks.run
+    python -m benchmarks.run --cases upload_file,upload_from_url --sizes 64K,8M \\
+        --concurrency 1,4 --ops 8 --output bench.json
+    python -m benchmarks.run --drive-latency 0.02 --origin-rate 20M
+
+Each (case, size, concurrency) combination produces one record with
+throughput, latency percentiles and peak RSS; ``--output`` writes all records
+as JSON for ``benchmarks.compare``.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.fake_drive import FakeDriveServer
+from benchmarks.fake_origin import FakeOriginServer, parse_size, payload_bytes
+from benchmarks.harness import run_case, environment, bypass_proxies
+
+CASES = ('upload_file', 'upload_from_url', 'download', 'list_files')
+
+
+def _drive_service():
+    from drive_service import DriveService
+    return DriveService(user_credentials={'token': 'bench-token', 'refresh_token': None})
+
+
+def _write_source(size):
+    """Create a temporary source file of ``size`` bytes."""
+    fd, path = tempfile.mkstemp(prefix='bench-', suffix='.bin')
+    with os.fdopen(fd, 'wb') as f:
+        pos = 0
+        while pos < size:
+            chunk = payload_bytes(pos, min(size, pos + 1024 * 1024))
+            f.write(chunk)
+            pos += len(chunk)
+    return path
+
+
+def case_upload_file(size, args, drive, origin):
+    from werkzeug.datastructures import FileStorage
+
+    path = _write_source(size)
+
+    def op(i):
+        with open(path, 'rb') as f:
+            storage = FileStorage(stream=f, filename=f'upload-{i}.bin',
+                                  content_type='application/octet-stream')
+            _drive_service().upload_file(storage, f'upload-{i}.bin', 'application/octet-stream')
+
+    return op, lambda: os.unlink(path)
+
+
+def case_upload_from_url(size, args, drive, origin):
+    def op(i):
+        _drive_service().upload_from_url(origin.url(size, f'remote-{i}.bin'))
+
+    return op, None
+
+
+def case_download(size, args, drive, origin):
+    import utils
+
+    def op(i):
+        _, body, _ = utils.download_with_cloudscraper(origin.url(size, f'remote-{i}.bin'))
+        received = body.getbuffer().nbytes
+        if received != size:
+            raise ValueError(f'short read: {received} != {size}')
+
+    return op, None
+
+
+def case_list_files(count, args, drive, origin):
+    drive.reset()
+    drive.seed(count)
+
+    def op(i):
+        files = _drive_service().list_files(max_results=min(count, 1000) or 1)
+        if len(files) != min(count, 1000):
+            raise ValueError(f'listed {len(files)} files, expected {min(count, 1000)}')
+
+    return op, drive.reset
+
+
+def _print_result(result):
+    lat = result['latency_ms']
+    size = result['params'].get('size', result['params'].get('files', ''))
+    print(f"{result['case']:<16} {size!s:>10} c={result['concurrency']:<3} "
+          f"ok={result['succeeded']:<4} err={result['errors']:<3} "
+          f"{result['throughput_mb_s']:>9.2f} MB/s {result['ops_per_s']:>8.2f} op/s "
+          f"p50={lat['p50']:>9.2f}ms p95={lat['p95']:>9.2f}ms p99={lat['p99']:>9.2f}ms "
+          f"rss+={result['rss_delta_mb']:>7.2f}MB", flush=True)
+    for sample in result['error_samples']:
+        print(f'    error: {sample}', flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--cases', default=','.join(CASES),
+                        help=f'comma-separated subset of {", ".join(CASES)}')
+    parser.add_argument('--sizes', default='16K,1M,16M', help='payload sizes (K/M/G suffixes)')
+    parser.add_argument('--list-counts', default='100,1000',
+                        help='number of seeded files for list_files')
+    parser.add_argument('--concurrency', default='1,4', help='comma-separated worker counts')
+    parser.add_argument('--ops', type=int, default=8, help='operations per combination')
+    parser.add_argument('--drive-latency', type=float, default=0.0,
+                        help='seconds added to every fake Drive request (simulated RTT)')
+    parser.add_argument('--drive-chunk-failure-rate', type=float, default=0.0,
+                        help='fraction of resumable chunk PUTs the fake Drive fails with 503')
+    parser.add_argument('--origin-rate', default=None,
+                        help='origin bandwidth cap per response, e.g. 20M (bytes/s)')
+    parser.add_argument('--origin-latency', type=float, default=0.0,
+                        help='seconds before the origin answers each request')
+    parser.add_argument('--label', default='', help='free-form label stored with the run')
+    parser.add_argument('--output', help='write JSON results to this path')
+    args = parser.parse_args(argv)
+
+    cases = [c.strip() for c in args.cases.split(',') if c.strip()]
+    unknown = set(cases) - set(CASES)
+    if unknown:
+        parser.error(f'unknown cases: {", ".join(sorted(unknown))}')
+    sizes = [s.strip() for s in args.sizes.split(',') if s.strip()]
+    counts = [int(c) for c in args.list_counts.split(',') if c.strip()]
+    levels = [int(c) for c in args.concurrency.split(',') if c.strip()]
+
+    bypass_proxies()
+    drive = FakeDriveServer(latency=args.drive_latency,
+                            chunk_failure_rate=args.drive_chunk_failure_rate).start()
+    origin = FakeOriginServer(
+        rate=parse_size(args.origin_rate) if args.origin_rate else None,
+        latency=args.origin_latency,
+    ).start()
+    os.environ['GOOGLE_DRIVE_ROOT_URL'] = drive.root_url
+
+    # Importing the app modules configures DEBUG logging; keep output readable.
+    import drive_service  # noqa: F401
+    logging.getLogger().setLevel(logging.WARNING)
+
+    factories = {
+        'upload_file': case_upload_file,
+        'upload_from_url': case_upload_from_url,
+        'download': case_download,
+        'list_files': case_list_files,
+    }
+
+    results = []
+    try:
+        for case in cases:
+            axis = counts if case == 'list_files' else sizes
+            for value in axis:
+                for concurrency in levels:
+                    if case == 'list_files':
+                        params, bytes_per_op = {'files': value}, 0
+                        op, cleanup = factories[case](value, args, drive, origin)
+                    else:
+                        size = parse_size(value)
+                        params, bytes_per_op = {'size': value, 'bytes': size}, size
+                        op, cleanup = factories[case](size, args, drive, origin)
+                    stats_before = dict(drive.stats)
+                    try:
+                        result = run_case(case, op, args.ops, concurrency, bytes_per_op, params)
+                    finally:
+                        if cleanup:
+                            cleanup()
+                    result['drive_requests'] = {
+                        k: v - stats_before.get(k, 0) for k, v in drive.stats.items()
+                        if v - stats_before.get(k, 0)
+                    }
+                    results.append(result)
+                    _print_result(result)
+    finally:
+        drive.stop()
+        origin.stop()
+
+    report = {
+        'label': args.label,
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'environment': environment(),
+        'config': vars(args),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Wrote {len(results)} results to {args.output}')
+    return 1 if any(r['errors'] for r in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
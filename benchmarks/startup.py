@@ -0,0 +1,119 @@
+"""Cold-start budget check.
+
+Examples::
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --runs 7 --budget 0.8 --top 15
+
+Each run starts a fresh interpreter, imports ``main`` (which builds the app
+exactly as gunicorn does) and reports how long that took. The command exits
+non-zero when the median exceeds ``--budget`` seconds or when one of the
+``--deferred`` modules was imported during startup, so it can gate CI or a
+deploy. ``--top`` lists the slowest imports from ``python -X importtime``.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Heavy dependencies that must only be imported by the routes that use them
+DEFERRED_MODULES = (
+    'googleapiclient',
+    'google_auth_oauthlib',
+    'cloudscraper',
+    'requests',
+    'oauthlib',
+    'httplib2',
+)
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+print(json.dumps({'seconds': elapsed, 'modules': sorted(sys.modules)}))
+"""
+
+
+def _environment():
+    env = dict(os.environ)
+    # Build the app against a throwaway database unless one is configured
+    env.setdefault('DATABASE_URL', 'sqlite://')
+    env.setdefault('TRANSFER_QUEUE_ENABLED', '')
+    return env
+
+
+def measure(runs):
+    """Import ``main`` in ``runs`` fresh interpreters.
+
+    Returns:
+        tuple: (list of seconds per run, modules loaded by the last run)
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    timings = []
+    modules = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-c', _PROBE], cwd=root, env=_environment(),
+                                capture_output=True, text=True, check=True)
+        data = json.loads(result.stdout.strip().splitlines()[-1])
+        timings.append(data['seconds'])
+        modules = data['modules']
+    return timings, modules
+
+
+def slowest_imports(top):
+    """Return the ``top`` (cumulative microseconds, module) pairs from -X importtime."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'],
+                            cwd=root, env=_environment(), capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        try:
+            rows.append((int(parts[1]), parts[2].strip()))
+        except (IndexError, ValueError):
+            continue
+    # Only top-level packages give a readable picture
+    rows = [(us, name) for us, name in rows if '.' not in name]
+    return sorted(rows, reverse=True)[:top]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=1.0,
+                        help='maximum median seconds to import main')
+    parser.add_argument('--deferred', default=','.join(DEFERRED_MODULES),
+                        help='comma-separated modules that must not load at startup')
+    parser.add_argument('--top', type=int, default=10,
+                        help='show the N slowest top-level imports (0 to skip)')
+    args = parser.parse_args(argv)
+
+    timings, modules = measure(args.runs)
+    median = statistics.median(timings)
+    print(f"import main: median {median:.3f}s, min {min(timings):.3f}s, "
+          f"max {max(timings):.3f}s over {len(timings)} runs (budget {args.budget:.3f}s)")
+
+    if args.top:
+        print("slowest top-level imports:")
+        for us, name in slowest_imports(args.top):
+            print(f"  {us / 1e6:8.3f}s  {name}")
+
+    failures = []
+    if median > args.budget:
+        failures.append(f"median {median:.3f}s exceeds the {args.budget:.3f}s budget")
+    loaded = set(modules)
+    for name in filter(None, args.deferred.split(',')):
+        if name in loaded:
+            failures.append(f"{name} is imported at startup")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
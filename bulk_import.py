@@ -0,0 +1,262 @@
+import csv
+import io
+import time
+import logging
+import threading
+from contextlib import nullcontext
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit, urlunsplit
+from config import Config
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# How often a batch rechecks a host whose slots are held by another batch
+BUSY_HOST_POLL_SECONDS = 0.25
+
+
+def parse_url_list(text):
+    """Extract URLs from pasted text, a .txt file or a CSV file.
+
+    Every line (or CSV cell) starting with http:// or https:// is taken, so a
+    CSV export with a header row or extra columns works as is. Blank lines and
+    lines starting with '#' are ignored.
+
+    Args:
+        text (str): Raw list contents
+
+    Returns:
+        list: URLs in the order they appear
+    """
+    urls = []
+    for row in csv.reader(io.StringIO(text)):
+        if row and row[0].lstrip().startswith('#'):
+            continue
+        for cell in row:
+            cell = cell.strip()
+            if cell.lower().startswith(('http://', 'https://')):
+                urls.append(cell)
+    return urls
+
+
+def normalize_url(url):
+    """Canonical form of a URL used to spot duplicates.
+
+    Lowercases the scheme and host, drops default ports and the fragment.
+
+    Args:
+        url (str): URL
+
+    Returns:
+        str: Normalised URL
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    return urlunsplit((scheme, host, parts.path or '/', parts.query, ''))
+
+
+def dedupe_urls(urls):
+    """Drop repeated URLs, keeping the first occurrence.
+
+    Args:
+        urls (list): URLs as submitted
+
+    Returns:
+        tuple: (unique URLs, number of duplicates dropped)
+    """
+    seen = set()
+    unique = []
+    for url in urls:
+        key = normalize_url(url)
+        if key not in seen:
+            seen.add(key)
+            unique.append(url)
+    return unique, len(urls) - len(unique)
+
+
+class HostSlots:
+    """Per-host download slots shared by every bulk import in the process.
+
+    Batches running at the same time draw from the same slots, so a host sees
+    at most per_host downloads and host_delay spacing from this process no
+    matter how many batches target it.
+    """
+
+    def __init__(self):
+        """Initialize with no hosts in use."""
+        self._lock = threading.Lock()
+        self._active = {}  # host -> downloads in flight
+        self._next_start = {}  # host -> earliest monotonic time of the next start
+
+    def acquire(self, host, per_host, delay):
+        """Take a slot on a host if it has one free and its delay has passed.
+
+        Args:
+            host (str): Host name
+            per_host (int): Concurrent downloads allowed on the host
+            delay (float): Seconds before the next download may start on the host
+
+        Returns:
+            float: 0 if a slot was taken, otherwise the monotonic time worth retrying at
+        """
+        with self._lock:
+            now = time.monotonic()
+            ready_at = self._next_start.get(host, 0)
+            if self._active.get(host, 0) >= per_host:
+                # Freed by a download that may belong to another batch
+                return max(ready_at, now + BUSY_HOST_POLL_SECONDS)
+            if ready_at > now:
+                return ready_at
+            self._active[host] = self._active.get(host, 0) + 1
+            self._next_start[host] = now + delay
+            return 0
+
+    def release(self, host):
+        """Give back a slot taken with acquire()."""
+        with self._lock:
+            self._active[host] -= 1
+            if not self._active[host]:
+                del self._active[host]
+            # Forget hosts that are idle and past their delay
+            now = time.monotonic()
+            for idle in [h for h, t in self._next_start.items() if t <= now and h not in self._active]:
+                del self._next_start[idle]
+
+    def in_use(self):
+        """Downloads in flight per host, for diagnostics."""
+        with self._lock:
+            return dict(self._active)
+
+
+# Shared by every bulk import in this process
+host_slots = HostSlots()
+
+
+class BulkUrlImporter:
+    """Imports many URLs concurrently while staying polite to each source.
+
+    URLs are grouped by host. A dispatcher starts downloads round-robin across
+    hosts with at most max_workers in flight for the batch, at most per_host
+    in flight per host, and at least host_delay seconds between two downloads
+    starting on the same host. The per-host limits come from host_slots, so
+    they hold across all batches running in the process. A busy host
+    therefore never stalls the pool: its URLs wait while other hosts' URLs run.
+    """
+
+    def __init__(self, drive_service, max_workers=None, per_host=None, host_delay=None,
+                 slots=None, track=None):
+        """Initialize the importer.
+
+        Args:
+            drive_service (DriveService): Drive service used for the uploads
+            max_workers (int, optional): Concurrent imports (defaults to BULK_IMPORT_WORKERS)
+            per_host (int, optional): Concurrent imports per host (defaults to BULK_IMPORT_PER_HOST)
+            host_delay (float, optional): Seconds between starts on one host
+                (defaults to BULK_IMPORT_HOST_DELAY)
+            slots (HostSlots, optional): Per-host slots (defaults to the shared host_slots)
+            track (callable, optional): Called as track(url) around each import on its
+                worker thread; returns a context manager yielding the transfer record
+                (see TransferHistory.track)
+        """
+        self.drive_service = drive_service
+        self.max_workers = max_workers or Config.BULK_IMPORT_WORKERS
+        self.per_host = per_host or Config.BULK_IMPORT_PER_HOST
+        self.host_delay = Config.BULK_IMPORT_HOST_DELAY if host_delay is None else host_delay
+        self.slots = slots or host_slots
+        self.track = track or (lambda url: nullcontext(None))
+
+    def import_urls(self, urls):
+        """Import a batch of URLs into Drive.
+
+        Args:
+            urls (list): URLs to import (duplicates are skipped)
+
+        Returns:
+            dict: Aggregate report with per-URL results
+        """
+        if len(urls) > Config.BULK_IMPORT_MAX_URLS:
+            raise Exception(f"Too many URLs: at most {Config.BULK_IMPORT_MAX_URLS} per batch")
+
+        started = time.monotonic()
+        unique, duplicates = dedupe_urls(urls)
+        pending = OrderedDict()
+        for url in unique:
+            pending.setdefault(urlsplit(url).hostname or '', deque()).append(url)
+        hosts = len(pending)
+
+        running = {}
+        results = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            try:
+                while pending or running:
+                    retry_at = None
+                    for host in list(pending):
+                        if len(running) >= self.max_workers:
+                            break
+                        blocked_until = self.slots.acquire(host, self.per_host, self.host_delay)
+                        if blocked_until:
+                            retry_at = min(retry_at or blocked_until, blocked_until)
+                            continue
+                        url = pending[host].popleft()
+                        if pending[host]:
+                            pending.move_to_end(host)
+                        else:
+                            del pending[host]
+                        running[pool.submit(self._import_one, url)] = host
+
+                    # Sleep until a download finishes or a blocked host may be free
+                    timeout = None
+                    if retry_at is not None and len(running) < self.max_workers:
+                        timeout = max(retry_at - time.monotonic(), 0)
+                    if running:
+                        done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            self.slots.release(running.pop(future))
+                            results.append(future.result())
+                    elif timeout:
+                        time.sleep(timeout)
+            finally:
+                # Only reached with downloads left if the dispatcher itself failed
+                for host in running.values():
+                    self.slots.release(host)
+
+        # Report in submission order
+        order = {url: index for index, url in enumerate(unique)}
+        results.sort(key=lambda r: order[r['url']])
+        failed = sum(1 for r in results if not r['success'])
+        metrics.incr('bulk_import.urls', len(unique))
+        metrics.incr('bulk_import.failed', failed)
+        return {
+            'success': failed == 0,
+            'message': f"{len(results) - failed} of {len(unique)} URL(s) uploaded, {failed} failed"
+                       + (f", {duplicates} duplicate(s) skipped" if duplicates else ''),
+            'submitted': len(urls),
+            'unique': len(unique),
+            'duplicates': duplicates,
+            'hosts': hosts,
+            'uploaded': len(results) - failed,
+            'failed': failed,
+            'elapsed_seconds': round(time.monotonic() - started, 3),
+            'results': results,
+        }
+
+    def _import_one(self, url):
+        """Import one URL; failures are reported, not raised."""
+        started = time.monotonic()
+        try:
+            with self.track(url) as transfer:
+                file_id = self.drive_service.upload_from_url(url)
+                if transfer is not None:
+                    transfer.file_id = file_id
+            return {'url': url, 'success': True, 'file_id': file_id,
+                    'seconds': round(time.monotonic() - started, 3)}
+        except Exception as e:
+            logger.error(f"Error importing {url}: {str(e)}")
+            return {'url': url, 'success': False, 'error': str(e),
+                    'seconds': round(time.monotonic() - started, 3)}
@@ -0,0 +1,571 @@
+import io
+import os
+import json
+import time
+import uuid
+import socket
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from app import db
+from config import Config
+from metrics import metrics
+from models import ChunkedUploadState, UploadChunk
+
+logger = logging.getLogger(__name__)
+
+RECEIVING = 'receiving'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+LOST = 'lost'  # The holding instance stopped; the client starts over
+
+LOST_MESSAGE = "The server holding this upload stopped; please upload the file again"
+
+
+class UploadAborted(Exception):
+    """Raised to readers of an upload that was cancelled or stopped receiving chunks."""
+
+
+def read_chunk(stream, expected, index):
+    """Read exactly ``expected`` bytes of chunk ``index`` from a request body.
+
+    Raises:
+        ValueError: If the body is shorter or longer
+    """
+    data = bytearray()
+    while len(data) <= expected:
+        block = stream.read(min(1024 * 1024, expected + 1 - len(data)))
+        if not block:
+            break
+        data += block
+    if len(data) != expected:
+        raise ValueError(f"Chunk {index} must be {expected} bytes, got {len(data)}")
+    return bytes(data)
+
+
+class ChunkedUpload:
+    """A file that arrives in numbered chunks and is forwarded while it arrives.
+
+    Chunks may come in any order, several at a time and more than once; each
+    one is written at its own offset of a spool file, so a repeated chunk just
+    rewrites the same bytes. The bytes from the start of the file up to the
+    first missing chunk are readable through stream(), which blocks for the
+    rest. Handing that stream to DriveService.upload_stream therefore sends
+    chunks to Drive as soon as they become contiguous.
+    """
+
+    def __init__(self, owner_key, filename, mime_type, size, chunk_size, allocation,
+                 expand_archive=False):
+        """Initialize the upload over its spool file.
+
+        Args:
+            owner_key (str): Identifies the user allowed to touch the upload
+            filename (str): Name of the file
+            mime_type (str): MIME type declared by the client (may be None)
+            size (int): Total size in bytes
+            chunk_size (int): Size of every chunk but the last
+            allocation (Allocation): Scratch space file to spool chunks in
+            expand_archive (bool): Expand the file as an archive once complete
+        """
+        self.id = uuid.uuid4().hex
+        self.owner_key = owner_key
+        self.filename = filename
+        self.mime_type = mime_type
+        self.size = size
+        self.chunk_size = chunk_size
+        self.expand_archive = expand_archive
+        # An empty file is a single empty chunk
+        self.total_chunks = max(1, -(-size // chunk_size))
+        self.allocation = allocation
+        self.path = allocation.path
+        self._fd = os.open(self.path, os.O_RDWR)
+        self.received = set()
+        self.contiguous = 0  # Chunks available from the start of the file
+        self.error = None
+        self.result = None
+        self.aborted = False
+        self.closed = False
+        self.updated_at = time.monotonic()
+        self._cond = threading.Condition()
+        self._forwarder = None
+
+    def chunk_length(self, index):
+        """Expected length of chunk ``index`` in bytes."""
+        return min(self.chunk_size, self.size - index * self.chunk_size)
+
+    @property
+    def available_bytes(self):
+        """Bytes readable from the start of the file."""
+        return min(self.contiguous * self.chunk_size, self.size)
+
+    def write_chunk(self, index, stream):
+        """Write one chunk read from ``stream`` to the spool file.
+
+        The chunk only becomes readable once mark_received() is called.
+
+        Args:
+            index (int): Chunk number, starting at 0
+            stream (io.Base): Request body
+        """
+        if self.aborted or self.error:
+            raise UploadAborted(self.error or "Upload was cancelled")
+        with self._cond:
+            duplicate = index in self.received
+
+        expected = self.chunk_length(index)
+        offset = index * self.chunk_size
+        written = 0
+        while True:
+            block = stream.read(min(1024 * 1024, expected + 1 - written))
+            if not block:
+                break
+            if written + len(block) > expected:
+                raise ValueError(f"Chunk {index} must be {expected} bytes")
+            if not duplicate:
+                self._write(block, offset + written)
+            written += len(block)
+        if written != expected:
+            raise ValueError(f"Chunk {index} must be {expected} bytes, got {written}")
+
+    def store_chunk(self, index, data):
+        """Write a chunk that another instance received and make it readable."""
+        self._write(data, index * self.chunk_size)
+        self.mark_received(index)
+
+    def _write(self, data, offset):
+        """Write to the spool file unless it was closed meanwhile."""
+        with self._cond:
+            if self.closed:
+                raise UploadAborted(self.error or "Upload was cancelled")
+            os.pwrite(self._fd, data, offset)
+
+    def mark_received(self, index):
+        """Make a written chunk readable.
+
+        Returns:
+            bool: False if the chunk had already been received
+        """
+        with self._cond:
+            self.updated_at = time.monotonic()
+            if index in self.received:
+                return False
+            self.received.add(index)
+            while self.contiguous in self.received:
+                self.contiguous += 1
+            self._cond.notify_all()
+        metrics.incr('upload.chunked.chunks')
+        return True
+
+    def wait_until_available(self, end):
+        """Block until the first ``end`` bytes are available.
+
+        Raises:
+            UploadAborted: If the upload is cancelled or no chunk arrives for
+                CHUNKED_UPLOAD_IDLE_SECONDS
+        """
+        with self._cond:
+            while self.available_bytes < end:
+                if self.aborted:
+                    raise UploadAborted("Upload was cancelled")
+                idle = time.monotonic() - self.updated_at
+                if idle >= Config.CHUNKED_UPLOAD_IDLE_SECONDS:
+                    raise UploadAborted(f"No chunk received for {int(idle)} seconds")
+                self._cond.wait(min(Config.CHUNKED_UPLOAD_IDLE_SECONDS - idle, 5))
+
+    def stream(self):
+        """Return a seekable reader over the file that blocks for missing chunks."""
+        return _SpoolReader(self)
+
+    def forward(self, consume, on_finish):
+        """Start consuming the upload in the background as chunks arrive.
+
+        Args:
+            consume (callable): Receives stream() and returns the upload's result
+            on_finish (callable): Called with the upload once consume returned or failed
+        """
+        def run():
+            try:
+                with self.stream() as fh:
+                    self.result = consume(fh)
+            except UploadAborted as e:
+                logger.info(f"Chunked upload {self.id} stopped: {str(e)}")
+                self.error = str(e)
+            except Exception as e:
+                logger.error(f"Error forwarding chunked upload {self.id}: {str(e)}")
+                self.error = str(e)
+            on_finish(self)
+
+        self._forwarder = threading.Thread(target=run, name=f"chunked-{self.id[:8]}", daemon=True)
+        self._forwarder.start()
+
+    def abort(self):
+        """Cancel the upload; blocked readers fail with UploadAborted."""
+        with self._cond:
+            self.aborted = True
+            self._cond.notify_all()
+
+    def close(self):
+        """Remove the spool file and return its scratch space.
+
+        Only the consumer calls this, once it stopped reading; everyone else
+        stops the upload with abort().
+        """
+        with self._cond:
+            if self.closed:
+                return
+            self.closed = True
+            os.close(self._fd)
+        self.allocation.release()
+
+    def to_dict(self):
+        """Progress report for the client."""
+        with self._cond:
+            missing = [i for i in range(self.total_chunks) if i not in self.received]
+        return {
+            'upload_id': self.id,
+            'filename': self.filename,
+            'size': self.size,
+            'chunk_size': self.chunk_size,
+            'total_chunks': self.total_chunks,
+            'received': self.total_chunks - len(missing),
+            'missing': missing,
+            'contiguous_bytes': self.available_bytes,
+            'status': FAILED if self.error else RECEIVING,
+            'error': self.error
+        }
+
+
+class _SpoolReader(io.RawIOBase):
+    """Read-only, seekable view of a ChunkedUpload's spool file."""
+
+    def __init__(self, upload):
+        self._upload = upload
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self._upload.size
+        self._pos = max(offset, 0)
+        return self._pos
+
+    def read(self, size=-1):
+        end = self._upload.size if size is None or size < 0 else min(self._pos + size, self._upload.size)
+        if end <= self._pos:
+            return b''
+        if self._upload.aborted:
+            raise UploadAborted("Upload was cancelled")
+        self._upload.wait_until_available(end)
+        data = os.pread(self._upload._fd, end - self._pos, self._pos)
+        self._pos += len(data)
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class ChunkedUploadStore:
+    """Chunked uploads in progress, shared by every app instance through the database.
+
+    The instance that starts an upload holds it: it spools the chunks in
+    scratch space and forwards them to Drive. Every other request of the
+    upload may reach any instance. A chunk received by another instance is
+    stored in an UploadChunk row, and the holder's pump thread copies it into
+    the spool within CHUNKED_UPLOAD_POLL_SECONDS. Progress, cancellation and
+    the final result are kept in the upload's ChunkedUploadState row.
+
+    The spool file only exists on the holder, so an upload can't outlive it.
+    When the holder stops sending heartbeats for CHUNKED_UPLOAD_HOLDER_TIMEOUT
+    the upload is reported as lost, and the client starts it again.
+
+    Methods other than start() must run inside an application context.
+    """
+
+    def __init__(self, app, space):
+        """Initialize the store.
+
+        Args:
+            app (Flask): Application providing the database context for the pump thread
+            space (ScratchSpace): Where spool files are allocated
+        """
+        self.app = app
+        self.space = space
+        self.instance_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._uploads = {}  # Held by this instance
+        self._lock = threading.Lock()
+        self._pump = None
+        self._last_heartbeat = 0.0
+
+    def create(self, owner_key, filename, mime_type, size, chunk_size, expand_archive=False):
+        """Register a new upload held by this instance.
+
+        Returns:
+            ChunkedUpload: The upload
+
+        Raises:
+            ScratchSpaceExhausted: If there isn't space for the file right now
+        """
+        self.sweep()
+        # Fail at once rather than hold a request thread while space frees up
+        allocation = self.space.allocate(size, prefix='chunked-', suffix='.part', timeout=0)
+        try:
+            upload = ChunkedUpload(owner_key, filename, mime_type, size, chunk_size,
+                                   allocation, expand_archive)
+            db.session.add(ChunkedUploadState(
+                id=upload.id,
+                owner_key=owner_key,
+                filename=filename,
+                mime_type=mime_type,
+                size=size,
+                chunk_size=chunk_size,
+                total_chunks=upload.total_chunks,
+                expand_archive=expand_archive,
+                holder=self.instance_id,
+                heartbeat_at=datetime.utcnow(),
+                status=RECEIVING,
+            ))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            allocation.release()
+            raise
+        with self._lock:
+            self._uploads[upload.id] = upload
+        self._ensure_pump()
+        metrics.incr('upload.chunked.started')
+        return upload
+
+    def start(self, upload, consume):
+        """Consume a new upload in the background; the outcome is saved for finalize.
+
+        Args:
+            upload (ChunkedUpload): Upload returned by create()
+            consume (callable): Receives the upload's stream and returns a
+                JSON-serialisable result
+        """
+        upload.forward(consume, self._finish)
+
+    def get(self, upload_id, owner_key):
+        """Return the upload's state if it exists and belongs to ``owner_key``, else None.
+
+        An upload whose holder stopped sending heartbeats is marked lost.
+        """
+        state = db.session.get(ChunkedUploadState, upload_id)
+        if state is None or state.owner_key != owner_key:
+            return None
+        cutoff = datetime.utcnow() - timedelta(seconds=Config.CHUNKED_UPLOAD_HOLDER_TIMEOUT)
+        if state.status == RECEIVING and state.heartbeat_at < cutoff:
+            self._end(upload_id, LOST, error=LOST_MESSAGE)
+            metrics.incr('upload.chunked.lost')
+            db.session.refresh(state)
+        return state
+
+    def received(self, state):
+        """Indices of the chunks of an upload that have arrived, in order."""
+        return sorted(index for (index,) in db.session.query(UploadChunk.index).filter(
+            UploadChunk.upload_id == state.id
+        ))
+
+    def describe(self, state):
+        """Progress report for the client, as seen by any instance."""
+        received = set(self.received(state))
+        missing = [i for i in range(state.total_chunks) if i not in received]
+        contiguous = missing[0] if missing else state.total_chunks
+        return {
+            'upload_id': state.id,
+            'filename': state.filename,
+            'size': state.size,
+            'chunk_size': state.chunk_size,
+            'total_chunks': state.total_chunks,
+            'received': len(received),
+            'missing': missing,
+            'contiguous_bytes': min(contiguous * state.chunk_size, state.size),
+            'status': state.status,
+            'error': state.error
+        }
+
+    def write_chunk(self, state, index, stream):
+        """Store one chunk of an upload, wherever it is held.
+
+        Args:
+            state (ChunkedUploadState): The upload
+            index (int): Chunk number, starting at 0
+            stream (io.Base): Request body
+
+        Returns:
+            bool: False if the chunk had already been received (nothing was stored)
+
+        Raises:
+            ValueError: If the index or the chunk's length is wrong
+            UploadAborted: If the upload is no longer receiving chunks
+        """
+        if not 0 <= index < state.total_chunks:
+            raise ValueError(f"Chunk {index} is out of range (0-{state.total_chunks - 1})")
+        if state.status != RECEIVING:
+            raise UploadAborted(state.error or "Upload was cancelled")
+
+        with self._lock:
+            upload = self._uploads.get(state.id)
+        if upload is not None:
+            # Held here: write straight to the spool, record only the arrival
+            upload.write_chunk(index, stream)
+            data = None
+        else:
+            expected = min(state.chunk_size, state.size - index * state.chunk_size)
+            data = read_chunk(stream, expected, index)
+
+        db.session.add(UploadChunk(upload_id=state.id, index=index, data=data))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            metrics.incr('upload.chunked.duplicate_chunks')
+            return False
+        if upload is not None:
+            upload.mark_received(index)
+        else:
+            metrics.incr('upload.chunked.relayed_chunks')
+        return True
+
+    def cancel(self, state):
+        """Cancel an upload; its holder stops forwarding and drops the spool file."""
+        self._end(state.id, CANCELLED, error="Upload was cancelled")
+        with self._lock:
+            upload = self._uploads.get(state.id)
+        if upload is not None:
+            upload.abort()
+
+    def wait(self, state, timeout):
+        """Wait up to ``timeout`` seconds for an upload to stop receiving.
+
+        Returns:
+            ChunkedUploadState: The upload's current state
+        """
+        deadline = time.monotonic() + timeout
+        upload_id = state.id
+        while state.status == RECEIVING and time.monotonic() < deadline:
+            time.sleep(min(Config.CHUNKED_UPLOAD_POLL_SECONDS, max(deadline - time.monotonic(), 0)))
+            # End the transaction so the next read sees other instances' commits
+            db.session.rollback()
+            state = db.session.get(ChunkedUploadState, upload_id)
+        return state
+
+    def _end(self, upload_id, status, result=None, error=None):
+        """Move a receiving upload to a final status and drop its relayed chunks.
+
+        Returns:
+            bool: False if the upload had already ended
+        """
+        ended = ChunkedUploadState.query.filter(
+            ChunkedUploadState.id == upload_id, ChunkedUploadState.status == RECEIVING
+        ).update({
+            'status': status,
+            'result': json.dumps(result) if result is not None else None,
+            'error': error,
+            'finished_at': datetime.utcnow(),
+        }, synchronize_session=False)
+        UploadChunk.query.filter(UploadChunk.upload_id == upload_id).delete(synchronize_session=False)
+        db.session.commit()
+        return bool(ended)
+
+    def _finish(self, upload):
+        """Save the outcome of a consumed upload and drop its spool file."""
+        with self._lock:
+            self._uploads.pop(upload.id, None)
+        try:
+            with self.app.app_context():
+                if upload.error:
+                    self._end(upload.id, FAILED, error=upload.error)
+                else:
+                    self._end(upload.id, SUCCEEDED, result=upload.result)
+        except Exception as e:
+            logger.error(f"Error saving chunked upload {upload.id}: {str(e)}")
+        finally:
+            upload.close()
+        metrics.incr('upload.chunked.failed' if upload.error else 'upload.chunked.succeeded')
+
+    def _ensure_pump(self):
+        with self._lock:
+            if self._pump is None or not self._pump.is_alive():
+                self._pump = threading.Thread(target=self._run_pump, name='chunked-pump', daemon=True)
+                self._pump.start()
+
+    def _run_pump(self):
+        while True:
+            time.sleep(Config.CHUNKED_UPLOAD_POLL_SECONDS)
+            with self._lock:
+                uploads = dict(self._uploads)
+            if not uploads:
+                continue
+            try:
+                with self.app.app_context():
+                    self._pull(uploads)
+                    self._heartbeat(uploads)
+            except Exception as e:
+                logger.error(f"Error pumping chunked uploads: {str(e)}")
+
+    def _pull(self, uploads):
+        """Copy chunks that other instances received into their spool files."""
+        pending = db.session.query(UploadChunk.upload_id, UploadChunk.index).filter(
+            UploadChunk.upload_id.in_(list(uploads)), UploadChunk.data.isnot(None)
+        ).all()
+        for upload_id, index in pending:
+            data = db.session.query(UploadChunk.data).filter(
+                UploadChunk.upload_id == upload_id, UploadChunk.index == index
+            ).scalar()
+            if data is None or uploads[upload_id].aborted:
+                continue
+            uploads[upload_id].store_chunk(index, data)
+            UploadChunk.query.filter(
+                UploadChunk.upload_id == upload_id, UploadChunk.index == index
+            ).update({'data': None}, synchronize_session=False)
+            db.session.commit()
+        db.session.rollback()
+
+    def _heartbeat(self, uploads):
+        """Renew the holder heartbeat and stop uploads another instance ended."""
+        ended = ChunkedUploadState.query.filter(
+            ChunkedUploadState.id.in_(list(uploads)), ChunkedUploadState.status != RECEIVING
+        ).with_entities(ChunkedUploadState.id).all()
+        for (upload_id,) in ended:
+            uploads[upload_id].abort()
+
+        if time.monotonic() - self._last_heartbeat >= Config.CHUNKED_UPLOAD_HEARTBEAT_SECONDS:
+            self._last_heartbeat = time.monotonic()
+            ChunkedUploadState.query.filter(
+                ChunkedUploadState.id.in_(list(uploads)), ChunkedUploadState.status == RECEIVING
+            ).update({'heartbeat_at': datetime.utcnow()}, synchronize_session=False)
+            db.session.commit()
+        else:
+            db.session.rollback()
+
+    def sweep(self):
+        """Mark uploads of stopped holders lost and delete old finished uploads."""
+        now = datetime.utcnow()
+        stale = ChunkedUploadState.query.filter(
+            ChunkedUploadState.status == RECEIVING,
+            ChunkedUploadState.heartbeat_at < now - timedelta(seconds=Config.CHUNKED_UPLOAD_HOLDER_TIMEOUT)
+        ).with_entities(ChunkedUploadState.id).all()
+        for (upload_id,) in stale:
+            logger.info(f"Chunked upload {upload_id} lost its holder")
+            self._end(upload_id, LOST, error=LOST_MESSAGE)
+        finished = ChunkedUploadState.query.filter(
+            ChunkedUploadState.status != RECEIVING,
+            ChunkedUploadState.finished_at < now - timedelta(seconds=Config.CHUNKED_UPLOAD_RETENTION)
+        )
+        finished.delete(synchronize_session=False)
+        db.session.commit()
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -12,10 +13,104 @@ class Config:
     GOOGLE_CLIENT_ID = os.environ.get('GOOGLE_CLIENT_ID', '')
     GOOGLE_CLIENT_SECRET = os.environ.get('GOOGLE_CLIENT_SECRET', '')
     
+    # When to create missing database tables: 'background' (at startup, without
+    # delaying requests), 'startup' (before serving) or 'off' (use `flask init-db`)
+    DB_SCHEMA_SETUP = os.environ.get('DB_SCHEMA_SETUP', 'background')
+    
     # Upload settings
     UPLOAD_FOLDER = '/tmp'
     MAX_CONTENT_LENGTH = 500 * 1024 * 1024  # 500 MB
     
+    # Files page listing (streamed, see DriveService.iter_files)
+    FILES_FIRST_PAGE_SIZE = 100  # Small first page so rows appear quickly
+    FILES_PAGE_SIZE = 1000  # Drive's maximum for the following pages
+    FILES_MAX_RESULTS = 5000
+    FILES_VALIDATOR_TTL = 15  # Seconds a listing ETag is trusted without asking Drive
+    
+    # Drive upload tuning (see upload_tuning.py)
+    UPLOAD_SIMPLE_MAX_SIZE = 5 * 1024 * 1024  # Single-request upload up to 5 MB
+    UPLOAD_CHUNK_MIN_SIZE = 1024 * 1024  # 1 MB
+    UPLOAD_CHUNK_MAX_SIZE = 128 * 1024 * 1024  # 128 MB
+    UPLOAD_CHUNK_INITIAL_SIZE = 8 * 1024 * 1024  # 8 MB before throughput is known
+    UPLOAD_CHUNK_TARGET_SECONDS = 4.0  # Aim for chunks that take this long
+    UPLOAD_MAX_CHUNK_RETRIES = 5  # Consecutive failed chunks before giving up
+    
+    # Browser-to-Drive uploads (see /upload/direct/session)
+    DIRECT_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # Must be a multiple of 256 KB
+    DIRECT_UPLOAD_MAX_RETRIES = 5  # Consecutive failed chunks before the browser gives up
+    
+    # Temporary files of transfers (see scratch_space.py)
+    SCRATCH_DIR = os.environ.get('SCRATCH_DIR', os.path.join(tempfile.gettempdir(), 'drive-scratch'))
+    SCRATCH_MAX_BYTES = int(os.environ.get('SCRATCH_MAX_BYTES', 8 * 1024 * 1024 * 1024))  # Shared by all workers
+    SCRATCH_DEFAULT_RESERVATION = 512 * 1024 * 1024  # Reserved when a transfer's size is unknown
+    SCRATCH_WAIT_SECONDS = 120  # A transfer waits this long for space before failing
+    SCRATCH_MAX_AGE = 6 * 60 * 60  # Unowned entries untouched for this long are deleted
+    SCRATCH_JANITOR_INTERVAL = 60  # Seconds between janitor passes
+    
+    # Chunked browser-to-server uploads (see chunked_upload.py), spooled in scratch space
+    CHUNKED_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # 8 MB per request
+    CHUNKED_UPLOAD_PARALLEL = 3  # Chunks the browser sends at once
+    CHUNKED_UPLOAD_MAX_RETRIES = 5  # Attempts per chunk before the browser gives up
+    CHUNKED_UPLOAD_MAX_SIZE = 2 * 1024 * 1024 * 1024  # 2 GB spooled on disk
+    CHUNKED_UPLOAD_IDLE_SECONDS = 600  # Drop uploads that stop receiving chunks
+    CHUNKED_UPLOAD_FINALIZE_WAIT = 5  # Seconds finalize waits for Drive before answering 202
+    CHUNKED_UPLOAD_POLL_SECONDS = 0.5  # How often the holder pulls chunks other instances received
+    CHUNKED_UPLOAD_HEARTBEAT_SECONDS = 10
+    CHUNKED_UPLOAD_HOLDER_TIMEOUT = 60  # Uploads of a holder silent for this long are lost
+    CHUNKED_UPLOAD_RETENTION = 60 * 60  # Seconds a finished upload's outcome stays readable
+    
+    # Archive expansion (see archive_import.py)
+    ARCHIVE_IMPORT_WORKERS = 4  # Concurrent entry uploads per archive
+    ARCHIVE_BUFFER_BYTES = 64 * 1024 * 1024  # In-memory budget for tar entries
+    ARCHIVE_MAX_ENTRIES = 10000
+    
+    # Thumbnail proxy cache (see thumbnail_cache.py)
+    THUMBNAIL_CACHE_DIR = os.environ.get(
+        'THUMBNAIL_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'drive-thumbnails')
+    )
+    THUMBNAIL_CACHE_MAX_BYTES = 256 * 1024 * 1024  # 256 MB on disk
+    THUMBNAIL_CACHE_TTL = 24 * 60 * 60  # Revalidate with Google after a day
+    THUMBNAIL_BROWSER_MAX_AGE = 30 * 24 * 60 * 60  # Versioned URLs, cache for 30 days
+    THUMBNAIL_SIZE = 220
+    
+    # Identical read-only Drive calls in flight at once share one request
+    # (see single_flight.py); results are also reused for this many seconds
+    DRIVE_READ_CACHE_TTL = float(os.environ.get('DRIVE_READ_CACHE_TTL', '1.0'))
+    
+    # Streaming downloads (see DriveService.open_download)
+    DOWNLOAD_CHUNK_SIZE = 256 * 1024  # Bytes read from Drive per chunk
+    DOWNLOAD_TIMEOUT = 60  # Seconds to wait for Drive between chunks
+    
+    # Bulk URL import (see bulk_import.py)
+    BULK_IMPORT_WORKERS = 6  # Concurrent imports per batch
+    BULK_IMPORT_PER_HOST = 2  # Concurrent downloads from any one host, across all batches
+    BULK_IMPORT_HOST_DELAY = 1.0  # Seconds between download starts on one host
+    BULK_IMPORT_MAX_URLS = 500
+    
+    # URL downloads (see fetch_strategy.py)
+    FETCH_STRATEGY_TTL = 6 * 60 * 60  # Seconds a host's working/refused strategies are trusted
+    FETCH_STRATEGY_MAX_HOSTS = 4096
+    FETCH_CHUNK_SIZE = 256 * 1024  # Bytes read per chunk
+    
+    # YouTube playlist and channel import (see playlist_import.py)
+    YOUTUBE_PLAYLIST_WORKERS = int(os.environ.get('YOUTUBE_PLAYLIST_WORKERS', 3))  # Videos at once
+    YOUTUBE_PLAYLIST_MAX_VIDEOS = 200
+    
+    # Database-backed transfer queue (see transfer_jobs.py)
+    TRANSFER_QUEUE_ENABLED = os.environ.get('TRANSFER_QUEUE_ENABLED', '').lower() in ('1', 'true', 'yes')
+    TRANSFER_WORKER_THREADS = int(os.environ.get('TRANSFER_WORKER_THREADS', 2))  # Per instance
+    TRANSFER_LEASE_SECONDS = 60  # A job is reclaimed if not renewed within this
+    TRANSFER_HEARTBEAT_SECONDS = 15
+    TRANSFER_POLL_SECONDS = 2.0  # Idle workers check the queue this often
+    TRANSFER_MAX_ATTEMPTS = 3
+    TRANSFER_RETRY_BACKOFF_SECONDS = 30  # Doubled after each failed attempt
+    
+    # Transfer history for throughput analytics (see transfer_history.py)
+    TRANSFER_HISTORY_ENABLED = os.environ.get('TRANSFER_HISTORY_ENABLED', '1').lower() in ('1', 'true', 'yes')
+    TRANSFER_HISTORY_MAX_QUEUED = 10000  # Records waiting for the writer before new ones are dropped
+    TRANSFER_HISTORY_BATCH_SIZE = 200  # Records inserted per transaction
+    TRANSFER_STATS_MAX_HOURS = 24 * 31  # Longest window /api/transfers/stats aggregates
+    
     # Allowed file extensions
     ALLOWED_EXTENSIONS = {
         # Documents
@@ -1,24 +1,133 @@
 import os
-import tempfile
+import re
+import json
+import hashlib
+import time
 import requests
 import logging
-import cloudscraper
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload, MediaIoBaseUpload
+import threading
+import httplib2
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseUpload
 from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from io import BytesIO
-from urllib.parse import urlparse
+from google.auth.transport.requests import Request, AuthorizedSession
+from urllib.parse import urlparse, parse_qs
+from config import Config
+from metrics import metrics
 from models import File
-from utils import get_mime_type
+from upload_tuning import AdaptiveMediaIoBaseUpload, ChunkTuner, use_simple_upload
+from single_flight import SingleFlight
+from scratch_space import scratch
+import transfer_history
 
 logger = logging.getLogger(__name__)
 
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+
+# File resource fields requested for listings
+FILE_FIELDS = "id, name, mimeType, createdTime, modifiedTime, size, webViewLink, thumbnailLink"
+
+# Read-only API calls shared between concurrent identical requests
+read_flight = SingleFlight('drive.read', ttl=Config.DRIVE_READ_CACHE_TTL)
+
+# Chunk responses worth retrying (rate limiting and transient server errors)
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+# Hosts serving Google Drive file links, and the path forms that carry a file ID
+DRIVE_HOSTS = ('drive.google.com', 'docs.google.com', 'drive.usercontent.google.com')
+DRIVE_PATH_ID = re.compile(
+    r'/(?:file|document|spreadsheets|presentation|drawings|forms)/(?:u/\d+/)?d/([A-Za-z0-9_-]{10,})'
+)
+DRIVE_ID = re.compile(r'^[A-Za-z0-9_-]{10,}$')
+
+def parse_drive_url(url):
+    """Extract the file ID (and resource key) from a Google Drive or Docs link.
+    
+    Args:
+        url (str): URL given by the user
+        
+    Returns:
+        tuple: (file_id, resource_key or None), or None if the URL is not a
+            link to a single Drive file
+    """
+    parsed = urlparse(url)
+    host = (parsed.hostname or '').lower()
+    if host not in DRIVE_HOSTS:
+        return None
+    query = parse_qs(parsed.query)
+    resource_key = query.get('resourcekey', [None])[0]
+    match = DRIVE_PATH_ID.search(parsed.path)
+    if match:
+        return match.group(1), resource_key
+    # open?id=..., uc?id=...&export=download, download?id=...
+    file_id = query.get('id', [None])[0]
+    if file_id and DRIVE_ID.match(file_id) and '/folders' not in parsed.path:
+        return file_id, resource_key
+    return None
+
+def drive_download_url(file_id, resource_key=None):
+    """Direct download URL for a Drive file that skips the virus-scan interstitial."""
+    url = f"https://drive.usercontent.google.com/download?id={file_id}&export=download&confirm=t"
+    if resource_key:
+        url += f"&resourcekey={resource_key}"
+    return url
+
+class FileListing:
+    """Single-pass iterable over pages of File objects.
+    
+    Fetching happens while iterating, so a streamed template can flush rows
+    before later pages arrive. A failure is logged and stored in `error`
+    instead of being raised, because by then the response has already
+    started; templates check it after the loop.
+    """
+    
+    def __init__(self, pages):
+        """Initialize the listing.
+        
+        Args:
+            pages (iterator): Iterator yielding (list of File objects, whether
+                more pages follow) tuples
+        """
+        self._pages = pages
+        self._buffer = []
+        self._exhausted = False
+        self.error = None
+    
+    def _fill(self):
+        """Fetch pages until the buffer has an item or the listing ends."""
+        while not self._buffer and not self._exhausted:
+            try:
+                page, more = next(self._pages)
+                self._buffer = list(page)
+                self._exhausted = not more
+            except StopIteration:
+                self._exhausted = True
+            except Exception as e:
+                logger.error(f"Error listing files: {str(e)}")
+                self.error = f"Failed to list files: {str(e)}"
+                self._exhausted = True
+    
+    def __bool__(self):
+        self._fill()
+        return bool(self._buffer)
+    
+    def __iter__(self):
+        while True:
+            self._fill()
+            if not self._buffer:
+                return
+            # Hand out the current page and release it
+            page, self._buffer = self._buffer, []
+            yield from page
+
+
 class DriveService:
     """Service class for Google Drive operations."""
     
-    def __init__(self, api_key=None, client_id=None, client_secret=None, user_credentials=None):
+    def __init__(self, api_key=None, client_id=None, client_secret=None, user_credentials=None,
+                 cancelled=None):
         """Initialize the Drive service.
         
         Args:
@@ -26,12 +135,52 @@ class DriveService:
             client_id (str, optional): Google OAuth client ID
             client_secret (str, optional): Google OAuth client secret
             user_credentials (dict, optional): User's OAuth credentials with token and refresh_token
+            cancelled (threading.Event, optional): Once set, writes to Drive stop with an
+                error before the next upload, chunk, copy or folder
         """
         self.api_key = api_key or os.environ.get('GOOGLE_API_KEY')
         self.client_id = client_id or os.environ.get('GOOGLE_CLIENT_ID')
         self.client_secret = client_secret or os.environ.get('GOOGLE_CLIENT_SECRET')
         self.user_credentials = user_credentials
-        self.service = self._build_service()
+        self.cancelled = cancelled
+        self._credentials = None
+        # Whose data this instance reads, for sharing identical reads
+        owner = (user_credentials or {}).get('refresh_token') or \
+            (user_credentials or {}).get('token') or self.api_key or ''
+        self._owner = hashlib.sha1(owner.encode('utf-8')).hexdigest()
+        # httplib2 connections are not thread-safe, so every thread that uses
+        # this instance gets its own client (see the service property)
+        self._local = threading.local()
+        self._local.service = self._build_service()
+    
+    @property
+    def service(self):
+        """The Drive API client for the calling thread."""
+        service = getattr(self._local, 'service', None)
+        if service is None:
+            service = self._local.service = self._build_service()
+        return service
+    
+    def _shared_read(self, key, call):
+        """Run a read-only API call, sharing it with concurrent identical calls.
+        
+        Args:
+            key (tuple): API method name followed by every parameter of the call
+            call (callable): Executes the request
+            
+        Returns:
+            dict: The API response (shared, do not modify)
+        """
+        return read_flight.do(self._owner, key, call)
+    
+    def invalidate_reads(self):
+        """Make reads after a change go to Drive instead of a shared result."""
+        read_flight.invalidate(self._owner)
+    
+    def check_cancelled(self):
+        """Raise if the transfer using this instance was cancelled."""
+        if self.cancelled is not None and self.cancelled.is_set():
+            raise Exception("Transfer cancelled")
     
     def _build_service(self):
         """Build and return a Drive service object."""
@@ -46,16 +195,59 @@ class DriveService:
                     token_uri='https://oauth2.googleapis.com/token',
                     scopes=['https://www.googleapis.com/auth/drive']
                 )
-                service = build('drive', 'v3', credentials=creds)
-                return service
+                self._credentials = creds
+                return self._build('drive', 'v3', credentials=creds)
             else:
                 # Fall back to API key for limited access
-                service = build('drive', 'v3', developerKey=self.api_key)
-                return service
+                return self._build('drive', 'v3', developerKey=self.api_key)
         except Exception as e:
             logger.error(f"Error building Drive service: {str(e)}")
             raise Exception(f"Failed to initialize Google Drive service: {str(e)}")
     
+    def _build(self, service_name, version, **kwargs):
+        """Build an API client, honouring the GOOGLE_DRIVE_ROOT_URL override.
+
+        When GOOGLE_DRIVE_ROOT_URL is set (e.g. to a local stand-in server used
+        by the benchmarks), the bundled discovery document is rewritten so that
+        regular, upload and batch requests all go to that root instead of
+        https://www.googleapis.com/.
+
+        Args:
+            service_name (str): API name, e.g. 'drive'
+            version (str): API version, e.g. 'v3'
+
+        Returns:
+            Resource: The API client
+        """
+        root_url = os.environ.get('GOOGLE_DRIVE_ROOT_URL')
+        if not root_url:
+            return build(service_name, version, **kwargs)
+
+        if not root_url.endswith('/'):
+            root_url += '/'
+        document = json.loads(get_static_doc(service_name, version))
+        document['rootUrl'] = root_url
+        document['baseUrl'] = root_url + document['servicePath']
+        return build_from_document(document, **kwargs)
+
+    @staticmethod
+    def _rest_url(path):
+        """URL of a Drive REST endpoint, honouring the GOOGLE_DRIVE_ROOT_URL override.
+        
+        Used for the requests the API client can't stream (media downloads and
+        upload sessions handed to the browser).
+        
+        Args:
+            path (str): Path below the root, e.g. 'drive/v3/files'
+            
+        Returns:
+            str: Absolute URL
+        """
+        root_url = os.environ.get('GOOGLE_DRIVE_ROOT_URL') or 'https://www.googleapis.com/'
+        if not root_url.endswith('/'):
+            root_url += '/'
+        return root_url + path
+    
     def list_files(self, max_results=100):
         """List files in Google Drive.
         
@@ -66,30 +258,123 @@ class DriveService:
             list: List of File objects
         """
         try:
-            results = self.service.files().list(
-                pageSize=max_results,
-                fields="files(id, name, mimeType, createdTime, size, webViewLink)"
-            ).execute()
-            
-            items = results.get('files', [])
-            files = []
-            
-            for item in items:
-                file = File(
-                    file_id=item.get('id', ''),
-                    name=item.get('name', 'Unnamed'),
-                    mime_type=item.get('mimeType', 'unknown/unknown'),
-                    created_time=item.get('createdTime', ''),
-                    size=int(item.get('size', 0)) if item.get('size') else 0,
-                    web_view_link=item.get('webViewLink', '')
-                )
-                files.append(file)
+            fields = f"files({FILE_FIELDS})"
+            results = self._shared_read(
+                ('files.list', max_results, None, fields),
+                lambda: self.service.files().list(pageSize=max_results, fields=fields).execute()
+            )
             
-            return files
+            return [self._to_file(item) for item in results.get('files', [])]
         except Exception as e:
             logger.error(f"Error listing files: {str(e)}")
             raise Exception(f"Failed to list files: {str(e)}")
     
+    def iter_files(self, first_page_size=100, page_size=1000, max_results=None):
+        """Lazily list files in Google Drive, one API page at a time.
+        
+        The first page is kept small so the first rows are available quickly;
+        later pages use the larger page size to save round trips.
+        
+        Args:
+            first_page_size (int, optional): Size of the first page
+            page_size (int, optional): Size of the following pages
+            max_results (int, optional): Stop after this many files
+            
+        Returns:
+            FileListing: Single-pass iterable of File objects
+        """
+        def pages():
+            page_token = None
+            remaining = max_results
+            size = first_page_size
+            while True:
+                if remaining is not None:
+                    size = min(size, remaining)
+                    if size <= 0:
+                        return
+                fields = f"nextPageToken, files({FILE_FIELDS})"
+                results = self._shared_read(
+                    ('files.list', size, page_token, fields),
+                    lambda: self.service.files().list(
+                        pageSize=size, pageToken=page_token, fields=fields
+                    ).execute()
+                )
+                items = results.get('files', [])
+                page_token = results.get('nextPageToken')
+                if remaining is not None:
+                    remaining -= len(items)
+                more = bool(page_token) and (remaining is None or remaining > 0)
+                yield [self._to_file(item) for item in items], more
+                
+                if not more:
+                    return
+                size = page_size
+        
+        return FileListing(pages())
+    
+    def get_listing_validator(self, max_results=None):
+        """Return a string that changes whenever the file listing may have changed.
+        
+        Uses the changes feed start page token, which costs one tiny API call
+        and moves forward with every change in the user's Drive. API-key
+        access cannot read the changes feed, so in that case the IDs and
+        modification times of the listed files are hashed instead.
+        
+        Args:
+            max_results (int, optional): Hash at most this many files, matching
+                the listing the validator describes
+        
+        Returns:
+            str: Opaque validator
+        """
+        try:
+            result = self._shared_read(
+                ('changes.getStartPageToken',),
+                lambda: self.service.changes().getStartPageToken().execute()
+            )
+            return f"changes:{result['startPageToken']}"
+        except Exception as e:
+            logger.debug(f"Changes feed unavailable, hashing listing instead: {str(e)}")
+        
+        try:
+            digest = hashlib.sha1()
+            page_token = None
+            remaining = max_results
+            while True:
+                size = 1000 if remaining is None else min(1000, remaining)
+                fields = "nextPageToken, files(id, modifiedTime)"
+                results = self._shared_read(
+                    ('files.list', size, page_token, fields),
+                    lambda: self.service.files().list(
+                        pageSize=size, pageToken=page_token, fields=fields
+                    ).execute()
+                )
+                items = results.get('files', [])
+                for item in items:
+                    digest.update(f"{item.get('id')}:{item.get('modifiedTime')};".encode('utf-8'))
+                page_token = results.get('nextPageToken')
+                if remaining is not None:
+                    remaining -= len(items)
+                if not page_token or (remaining is not None and remaining <= 0):
+                    return f"listing:{digest.hexdigest()}"
+        except Exception as e:
+            logger.error(f"Error computing listing validator: {str(e)}")
+            raise Exception(f"Failed to compute listing validator: {str(e)}")
+    
+    @staticmethod
+    def _to_file(item):
+        """Convert a Drive API file resource into a File."""
+        return File(
+            file_id=item.get('id', ''),
+            name=item.get('name', 'Unnamed'),
+            mime_type=item.get('mimeType', 'unknown/unknown'),
+            created_time=item.get('createdTime', ''),
+            size=int(item.get('size', 0)) if item.get('size') else 0,
+            web_view_link=item.get('webViewLink', ''),
+            thumbnail_link=item.get('thumbnailLink'),
+            modified_time=item.get('modifiedTime', '')
+        )
+    
     def upload_file(self, file_obj, filename, mime_type=None):
         """Upload a file to Google Drive.
         
@@ -102,42 +387,66 @@ class DriveService:
             str: ID of the uploaded file
         """
         try:
-            # Save the file temporarily
-            temp_file = tempfile.NamedTemporaryFile(delete=False)
-            file_obj.save(temp_file.name)
-            temp_file.close()
-            
             # Create file metadata
             file_metadata = {'name': filename}
             
-            # Create media
-            media = MediaFileUpload(
-                temp_file.name,
-                mimetype=mime_type,
-                resumable=True
-            )
-            
-            # Upload file
-            file = self.service.files().create(
-                body=file_metadata,
-                media_body=media,
-                fields='id'
-            ).execute()
+            # Werkzeug already spooled the body (in memory or a self-deleting
+            # temporary file); upload from there instead of copying it again
+            stream = file_obj.stream
+            if stream.seekable():
+                size = stream.seek(0, os.SEEK_END)
+                stream.seek(0)
+                file = self._upload_media(file_metadata, stream, mime_type, size)
+                return file.get('id')
             
-            # Clean up temporary file
-            os.unlink(temp_file.name)
+            # Not seekable: save it in scratch space, deleted when the block exits
+            with scratch.allocate(file_obj.content_length or None, prefix='upload-') as allocation:
+                file_obj.save(allocation.path)
+                size = os.path.getsize(allocation.path)
+                allocation.resize(size)
+                with open(allocation.path, 'rb') as fh:
+                    file = self._upload_media(file_metadata, fh, mime_type, size)
             
             return file.get('id')
         except Exception as e:
             logger.error(f"Error uploading file: {str(e)}")
-            # Clean up temporary file if it exists
-            if 'temp_file' in locals() and os.path.exists(temp_file.name):
-                os.unlink(temp_file.name)
             raise Exception(f"Failed to upload file: {str(e)}")
     
+    def copy_file(self, file_id, resource_key=None, parent_id=None):
+        """Copy a Drive file into this user's Drive on Google's side.
+        
+        Args:
+            file_id (str): ID of the file to copy
+            resource_key (str, optional): Resource key from the share link
+            parent_id (str, optional): Destination folder (defaults to My Drive)
+            
+        Returns:
+            str: ID of the copy
+        
+        Raises:
+            HttpError: If Drive refuses the copy
+        """
+        self.check_cancelled()
+        request = self.service.files().copy(
+            fileId=file_id,
+            body={'parents': [parent_id or 'root']},
+            fields='id, name',
+            supportsAllDrives=True
+        )
+        if resource_key:
+            # Needed for link-shared files created before Drive's 2021 security update
+            request.headers['X-Goog-Drive-Resource-Keys'] = f"{file_id}/{resource_key}"
+        copied = request.execute(num_retries=2)
+        self.invalidate_reads()
+        return copied.get('id')
+    
     def upload_from_url(self, url):
         """Download a file from a URL and upload it to Google Drive.
-        Uses CloudScraper to bypass Cloudflare and CAPTCHA protections.
+        Uses CloudScraper for hosts behind Cloudflare and CAPTCHA protections.
+        
+        Links to Google Drive files are copied server-side instead, so no
+        bytes pass through this app; the download path is used if Drive does
+        not allow the copy or there is no OAuth user to own the copy.
         
         Args:
             url (str): URL to download from
@@ -145,74 +454,374 @@ class DriveService:
         Returns:
             str: ID of the uploaded file
         """
+        self.check_cancelled()
+        drive_file = parse_drive_url(url)
+        if drive_file and not self.user_credentials:
+            # files.copy needs an OAuth user; an API key alone gets 401
+            url = drive_download_url(*drive_file)
+        elif drive_file:
+            file_id, resource_key = drive_file
+            try:
+                copy_id = self.copy_file(file_id, resource_key)
+                metrics.incr('drive.import.server_copy')
+                return copy_id
+            except HttpError as e:
+                if e.resp.status not in (400, 401, 403, 404):
+                    logger.error(f"Error copying Drive file {file_id}: {str(e)}")
+                    raise Exception(f"Failed to copy Drive file: {str(e)}")
+                # Not shared with this user in a way that allows copying (or
+                # the credentials can't copy at all); stream it instead, avoiding the virus-scan interstitial page
+                logger.info(f"Drive copy of {file_id} not permitted ({e.resp.status}), downloading")
+                metrics.incr('drive.import.server_copy_fallback')
+                url = drive_download_url(file_id, resource_key)
+        
         try:
-            # Import the download_with_cloudscraper function
             from utils import download_with_cloudscraper
             
-            # Download file using CloudScraper to bypass protection
-            filename, content, content_type = download_with_cloudscraper(url)
+            # Download once; the fetcher already falls back between strategies
+            # and resumes interrupted transfers, so failing here is final
+            filename, body, content_type = download_with_cloudscraper(url)
             
             # Create file metadata
             file_metadata = {'name': filename}
             
-            # Create media
-            fh = BytesIO(content)
-            media = MediaIoBaseUpload(
-                fh, 
-                mimetype=content_type,
-                resumable=True
+            # Upload file to Google Drive straight from the download buffer
+            file = self._upload_media(file_metadata, body, content_type, body.getbuffer().nbytes)
+            
+            return file.get('id')
+        except Exception as e:
+            logger.error(f"Error uploading from URL: {str(e)}")
+            raise Exception(f"Failed to upload from URL: {str(e)}")
+    
+    def fetch_thumbnail(self, file_id, size=220, etag=None, last_modified=None):
+        """Fetch the thumbnail image Drive generated for a file.
+        
+        Args:
+            file_id (str): ID of the file
+            size (int, optional): Longest edge of the thumbnail in pixels
+            etag (str, optional): Validator of a cached copy (sent as If-None-Match)
+            last_modified (str, optional): Validator of a cached copy (sent as If-Modified-Since)
+            
+        Returns:
+            dict: status (200 or 304), content, content_type, etag and
+                last_modified; None if Drive has no thumbnail for the file
+        """
+        try:
+            meta = self._shared_read(
+                ('files.get', file_id, 'thumbnailLink'),
+                lambda: self.service.files().get(fileId=file_id, fields='thumbnailLink').execute()
+            )
+            link = meta.get('thumbnailLink')
+            if not link:
+                return None
+            
+            # Thumbnail links end in "=s<size>"; ask for the size we display
+            link = re.sub(r'=s\d+$', f'=s{int(size)}', link)
+            
+            headers = {}
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+            
+            # Thumbnails of private files need the user's credentials
+            session = AuthorizedSession(self._credentials) if self._credentials else requests.Session()
+            with session:
+                response = session.get(link, headers=headers, timeout=30)
+            if response.status_code == 404:
+                return None
+            if response.status_code != 304:
+                response.raise_for_status()
+            
+            return {
+                'status': response.status_code,
+                'content': response.content if response.status_code == 200 else None,
+                'content_type': response.headers.get('Content-Type', 'image/jpeg'),
+                'etag': response.headers.get('ETag') or etag,
+                'last_modified': response.headers.get('Last-Modified') or last_modified
+            }
+        except Exception as e:
+            logger.error(f"Error fetching thumbnail: {str(e)}")
+            raise Exception(f"Failed to fetch thumbnail: {str(e)}")
+    
+    def open_download(self, file_id, range_header=None):
+        """Open a streaming download of a file's content.
+        
+        The media is requested with alt=media and read in DOWNLOAD_CHUNK_SIZE
+        pieces as the caller iterates, so memory use does not depend on the
+        file size. A Range header is passed through to Drive unchanged.
+        
+        Args:
+            file_id (str): ID of the file
+            range_header (str, optional): Client Range header, e.g. "bytes=0-1023"
+        
+        Returns:
+            dict: status (200, 206 or 416), name, mime_type, size, content_length,
+                content_range and chunks (an iterator of bytes that releases
+                the connection when exhausted or closed)
+        """
+        try:
+            fields = 'id, name, mimeType, size'
+            meta = self._shared_read(
+                ('files.get', file_id, fields),
+                lambda: self.service.files().get(fileId=file_id, fields=fields).execute()
+            )
+            if meta.get('mimeType', '').startswith('application/vnd.google-apps.'):
+                raise Exception(f"{meta.get('name')} is a Google Workspace file and has no downloadable content")
+            
+            params = {'alt': 'media'}
+            if not self._credentials and self.api_key:
+                params['key'] = self.api_key
+            # The bytes are relayed with the upstream Content-Length, so they
+            # must arrive exactly as stored, not gzip-encoded for the hop
+            headers = {'Accept-Encoding': 'identity'}
+            if range_header:
+                headers['Range'] = range_header
+            
+            session = AuthorizedSession(self._credentials) if self._credentials else requests.Session()
+            response = session.get(self._rest_url(f"drive/v3/files/{file_id}"), params=params,
+                                   headers=headers, stream=True, timeout=Config.DOWNLOAD_TIMEOUT)
+            if response.status_code == 416:
+                response.close()
+                session.close()
+                return {
+                    'status': 416,
+                    'name': meta.get('name'),
+                    'mime_type': meta.get('mimeType'),
+                    'size': int(meta.get('size', 0)),
+                    'content_length': 0,
+                    'content_range': f"bytes */{meta.get('size', 0)}",
+                    'chunks': iter(())
+                }
+            if response.status_code >= 400:
+                response.close()
+                session.close()
+                response.raise_for_status()
+            
+            def chunks():
+                sent = 0
+                try:
+                    for chunk in response.iter_content(Config.DOWNLOAD_CHUNK_SIZE):
+                        sent += len(chunk)
+                        yield chunk
+                finally:
+                    response.close()
+                    session.close()
+                    metrics.incr('drive.download.bytes', sent)
+            
+            metrics.incr(f"drive.download.status_{response.status_code}")
+            content_length = response.headers.get('Content-Length')
+            if response.headers.get('Content-Encoding', 'identity') != 'identity':
+                # Encoded anyway: iter_content decodes it, so the length is wrong
+                content_length = None
+            return {
+                'status': response.status_code,
+                'name': meta.get('name'),
+                'mime_type': response.headers.get('Content-Type') or meta.get('mimeType'),
+                'size': int(meta.get('size', 0)),
+                'content_length': content_length,
+                'content_range': response.headers.get('Content-Range'),
+                'chunks': chunks()
+            }
+        except Exception as e:
+            logger.error(f"Error opening download: {str(e)}")
+            raise Exception(f"Failed to download file: {str(e)}")
+
+    def create_folder(self, name, parent_id=None):
+        """Create a folder in Google Drive.
+        
+        Args:
+            name (str): Folder name
+            parent_id (str, optional): ID of the parent folder (defaults to My Drive)
+            
+        Returns:
+            str: ID of the created folder
+        """
+        try:
+            self.check_cancelled()
+            file_metadata = {'name': name, 'mimeType': FOLDER_MIME_TYPE}
+            if parent_id:
+                file_metadata['parents'] = [parent_id]
+            folder = self.service.files().create(body=file_metadata, fields='id').execute()
+            self.invalidate_reads()
+            return folder.get('id')
+        except Exception as e:
+            logger.error(f"Error creating folder: {str(e)}")
+            raise Exception(f"Failed to create folder: {str(e)}")
+    
+    def upload_stream(self, fh, filename, mime_type=None, size=None, parent_id=None):
+        """Upload a readable stream to Google Drive.
+        
+        Args:
+            fh (io.Base): Seekable file-like object positioned at the start
+            filename (str): Name of the file in Drive
+            mime_type (str, optional): MIME type of the content
+            size (int, optional): Size in bytes, if known
+            parent_id (str, optional): ID of the destination folder
+            
+        Returns:
+            str: ID of the uploaded file
+        """
+        try:
+            file_metadata = {'name': filename}
+            if parent_id:
+                file_metadata['parents'] = [parent_id]
+            file = self._upload_media(file_metadata, fh, mime_type, size)
+            return file.get('id')
+        except Exception as e:
+            logger.error(f"Error uploading stream: {str(e)}")
+            raise Exception(f"Failed to upload file: {str(e)}")
+    
+    def create_upload_session(self, filename, mime_type, size, parent_id=None, origin=None):
+        """Start a resumable upload that the browser completes on its own.
+        
+        The session URI authorizes uploads to this one file by itself, so the
+        client can PUT chunks straight to Google without our server relaying
+        the content or holding the user's access token.
+        
+        Args:
+            filename (str): Name of the file in Drive
+            mime_type (str): MIME type of the content
+            size (int): Size in bytes
+            parent_id (str, optional): ID of the destination folder
+            origin (str, optional): Origin of the page that will upload, so Google
+                answers its cross-origin chunk requests
+        
+        Returns:
+            str: The resumable session URI
+        """
+        try:
+            if not self._credentials:
+                raise Exception("Direct uploads need a signed-in Google account")
+            
+            file_metadata = {'name': filename}
+            if parent_id:
+                file_metadata['parents'] = [parent_id]
+            headers = {
+                'X-Upload-Content-Type': mime_type,
+                'X-Upload-Content-Length': str(size),
+                'Content-Type': 'application/json; charset=UTF-8'
+            }
+            if origin:
+                headers['Origin'] = origin
+            
+            with AuthorizedSession(self._credentials) as session:
+                response = session.post(
+                    self._rest_url('upload/drive/v3/files'),
+                    params={'uploadType': 'resumable', 'fields': 'id, name, mimeType, size'},
+                    data=json.dumps(file_metadata),
+                    headers=headers,
+                    timeout=30
+                )
+            response.raise_for_status()
+            metrics.incr('upload.direct.sessions')
+            return response.headers['Location']
+        except Exception as e:
+            logger.error(f"Error creating upload session: {str(e)}")
+            raise Exception(f"Failed to create upload session: {str(e)}")
+    
+    def get_file(self, file_id):
+        """Get a file's metadata.
+        
+        Args:
+            file_id (str): ID of the file
+        
+        Returns:
+            File: The file
+        """
+        try:
+            item = self._shared_read(
+                ('files.get', file_id, FILE_FIELDS),
+                lambda: self.service.files().get(fileId=file_id, fields=FILE_FIELDS).execute()
             )
+            return self._to_file(item)
+        except Exception as e:
+            logger.error(f"Error getting file: {str(e)}")
+            raise Exception(f"Failed to get file: {str(e)}")
+    
+    @transfer_history.timed('upload')
+    def _upload_media(self, file_metadata, fh, mime_type, size=None):
+        """Upload a stream to Google Drive with a per-transfer strategy.
+
+        Transfers up to UPLOAD_SIMPLE_MAX_SIZE go out as one multipart request,
+        skipping the resumable session round trip. Larger ones use a resumable
+        session whose chunk size is tuned by ChunkTuner from the measured
+        throughput and error rate; failed chunks are resumed, not restarted.
+        
+        Args:
+            file_metadata (dict): Drive file metadata (name, parents...)
+            fh (io.Base): Seekable file-like object positioned at the start
+            mime_type (str): MIME type of the content
+            size (int, optional): Total size in bytes, if known
             
-            # Upload file to Google Drive
-            file = self.service.files().create(
+        Returns:
+            dict: The created file resource (fields: id)
+        """
+        self.check_cancelled()
+        mime_type = mime_type or 'application/octet-stream'
+        
+        if use_simple_upload(size):
+            metrics.incr('drive.upload.simple')
+            metrics.observe('drive.upload.simple_size', size)
+            media = MediaIoBaseUpload(fh, mimetype=mime_type, resumable=False)
+            created = self.service.files().create(
                 body=file_metadata,
                 media_body=media,
                 fields='id'
             ).execute()
-            
-            return file.get('id')
-        except Exception as e:
-            logger.error(f"Error uploading from URL: {str(e)}")
-            # If CloudScraper failed, try the regular approach as fallback
+            self.invalidate_reads()
+            transfer_history.add_bytes(size)
+            return created
+        
+        metrics.incr('drive.upload.resumable')
+        tuner = ChunkTuner(size)
+        media = AdaptiveMediaIoBaseUpload(fh, mime_type, tuner)
+        request = self.service.files().create(
+            body=file_metadata,
+            media_body=media,
+            fields='id'
+        )
+        
+        response = None
+        failures = 0
+        while response is None:
+            self.check_cancelled()
+            offset = request.resumable_progress
+            chunk_size = tuner.chunk_size
+            started = time.monotonic()
             try:
-                logger.info(f"Attempting fallback download for URL: {url}")
-                
-                # Download file from URL with standard requests
-                response = requests.get(url, stream=True)
-                response.raise_for_status()
-                
-                # Get filename from URL
-                filename = url.split('/')[-1]
-                if '?' in filename:
-                    filename = filename.split('?')[0]
-                if not filename or filename == '':
-                    filename = 'downloaded_file'
-                
-                # Determine content type
-                content_type = response.headers.get('content-type', 'application/octet-stream')
-                
-                # Create file metadata
-                file_metadata = {'name': filename}
-                
-                # Create media
-                fh = BytesIO(response.content)
-                media = MediaIoBaseUpload(
-                    fh,
-                    mimetype=content_type,
-                    resumable=True
-                )
-                
-                # Upload file
-                file = self.service.files().create(
-                    body=file_metadata,
-                    media_body=media,
-                    fields='id'
-                ).execute()
-                
-                return file.get('id')
-            except Exception as fallback_error:
-                logger.error(f"Fallback also failed: {str(fallback_error)}")
-                raise Exception(f"Failed to upload from URL: {str(e)}. Fallback also failed: {str(fallback_error)}")
+                _, response = request.next_chunk()
+            except HttpError as e:
+                if e.resp.status not in RETRYABLE_STATUSES:
+                    raise
+                failures += 1
+                error = e
+            except (httplib2.HttpLib2Error, OSError) as e:
+                failures += 1
+                error = e
+            else:
+                failures = 0
+                if response is None:
+                    sent = request.resumable_progress - offset
+                else:
+                    sent = min(chunk_size, media.size() - offset)
+                tuner.record_chunk(sent, time.monotonic() - started)
+                continue
+            
+            tuner.record_error()
+            if failures > Config.UPLOAD_MAX_CHUNK_RETRIES:
+                raise error
+            transfer_history.note_retry()
+            logger.warning(
+                f"Chunk at offset {offset} failed ({error}); retrying with "
+                f"{tuner.chunk_size} byte chunks"
+            )
+            time.sleep(min(2 ** failures, 30) * 0.5)
+        
+        metrics.observe('drive.upload.chunks_per_upload', tuner.chunks)
+        self.invalidate_reads()
+        transfer_history.add_bytes(media.size())
+        return response
     
     def delete_file(self, file_id):
         """Delete a file from Google Drive.
@@ -222,6 +831,7 @@ class DriveService:
         """
         try:
             self.service.files().delete(fileId=file_id).execute()
+            self.invalidate_reads()
         except Exception as e:
             logger.error(f"Error deleting file: {str(e)}")
             raise Exception(f"Failed to delete file: {str(e)}")
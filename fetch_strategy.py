@@ -0,0 +1,251 @@
+import io
+import time
+import logging
+import threading
+from urllib.parse import urlsplit
+from config import Config
+from metrics import metrics
+import transfer_history
+
+logger = logging.getLogger(__name__)
+
+PLAIN = 'plain'
+CLOUDSCRAPER = 'cloudscraper'
+
+# Cheapest first: cloudscraper builds a browser-like TLS session and may sit
+# through a Cloudflare challenge before the download even starts
+STRATEGIES = (PLAIN, CLOUDSCRAPER)
+
+# Cloudflare answers bot challenges with these statuses
+CHALLENGE_STATUSES = {403, 429, 503}
+
+BROWSER_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Referer': 'https://www.google.com/',
+    'DNT': '1',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+}
+
+
+class StrategyRefused(Exception):
+    """The host refused this fetch strategy (e.g. answered with a bot challenge)."""
+
+
+def is_refusal(response):
+    """Whether a response turns this client away rather than reporting an error."""
+    if response.status_code == 403:
+        return True
+    challenged = response.headers.get('Server', '').lower().startswith('cloudflare') or \
+        'cf-mitigated' in response.headers
+    return response.status_code in CHALLENGE_STATUSES and challenged
+
+
+class HostStrategyCache:
+    """Per-host memory of which fetch strategies work and how fast they were.
+
+    Entries expire after FETCH_STRATEGY_TTL so a host that changes its bot
+    protection is probed again. The cache is per process.
+    """
+
+    def __init__(self, ttl=None, max_hosts=None):
+        """Initialize the cache.
+
+        Args:
+            ttl (float, optional): Seconds an outcome is trusted (defaults to FETCH_STRATEGY_TTL)
+            max_hosts (int, optional): Hosts remembered (defaults to FETCH_STRATEGY_MAX_HOSTS)
+        """
+        self.ttl = Config.FETCH_STRATEGY_TTL if ttl is None else ttl
+        self.max_hosts = max_hosts or Config.FETCH_STRATEGY_MAX_HOSTS
+        self._lock = threading.Lock()
+        self._hosts = {}  # host -> {strategy: (worked, mb_s, recorded_at)}
+
+    def _fresh(self, host):
+        """Unexpired outcomes for a host; called with the lock held."""
+        now = time.monotonic()
+        outcomes = self._hosts.get(host, {})
+        return {s: o for s, o in outcomes.items() if now - o[2] < self.ttl}
+
+    def order(self, host):
+        """Strategies to try for a host: known to work, untried, known to fail.
+
+        Each group is in cost order, so the cheapest strategy known to work
+        comes first.
+
+        Args:
+            host (str): Host name
+
+        Returns:
+            list: Strategy names
+        """
+        with self._lock:
+            outcomes = self._fresh(host)
+        good = [s for s in STRATEGIES if s in outcomes and outcomes[s][0]]
+        untried = [s for s in STRATEGIES if s not in outcomes]
+        bad = [s for s in STRATEGIES if s in outcomes and not outcomes[s][0]]
+        return good + untried + bad
+
+    def _record(self, host, strategy, outcome):
+        with self._lock:
+            if host not in self._hosts and len(self._hosts) >= self.max_hosts:
+                # Forget the host whose newest outcome is oldest
+                oldest = min(self._hosts, key=lambda h: max(o[2] for o in self._hosts[h].values()))
+                del self._hosts[oldest]
+            self._hosts.setdefault(host, {})[strategy] = outcome
+
+    def record_success(self, host, strategy, byte_count, seconds):
+        """Remember that a strategy worked for a host, and its speed."""
+        mb_s = byte_count / seconds / (1024 * 1024) if seconds > 0 else 0.0
+        self._record(host, strategy, (True, round(mb_s, 3), time.monotonic()))
+        metrics.incr(f"fetch.{strategy}.succeeded")
+        metrics.observe(f"fetch.{strategy}.mb_s", mb_s)
+
+    def record_failure(self, host, strategy):
+        """Remember that a host refused a strategy."""
+        self._record(host, strategy, (False, 0.0, time.monotonic()))
+        metrics.incr(f"fetch.{strategy}.refused")
+
+    def snapshot(self):
+        """Fresh outcomes per host, for diagnostics."""
+        with self._lock:
+            return {host: {s: {'worked': o[0], 'mb_s': o[1]} for s, o in self._fresh(host).items()}
+                    for host in list(self._hosts)}
+
+
+# Shared by every download in this process
+strategy_cache = HostStrategyCache()
+
+
+class Download:
+    """Bytes of a URL received so far, kept across strategies so a retry resumes.
+
+    The bytes are written to `body`, a BytesIO that callers can upload from
+    directly once the download is complete, without copying it.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.body = io.BytesIO()
+        self.headers = {}
+        self.total = None  # Full size, when the server said
+        self.validator = None  # ETag or Last-Modified, for If-Range
+        self.ranges = False  # Server advertised byte ranges
+
+    def _start_over(self, response):
+        """Take a full (200) response as the new start of the body."""
+        if self.size:
+            metrics.incr('fetch.restarted_bytes', self.size)
+        self.body = io.BytesIO()
+        self.headers = response.headers
+        length = response.headers.get('Content-Length')
+        encoded = response.headers.get('Content-Encoding', 'identity') != 'identity'
+        self.total = int(length) if length and length.isdigit() and not encoded else None
+        etag = response.headers.get('ETag')
+        self.validator = etag if etag and not etag.startswith('W/') else \
+            response.headers.get('Last-Modified')
+        # Offsets of a compressed body don't match the decoded bytes we keep
+        self.ranges = response.headers.get('Accept-Ranges', '').lower() == 'bytes' and not encoded
+
+    @property
+    def size(self):
+        """Bytes received so far."""
+        return self.body.tell()
+
+    def _resumes(self, response):
+        """Whether a 206 response continues exactly where we stopped."""
+        content_range = response.headers.get('Content-Range', '')
+        return response.status_code == 206 and \
+            content_range.startswith(f"bytes {self.size}-")
+
+    def receive(self, session, timeout):
+        """GET the rest of the URL through ``session``, appending to the body.
+
+        Raises:
+            StrategyRefused: If the host refused the session's client
+            Exception: On other HTTP or network errors (bytes received so far are kept)
+        """
+        headers = dict(BROWSER_HEADERS)
+        resuming = bool(self.size) and self.ranges
+        if resuming:
+            headers['Range'] = f"bytes={self.size}-"
+            if self.validator:
+                headers['If-Range'] = self.validator
+
+        with session.get(self.url, headers=headers, timeout=timeout, stream=True,
+                         allow_redirects=True) as response:
+            if is_refusal(response):
+                raise StrategyRefused(f"{response.status_code} {response.reason}")
+            response.raise_for_status()
+            if resuming and self._resumes(response):
+                metrics.incr('fetch.resumed_bytes', self.size)
+            else:
+                self._start_over(response)
+            for chunk in response.iter_content(Config.FETCH_CHUNK_SIZE):
+                self.body.write(chunk)
+        if self.total is not None and self.size < self.total:
+            raise Exception(f"Connection closed after {self.size} of {self.total} bytes")
+
+
+def _session(strategy):
+    """Create the HTTP session for a strategy."""
+    if strategy == CLOUDSCRAPER:
+        import cloudscraper
+        return cloudscraper.create_scraper(
+            browser={
+                'browser': 'chrome',
+                'platform': 'windows',
+                'desktop': True
+            },
+            delay=2  # Small delay to avoid triggering anti-bot measures
+        )
+    import requests
+    return requests.Session()
+
+
+def fetch(url, timeout=60, cache=None):
+    """Download a URL, trying the strategies that worked for its host first.
+
+    A strategy that the host refuses is remembered and the next one is tried.
+    A download cut off midway is continued by the next strategy with a Range
+    request when the server supports it, so received bytes are not fetched
+    again. Client errors such as 404 are raised straight away.
+
+    Args:
+        url (str): URL to download
+        timeout (int, optional): Seconds to wait for the server between reads
+        cache (HostStrategyCache, optional): Defaults to the shared strategy_cache
+
+    Returns:
+        Download: The complete download (body and response headers)
+    """
+    cache = cache or strategy_cache
+    host = urlsplit(url).hostname or ''
+    download = Download(url)
+    errors = []
+    for attempt, strategy in enumerate(cache.order(host)):
+        if attempt:
+            transfer_history.note_retry()
+        started = time.monotonic()
+        before = download.size
+        try:
+            with _session(strategy) as session:
+                download.receive(session, timeout)
+        except StrategyRefused as e:
+            logger.info(f"{host} refused {strategy} fetch: {str(e)}")
+            cache.record_failure(host, strategy)
+            errors.append(f"{strategy}: {str(e)}")
+            continue
+        except Exception as e:
+            status = getattr(getattr(e, 'response', None), 'status_code', None)
+            if status is not None and 400 <= status < 500 and status != 429:
+                raise
+            logger.warning(f"{strategy} fetch of {url} failed after "
+                           f"{download.size} bytes: {str(e)}")
+            errors.append(f"{strategy}: {str(e)}")
+            continue
+        cache.record_success(host, strategy, download.size - before,
+                             time.monotonic() - started)
+        return download
+    raise Exception("; ".join(errors))
@@ -0,0 +1,98 @@
+import time
+import uuid
+import threading
+
+
+class ListingValidatorCache:
+    """Short-lived, per-user cache of Drive listing validators.
+
+    A validator is an opaque string that changes whenever a user's file
+    listing may have changed (see DriveService.get_listing_validator). Keeping
+    it for a few seconds lets a reload that carries a matching If-None-Match
+    be answered with 304 without any Drive API call. Entries are dropped as
+    soon as the user changes something through the app.
+    """
+
+    def __init__(self, ttl):
+        """Initialize the cache.
+
+        Args:
+            ttl (float): Seconds a validator is trusted without asking Drive
+        """
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._salts = {}  # user_key -> salt mixed into ETags after a failed page
+
+    def get(self, user_key):
+        """Return the cached validator for a user, or None if missing or expired.
+
+        Args:
+            user_key (str): Identifies the user/credentials
+
+        Returns:
+            str: Validator or None
+        """
+        with self._lock:
+            entry = self._entries.get(user_key)
+            if entry is None:
+                return None
+            validator, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[user_key]
+                return None
+            return validator
+
+    def set(self, user_key, validator):
+        """Cache a freshly computed validator.
+
+        Args:
+            user_key (str): Identifies the user/credentials
+            validator (str): Validator from Drive
+        """
+        with self._lock:
+            # Opportunistically drop expired entries so the dict stays small
+            if len(self._entries) > 1024:
+                now = time.monotonic()
+                self._entries = {k: v for k, v in self._entries.items() if v[1] > now}
+            self._entries[user_key] = (validator, time.monotonic() + self.ttl)
+
+    def invalidate(self, user_key):
+        """Forget a user's validator after a change made through the app.
+
+        Args:
+            user_key (str): Identifies the user/credentials
+        """
+        with self._lock:
+            self._entries.pop(user_key, None)
+
+    def reject(self, user_key):
+        """Stop honouring ETags already sent to a user.
+
+        Called when a page that carried an ETag rendered an error. Dropping
+        the validator is not enough: if Drive has not changed, the same
+        validator comes back and so would the same ETag. A new salt (see
+        salt()) makes every later ETag differ from the ones already sent.
+
+        Args:
+            user_key (str): Identifies the user/credentials
+        """
+        with self._lock:
+            self._entries.pop(user_key, None)
+            self._salts.pop(user_key, None)
+            if len(self._salts) >= 1024:
+                # Forget the oldest rejection
+                del self._salts[next(iter(self._salts))]
+            self._salts[user_key] = uuid.uuid4().hex
+
+    def salt(self, user_key):
+        """Return the salt to mix into a user's ETags ('' unless rejected).
+
+        Args:
+            user_key (str): Identifies the user/credentials
+
+        Returns:
+            str: Salt
+        """
+        with self._lock:
+            return self._salts.get(user_key, '')
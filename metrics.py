@@ -0,0 +1,78 @@
+import threading
+import time
+
+
+class Metrics:
+    """Process-local registry of counters, gauges and value summaries.
+
+    Everything is kept in memory and exposed as JSON by the ``/metrics`` route,
+    so values are per worker process.
+    """
+
+    def __init__(self):
+        """Initialize an empty registry."""
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._summaries = {}
+        self._started = time.time()
+
+    def incr(self, name, amount=1):
+        """Increment a counter.
+
+        Args:
+            name (str): Counter name, dotted by subsystem (e.g. 'drive.upload.simple')
+            amount (int, optional): Amount to add
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def set_gauge(self, name, value):
+        """Set a gauge to an absolute value.
+
+        Args:
+            name (str): Gauge name
+            value (float): Current value
+        """
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name, value):
+        """Record one observation of a value (size, duration, rate...).
+
+        Args:
+            name (str): Summary name
+            value (float): Observed value
+        """
+        with self._lock:
+            summary = self._summaries.get(name)
+            if summary is None:
+                summary = self._summaries[name] = {
+                    'count': 0, 'sum': 0.0, 'min': value, 'max': value, 'last': value
+                }
+            summary['count'] += 1
+            summary['sum'] += value
+            summary['min'] = min(summary['min'], value)
+            summary['max'] = max(summary['max'], value)
+            summary['last'] = value
+
+    def snapshot(self):
+        """Return a JSON-serialisable copy of all metrics.
+
+        Returns:
+            dict: counters, gauges and summaries (with a computed mean)
+        """
+        with self._lock:
+            summaries = {}
+            for name, summary in self._summaries.items():
+                summaries[name] = dict(summary, mean=summary['sum'] / summary['count'])
+            return {
+                'uptime_seconds': round(time.time() - self._started, 3),
+                'counters': dict(self._counters),
+                'gauges': dict(self._gauges),
+                'summaries': summaries,
+            }
+
+
+# Shared registry used by the services and exposed by the app
+metrics = Metrics()
@@ -0,0 +1,301 @@
+import os
+import mimetypes
+import posixpath
+
+# Bytes needed from the start of a stream to recognise every signature below
+SNIFF_BYTES = 512
+
+GENERIC_MIME_TYPES = {'', 'application/octet-stream', 'binary/octet-stream',
+                      'application/unknown', 'application/x-download', 'application/download',
+                      'application/force-download'}
+
+# Extensions whose system mappings are missing or inconsistent across platforms
+EXTRA_TYPES = {
+    '.mkv': 'video/x-matroska',
+    '.webm': 'video/webm',
+    '.flv': 'video/x-flv',
+    '.m4v': 'video/x-m4v',
+    '.m4a': 'audio/mp4',
+    '.flac': 'audio/flac',
+    '.ogg': 'audio/ogg',
+    '.oga': 'audio/ogg',
+    '.ogv': 'video/ogg',
+    '.opus': 'audio/opus',
+    '.wav': 'audio/wav',
+    '.webp': 'image/webp',
+    '.heic': 'image/heic',
+    '.7z': 'application/x-7z-compressed',
+    '.rar': 'application/vnd.rar',
+    '.gz': 'application/gzip',
+    '.tgz': 'application/gzip',
+    '.bz2': 'application/x-bzip2',
+    '.xz': 'application/x-xz',
+    '.md': 'text/markdown',
+    '.odt': 'application/vnd.oasis.opendocument.text',
+    '.rtf': 'application/rtf',
+}
+
+# Preferred extension when naming a file after its MIME type
+PREFERRED_EXTENSIONS = {
+    'application/pdf': '.pdf',
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+    'image/svg+xml': '.svg',
+    'video/mp4': '.mp4',
+    'video/webm': '.webm',
+    'video/x-matroska': '.mkv',
+    'video/quicktime': '.mov',
+    'audio/mpeg': '.mp3',
+    'audio/mp4': '.m4a',
+    'audio/ogg': '.ogg',
+    'audio/wav': '.wav',
+    'audio/flac': '.flac',
+    'application/zip': '.zip',
+    'application/gzip': '.gz',
+    'text/plain': '.txt',
+}
+
+# Container formats whose signature is shared by more specific types; when the
+# extension names one of those, the extension wins over the generic signature.
+CONTAINER_FAMILIES = {
+    'application/zip': ('application/vnd.openxmlformats-officedocument.', 'application/vnd.oasis.',
+                        'application/epub+zip', 'application/java-archive',
+                        'application/vnd.android.package-archive', 'application/x-zip-compressed'),
+    'application/x-ole-storage': ('application/msword', 'application/vnd.ms-'),
+    'video/mp4': ('video/', 'audio/mp4', 'audio/x-m4a', 'audio/aac', 'image/heic', 'image/avif'),
+    'audio/ogg': ('audio/', 'video/ogg', 'application/ogg'),
+    'audio/mpeg': ('audio/',),
+    'video/x-matroska': ('video/webm', 'audio/webm', 'video/x-matroska', 'audio/x-matroska'),
+    'application/xml': ('application/', 'image/svg+xml', 'text/'),
+    'text/plain': ('text/', 'application/json', 'application/javascript', 'application/xml',
+                   'image/svg+xml'),
+}
+
+_FTYP_BRANDS = {
+    b'M4A ': 'audio/mp4', b'M4B ': 'audio/mp4', b'M4P ': 'audio/mp4', b'M4V ': 'video/x-m4v',
+    b'qt  ': 'video/quicktime', b'heic': 'image/heic', b'heix': 'image/heic',
+    b'mif1': 'image/heic', b'avif': 'image/avif', b'3gp4': 'video/3gpp', b'3gp5': 'video/3gpp',
+}
+
+# Byte-order marks of UTF-16 and UTF-32 text (UTF-16LE's FF FE looks like an MP3 frame sync)
+_UNICODE_BOMS = (b'\xff\xfe', b'\xfe\xff', b'\x00\x00\xfe\xff')
+
+# Signatures short or printable enough to occur at the start of a text file
+_WEAK_SIGNATURES = {'audio/mpeg', 'application/x-bzip2', 'image/bmp'}
+
+
+def _mp3_frame(head):
+    """Whether head starts with a valid MPEG audio frame header.
+
+    Besides the 11-bit frame sync, the version, layer, bitrate, sample rate
+    and emphasis fields must all hold defined values.
+    """
+    if len(head) < 4:
+        return False
+    header = int.from_bytes(head[:4], 'big')
+    return (header >> 21) == 0x7ff and \
+        (header >> 19) & 0x3 != 0x1 and \
+        (header >> 17) & 0x3 != 0x0 and \
+        (header >> 12) & 0xf not in (0x0, 0xf) and \
+        (header >> 10) & 0x3 != 0x3 and \
+        header & 0x3 != 0x2
+
+
+def weak_signature(head, sniffed):
+    """Whether a sniffed type rests on a signature that text could also start with."""
+    if sniffed == 'audio/mpeg':
+        return not head.startswith(b'ID3')
+    return sniffed in _WEAK_SIGNATURES or sniffed == 'text/plain'
+
+
+def sniff(head):
+    """Identify content from its first bytes.
+
+    Args:
+        head (bytes): Start of the content (SNIFF_BYTES is enough)
+
+    Returns:
+        str: MIME type, or None if no signature matched
+    """
+    if not head:
+        return None
+    if head.startswith(b'%PDF-'):
+        return 'application/pdf'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if head.startswith((b'GIF87a', b'GIF89a')):
+        return 'image/gif'
+    if head[:4] == b'RIFF' and len(head) >= 12:
+        return {b'WEBP': 'image/webp', b'WAVE': 'audio/wav',
+                b'AVI ': 'video/x-msvideo'}.get(head[8:12])
+    if head[4:8] == b'ftyp':
+        return _FTYP_BRANDS.get(head[8:12], 'video/mp4')
+    if head.startswith(b'\x1a\x45\xdf\xa3'):
+        return 'video/webm' if b'webm' in head[:64] else 'video/x-matroska'
+    if head.startswith(b'OggS'):
+        return 'audio/ogg'
+    if head.startswith(b'fLaC'):
+        return 'audio/flac'
+    if head.startswith(_UNICODE_BOMS):
+        return 'text/plain'
+    if head.startswith(b'ID3') or _mp3_frame(head):
+        return 'audio/mpeg'
+    if head.startswith(b'FLV\x01'):
+        return 'video/x-flv'
+    if head.startswith((b'PK\x03\x04', b'PK\x05\x06')):
+        return 'application/zip'
+    if head.startswith(b'\x1f\x8b'):
+        return 'application/gzip'
+    if head.startswith(b"7z\xbc\xaf\x27\x1c"):
+        return 'application/x-7z-compressed'
+    if head.startswith(b'Rar!\x1a\x07'):
+        return 'application/vnd.rar'
+    if head.startswith(b'BZh'):
+        return 'application/x-bzip2'
+    if head.startswith(b'\xfd7zXZ\x00'):
+        return 'application/x-xz'
+    if len(head) >= 262 and head[257:262] == b'ustar':
+        return 'application/x-tar'
+    if head.startswith(b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'):
+        return 'application/x-ole-storage'
+    if head.startswith(b'{\\rtf'):
+        return 'application/rtf'
+    if head.startswith(b'BM') and len(head) >= 14 and head[6:10] == b'\x00\x00\x00\x00':
+        return 'image/bmp'
+    if head.startswith((b'II*\x00', b'MM\x00*')):
+        return 'image/tiff'
+
+    text = head.lstrip(b'\xef\xbb\xbf \t\r\n')[:256].lower()
+    if text.startswith(b'<svg') or (text.startswith(b'<?xml') and b'<svg' in text):
+        return 'image/svg+xml'
+    if text.startswith((b'<!doctype html', b'<html')):
+        return 'text/html'
+    if text.startswith(b'<?xml'):
+        return 'application/xml'
+    if b'\x00' not in head:
+        try:
+            head.decode('utf-8')
+        except UnicodeDecodeError as e:
+            # A multi-byte character cut off at the end of the sample is fine
+            if e.start < len(head) - 3:
+                return None
+        return 'text/plain'
+    return None
+
+
+class MimeRegistry:
+    """Extension and signature based MIME detection, built once per process.
+
+    Wraps a private mimetypes.MimeTypes instance (so the system databases are
+    read a single time at import) extended with EXTRA_TYPES, plus a reverse
+    map used to give extension-less downloads a sensible name.
+    """
+
+    def __init__(self):
+        """Build the extension tables."""
+        system_files = [path for path in mimetypes.knownfiles if os.path.isfile(path)]
+        self._types = mimetypes.MimeTypes(system_files)
+        for ext, mime_type in EXTRA_TYPES.items():
+            self._types.add_type(mime_type, ext)
+        self._by_extension = dict(self._types.types_map[True])
+        self._by_extension.update(EXTRA_TYPES)
+
+    def guess_type(self, filename):
+        """Guess a MIME type from a filename's extension.
+
+        Args:
+            filename (str): Name or path of the file
+
+        Returns:
+            str: MIME type, or None if the extension is unknown
+        """
+        base = posixpath.basename((filename or '').replace('\\', '/')).lower()
+        ext = os.path.splitext(base)[1]
+        mime_type = self._by_extension.get(ext)
+        if mime_type is None and ext:
+            mime_type = self._types.guess_type(base, strict=False)[0]
+        return mime_type
+
+    def extension_for(self, mime_type):
+        """Return the preferred file extension for a MIME type.
+
+        Args:
+            mime_type (str): MIME type
+
+        Returns:
+            str: Extension including the dot, or '' if unknown
+        """
+        if not mime_type:
+            return ''
+        mime_type = mime_type.split(';')[0].strip().lower()
+        return PREFERRED_EXTENSIONS.get(mime_type) or self._types.guess_extension(mime_type) or ''
+
+    def detect(self, filename, head=None, declared=None):
+        """Determine the MIME type of content from all available evidence.
+
+        A recognised signature wins, except when the extension names a more
+        specific format sharing that signature (a .docx is a zip, a .m4a is an
+        MP4 container), or names a text type and the signature is one text
+        could start with (an MP3 frame sync, 'BM', 'BZh'). Otherwise a specific declared type (e.g. from an HTTP
+        Content-Type header) is used, then the extension.
+
+        Args:
+            filename (str): Name of the file
+            head (bytes, optional): First bytes of the content
+            declared (str, optional): Type claimed by the client or server
+
+        Returns:
+            str: MIME type (application/octet-stream if nothing is known)
+        """
+        by_extension = self.guess_type(filename)
+        declared = (declared or '').split(';')[0].strip().lower()
+        if declared in GENERIC_MIME_TYPES:
+            declared = None
+
+        sniffed = sniff(head)
+        if sniffed:
+            specific = by_extension or declared
+            if specific and specific != sniffed and \
+                    specific.startswith(CONTAINER_FAMILIES.get(sniffed, ())):
+                return specific
+            if sniffed == 'application/x-ole-storage':
+                return specific or 'application/octet-stream'
+            if sniffed == 'text/plain' and specific:
+                # Plain text is only a weak signal; trust the name or header
+                return specific
+            if specific and specific.startswith('text/') and weak_signature(head, sniffed):
+                # A few signature bytes don't outweigh a name or header saying text
+                return specific
+            return sniffed
+
+        return declared or by_extension or 'application/octet-stream'
+
+    def detect_stream(self, fh, filename, declared=None):
+        """Detect the MIME type of a seekable stream without consuming it.
+
+        Only SNIFF_BYTES are read; the stream position is restored.
+
+        Args:
+            fh (io.Base): Seekable file-like object
+            filename (str): Name of the file
+            declared (str, optional): Type claimed by the client or server
+
+        Returns:
+            str: MIME type
+        """
+        head = None
+        try:
+            position = fh.tell()
+            head = fh.read(SNIFF_BYTES)
+            fh.seek(position)
+        except (AttributeError, OSError, ValueError):
+            pass
+        return self.detect(filename, head, declared)
+
+
+# Built once at import; shared by every upload path
+registry = MimeRegistry()
@@ -1,3 +1,5 @@
+import json
+import functools
 from datetime import datetime
 from app import db
 from flask_login import UserMixin
@@ -16,10 +18,170 @@ class User(UserMixin, db.Model):
     def __repr__(self):
         return f'<User {self.username}>'
 
+class TransferJob(db.Model):
+    """A transfer queued in the database so any app instance can run it.
+    
+    Workers lease jobs (see transfer_jobs.py); a lease that is not renewed by
+    heartbeats expires and the job is handed to another worker.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(32), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON arguments for the handler
+    owner_key = db.Column(db.String(64), index=True)  # Whose Drive the job writes to
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    credentials = db.Column(db.Text)  # JSON API credentials when there is no OAuth user; cleared once finished
+    status = db.Column(db.String(16), nullable=False, default='queued', index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    available_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    lease_owner = db.Column(db.String(64))
+    lease_expires_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    result = db.Column(db.Text)  # JSON
+    error = db.Column(db.Text)
+
+    def to_dict(self):
+        """Describe the job for the status API."""
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'attempts': self.attempts,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'result': json.loads(self.result) if self.result else None,
+            'error': self.error,
+        }
+
+    def __repr__(self):
+        return f'<TransferJob {self.id} {self.kind} {self.status}>'
+
+class Transfer(db.Model):
+    """One finished import into Drive, kept for throughput analytics.
+
+    Rows are written in the background (see transfer_history.py) and
+    aggregated per source host or per hour by /api/transfers/stats.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    owner_key = db.Column(db.String(64), index=True)  # Whose Drive received the file
+    source_kind = db.Column(db.String(16), nullable=False)  # file, url or youtube
+    source_host = db.Column(db.String(255), index=True)  # None for browser uploads
+    bytes = db.Column(db.BigInteger, nullable=False, default=0)
+    download_seconds = db.Column(db.Float, nullable=False, default=0.0)
+    upload_seconds = db.Column(db.Float, nullable=False, default=0.0)
+    retries = db.Column(db.Integer, nullable=False, default=0)
+    outcome = db.Column(db.String(16), nullable=False)  # succeeded or failed
+    error = db.Column(db.Text)
+    file_id = db.Column(db.String(128))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    hour = db.Column(db.DateTime, nullable=False, index=True)  # created_at truncated to the hour
+
+    def __repr__(self):
+        return f'<Transfer {self.id} {self.source_kind} {self.outcome}>'
+
+class ChunkedUploadState(db.Model):
+    """A chunked browser upload, visible to every app instance.
+    
+    The instance that started the upload (the holder) spools and forwards it;
+    any instance can report its progress, accept chunks or cancel it (see
+    chunked_upload.py).
+    """
+    id = db.Column(db.String(32), primary_key=True)
+    owner_key = db.Column(db.String(64), nullable=False, index=True)
+    filename = db.Column(db.String(255), nullable=False)
+    mime_type = db.Column(db.String(255))
+    size = db.Column(db.BigInteger, nullable=False)
+    chunk_size = db.Column(db.Integer, nullable=False)
+    total_chunks = db.Column(db.Integer, nullable=False)
+    expand_archive = db.Column(db.Boolean, nullable=False, default=False)
+    holder = db.Column(db.String(64), nullable=False)  # Instance spooling the upload
+    heartbeat_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    status = db.Column(db.String(16), nullable=False, index=True)
+    result = db.Column(db.Text)  # JSON
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<ChunkedUploadState {self.id} {self.status}>'
+
+class UploadChunk(db.Model):
+    """A received chunk of a chunked upload.
+    
+    data is set while the chunk waits for the holder to copy it into its spool
+    file, and cleared afterwards; the row itself records that the chunk arrived.
+    """
+    upload_id = db.Column(db.String(32), primary_key=True)
+    index = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    data = db.Column(db.LargeBinary)
+
+# General file type by exact MIME type for the common cases
+FILE_TYPES_BY_MIME = {
+    'application/pdf': 'pdf',
+    'application/vnd.google-apps.document': 'document',
+    'application/vnd.google-apps.spreadsheet': 'spreadsheet',
+    'application/vnd.google-apps.presentation': 'presentation',
+    'application/zip': 'archive',
+    'application/x-zip-compressed': 'archive',
+    'application/x-rar-compressed': 'archive',
+    'application/vnd.rar': 'archive',
+    'application/x-7z-compressed': 'archive',
+    'application/x-tar': 'archive',
+    'application/gzip': 'archive',
+    'application/x-gzip': 'archive',
+    'application/x-bzip2': 'archive',
+    'application/x-xz': 'archive',
+    'application/x-compress': 'archive',
+    'application/x-gtar': 'archive',
+}
+# Any other MIME type is matched against these substrings in order, so
+# variants such as application/x-bzip or application/x-tar-gz still count
+FILE_TYPES_BY_SUBSTRING = (
+    ('image/', 'image'),
+    ('video/', 'video'),
+    ('audio/', 'audio'),
+    ('application/pdf', 'pdf'),
+    ('application/vnd.google-apps.document', 'document'),
+    ('application/vnd.google-apps.spreadsheet', 'spreadsheet'),
+    ('application/vnd.google-apps.presentation', 'presentation'),
+    ('zip', 'archive'),
+    ('compress', 'archive'),
+    ('x-rar', 'archive'),
+    ('x-7z', 'archive'),
+    ('x-tar', 'archive'),
+    ('gzip', 'archive'),
+    ('x-xz', 'archive'),
+)
+
+@functools.lru_cache(maxsize=512)
+def file_type_for(mime_type):
+    """Return the general file type category for a MIME type.
+    
+    Listings repeat a handful of MIME types, so results are cached.
+    """
+    file_type = FILE_TYPES_BY_MIME.get(mime_type)
+    if file_type is not None:
+        return file_type
+    for substring, file_type in FILE_TYPES_BY_SUBSTRING:
+        if substring in mime_type:
+            return file_type
+    return 'other'
+
 class File:
-    """Class representing a file stored in Google Drive."""
+    """Class representing a file stored in Google Drive.
+    
+    Listings can hold thousands of these, so instances use __slots__.
+    """
+    
+    __slots__ = ('id', 'name', 'mime_type', 'created_time', 'size', 'web_view_link',
+                 'thumbnail_link', 'modified_time')
     
-    def __init__(self, file_id, name, mime_type, created_time, size, web_view_link=None):
+    def __init__(self, file_id, name, mime_type, created_time, size, web_view_link=None,
+                 thumbnail_link=None, modified_time=None):
         """Initialize a new File object.
         
         Args:
@@ -29,6 +191,8 @@ class File:
             created_time (str): When the file was created
             size (int): File size in bytes
             web_view_link (str, optional): Link to view the file
+            thumbnail_link (str, optional): Drive-generated thumbnail URL
+            modified_time (str, optional): When the file was last modified
         """
         self.id = file_id
         self.name = name
@@ -36,37 +200,23 @@ class File:
         self.created_time = created_time
         self.size = size
         self.web_view_link = web_view_link
+        self.thumbnail_link = thumbnail_link
+        self.modified_time = modified_time
     
     @property
     def file_type(self):
         """Get the general file type category based on MIME type."""
-        if 'image/' in self.mime_type:
-            return 'image'
-        elif 'video/' in self.mime_type:
-            return 'video'
-        elif 'audio/' in self.mime_type:
-            return 'audio'
-        elif 'application/pdf' in self.mime_type:
-            return 'pdf'
-        elif 'application/vnd.google-apps.document' in self.mime_type:
-            return 'document'
-        elif 'application/vnd.google-apps.spreadsheet' in self.mime_type:
-            return 'spreadsheet'
-        elif 'application/vnd.google-apps.presentation' in self.mime_type:
-            return 'presentation'
-        elif any(archive in self.mime_type for archive in ['zip', 'x-rar', 'x-7z', 'x-tar', 'gzip']):
-            return 'archive'
-        else:
-            return 'other'
+        return file_type_for(self.mime_type)
     
     @property
     def formatted_size(self):
         """Return a human-readable file size."""
+        size = float(self.size)
         for unit in ['B', 'KB', 'MB', 'GB']:
-            if self.size < 1024.0:
-                return f"{self.size:.2f} {unit}"
-            self.size /= 1024.0
-        return f"{self.size:.2f} TB"
+            if size < 1024.0:
+                return f"{size:.2f} {unit}"
+            size /= 1024.0
+        return f"{size:.2f} TB"
     
     @property
     def formatted_date(self):
@@ -74,5 +224,5 @@ class File:
         try:
             dt = datetime.fromisoformat(self.created_time.replace('Z', '+00:00'))
             return dt.strftime('%Y-%m-%d %H:%M:%S')
-        except:
+        except (AttributeError, ValueError):
             return self.created_time
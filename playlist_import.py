@@ -0,0 +1,106 @@
+import time
+import logging
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from metrics import metrics
+import utils
+
+logger = logging.getLogger(__name__)
+
+
+class PlaylistImporter:
+    """Imports every video of a YouTube playlist or channel into Drive.
+
+    The playlist is expanded with one flat extraction, then videos are
+    downloaded and uploaded by a bounded thread pool. Each video succeeds or
+    fails on its own; one unavailable video does not stop the others.
+    """
+
+    def __init__(self, drive_service, youtube_service, max_workers=None, track=None):
+        """Initialize the importer.
+
+        Args:
+            drive_service (DriveService): Drive service used for folders and uploads
+            youtube_service (YouTubeService): YouTube service used for downloads
+            max_workers (int, optional): Concurrent videos (defaults to YOUTUBE_PLAYLIST_WORKERS)
+            track (callable, optional): Called as track(video_url) around each video on its
+                worker thread; returns a context manager yielding the transfer record
+                (see TransferHistory.track)
+        """
+        self.drive_service = drive_service
+        self.youtube_service = youtube_service
+        self.max_workers = max_workers or Config.YOUTUBE_PLAYLIST_WORKERS
+        self.track = track or (lambda url: nullcontext(None))
+
+    def import_playlist(self, playlist_url, own_folder=True, parent_id=None, options=None):
+        """Import a playlist.
+
+        Args:
+            playlist_url (str): YouTube playlist or channel URL
+            own_folder (bool): Put the videos in a new folder named after the playlist
+            parent_id (str, optional): Folder to import into
+            options (dict, optional): Format options applied to every video
+
+        Returns:
+            dict: Aggregate report with per-video results
+        """
+        started = time.monotonic()
+        playlist = self.youtube_service.list_playlist(playlist_url)
+        entries = playlist['entries']
+        if not entries:
+            raise Exception(f"No videos found in playlist {playlist['title']}")
+        truncated = max(len(entries) - Config.YOUTUBE_PLAYLIST_MAX_VIDEOS, 0)
+        entries = entries[:Config.YOUTUBE_PLAYLIST_MAX_VIDEOS]
+
+        folder_id = parent_id
+        if own_folder:
+            folder_id = self.drive_service.create_folder(playlist['title'], parent_id)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            results = list(pool.map(
+                lambda entry: self._import_video(entry, folder_id, options), entries
+            ))
+
+        failed = sum(1 for r in results if not r['success'])
+        metrics.incr('youtube.playlist.videos', len(results))
+        metrics.incr('youtube.playlist.failed', failed)
+        message = f"Playlist {playlist['title']}: {len(results) - failed} of {len(results)} " \
+                  f"video(s) uploaded, {failed} failed"
+        if truncated:
+            message += f" ({truncated} more skipped, limit is {Config.YOUTUBE_PLAYLIST_MAX_VIDEOS})"
+        return {
+            'success': failed == 0,
+            'message': message,
+            'playlist_id': playlist['id'],
+            'title': playlist['title'],
+            'folder_id': folder_id,
+            'videos': len(results),
+            'skipped': truncated,
+            'uploaded': len(results) - failed,
+            'failed': failed,
+            'elapsed_seconds': round(time.monotonic() - started, 3),
+            'results': results,
+        }
+
+    def _import_video(self, entry, folder_id, options):
+        """Import one video; failures are reported, not raised."""
+        selected = {}
+        try:
+            # Don't start downloading once the transfer was cancelled
+            self.drive_service.check_cancelled()
+            with self.track(entry['url']) as transfer:
+                file_id = utils.upload_from_youtube(
+                    entry['url'], self.drive_service, self.youtube_service, folder_id, options,
+                    on_info=selected.update
+                )
+                if transfer is not None:
+                    transfer.file_id = file_id
+            return {'id': entry['id'], 'title': entry['title'], 'url': entry['url'],
+                    'success': True, 'file_id': file_id,
+                    'format_id': selected.get('format_id'),
+                    'expected_size': selected.get('expected_size')}
+        except Exception as e:
+            logger.error(f"Error importing playlist video {entry['id']}: {str(e)}")
+            return {'id': entry['id'], 'title': entry['title'], 'url': entry['url'],
+                    'success': False, 'error': str(e)}
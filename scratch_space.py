@@ -0,0 +1,257 @@
+import os
+import time
+import uuid
+import shutil
+import logging
+import threading
+from config import Config
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ScratchSpaceExhausted(Exception):
+    """Raised when a transfer can't get the scratch space it needs in time."""
+
+
+class Allocation:
+    """A file or directory in scratch space and the bytes reserved for it.
+
+    Use it as a context manager or call release(); both delete the path and
+    give the reservation back.
+    """
+
+    def __init__(self, space, path, reserved, is_dir):
+        self.space = space
+        self.path = path
+        self.reserved = reserved
+        self.is_dir = is_dir
+        self.released = False
+
+    def resize(self, nbytes):
+        """Correct the reservation once the real size is known (never waits)."""
+        self.space._resize(self, nbytes)
+
+    def release(self):
+        """Delete the file or directory and return its reservation."""
+        if self.released:
+            return
+        self.released = True
+        try:
+            if self.is_dir:
+                shutil.rmtree(self.path)
+            else:
+                os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove scratch path {self.path}: {str(e)}")
+        self.space._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class ScratchSpace:
+    """Disk space that transfers use for files they hold temporarily.
+
+    Every allocation lives under one root directory and draws on one byte
+    budget: a transfer says how much it needs and waits until that much is
+    free, so a burst of large imports queues instead of filling the disk.
+
+    A janitor thread deletes what dead processes left behind, i.e. entries
+    under the root that no live allocation of this process owns and that
+    have not been modified for max_age. On each pass it also touches this
+    process's live allocations, so the janitors of other workers sharing the
+    directory leave them alone, and counts what those workers use towards
+    the budget.
+    """
+
+    def __init__(self, root=None, max_bytes=None, max_age=None):
+        """Initialize the scratch space; the root is created on first use.
+
+        Args:
+            root (str, optional): Directory (defaults to SCRATCH_DIR)
+            max_bytes (int, optional): Budget shared by all allocations (defaults to SCRATCH_MAX_BYTES)
+            max_age (float, optional): Seconds after which an unowned entry is
+                deleted (defaults to SCRATCH_MAX_AGE)
+        """
+        self.root = root or Config.SCRATCH_DIR
+        self.max_bytes = max_bytes or Config.SCRATCH_MAX_BYTES
+        self.max_age = max_age or Config.SCRATCH_MAX_AGE
+        self._cond = threading.Condition()
+        self._reserved = 0
+        self._foreign_bytes = 0  # Used by other processes, as of the last sweep
+        self._live = {}  # path -> Allocation
+        self._janitor = None
+
+    def allocate(self, nbytes=None, prefix='', suffix='', directory=False, timeout=None):
+        """Reserve space and create an empty file or directory for it.
+
+        Args:
+            nbytes (int, optional): Bytes the transfer will write (defaults to
+                SCRATCH_DEFAULT_RESERVATION when unknown)
+            prefix (str, optional): Start of the file name, to tell transfers apart
+            suffix (str, optional): End of the file name
+            directory (bool, optional): Create a directory instead of a file
+            timeout (float, optional): Seconds to wait for space (defaults to SCRATCH_WAIT_SECONDS)
+
+        Returns:
+            Allocation: The new file or directory
+
+        Raises:
+            ScratchSpaceExhausted: If the space isn't free within ``timeout``
+        """
+        nbytes = Config.SCRATCH_DEFAULT_RESERVATION if nbytes is None else nbytes
+        timeout = Config.SCRATCH_WAIT_SECONDS if timeout is None else timeout
+        if nbytes > self.max_bytes:
+            raise ScratchSpaceExhausted(
+                f"Transfer needs {nbytes} bytes of scratch space, more than the {self.max_bytes} available"
+            )
+
+        started = time.monotonic()
+        with self._cond:
+            while self._reserved + self._foreign_bytes + nbytes > self.max_bytes:
+                remaining = started + timeout - time.monotonic()
+                if remaining <= 0:
+                    metrics.incr('scratch.exhausted')
+                    raise ScratchSpaceExhausted("Not enough scratch space for this transfer; try again later")
+                self._cond.wait(remaining)
+            self._reserved += nbytes
+            self._publish()
+        waited = time.monotonic() - started
+        if waited > 0.01:
+            metrics.observe('scratch.wait_seconds', waited)
+
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            path = os.path.join(self.root, f"{prefix}{uuid.uuid4().hex}{suffix}")
+            if directory:
+                os.mkdir(path, 0o700)
+            else:
+                os.close(os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o600))
+        except OSError:
+            with self._cond:
+                self._reserved -= nbytes
+                self._cond.notify_all()
+                self._publish()
+            raise
+
+        allocation = Allocation(self, path, nbytes, directory)
+        with self._cond:
+            self._live[path] = allocation
+            self._publish()
+        return allocation
+
+    def _resize(self, allocation, nbytes):
+        with self._cond:
+            self._reserved += nbytes - allocation.reserved
+            allocation.reserved = nbytes
+            self._cond.notify_all()
+            self._publish()
+
+    def _release(self, allocation):
+        with self._cond:
+            self._reserved -= allocation.reserved
+            self._live.pop(allocation.path, None)
+            self._cond.notify_all()
+            self._publish()
+
+    def _publish(self):
+        """Export usage gauges; called with the lock held."""
+        metrics.set_gauge('scratch.reserved_bytes', self._reserved)
+        metrics.set_gauge('scratch.foreign_bytes', self._foreign_bytes)
+        metrics.set_gauge('scratch.allocations', len(self._live))
+
+    @staticmethod
+    def _usage(path):
+        """Return (bytes, newest mtime) of a file or directory tree."""
+        stat = os.lstat(path)
+        size, newest = stat.st_size, stat.st_mtime
+        if os.path.isdir(path) and not os.path.islink(path):
+            for parent, dirs, files in os.walk(path):
+                for name in dirs + files:
+                    try:
+                        entry = os.lstat(os.path.join(parent, name))
+                    except OSError:
+                        continue
+                    size += entry.st_size
+                    newest = max(newest, entry.st_mtime)
+        return size, newest
+
+    def sweep(self):
+        """Delete unowned entries older than max_age and measure the rest.
+
+        Returns:
+            int: Number of entries deleted
+        """
+        with self._cond:
+            live = set(self._live)
+        for path in live:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            names = []
+        cutoff = time.time() - self.max_age
+        foreign = 0
+        reaped = 0
+        for name in names:
+            path = os.path.join(self.root, name)
+            if path in live:
+                continue
+            try:
+                size, newest = self._usage(path)
+                if newest >= cutoff:
+                    foreign += size
+                    continue
+                if os.path.isdir(path) and not os.path.islink(path):
+                    shutil.rmtree(path)
+                else:
+                    os.unlink(path)
+                reaped += 1
+                logger.info(f"Removed abandoned scratch entry {name} ({size} bytes)")
+            except OSError:
+                continue
+
+        with self._cond:
+            self._foreign_bytes = foreign
+            self._cond.notify_all()
+            self._publish()
+        if reaped:
+            metrics.incr('scratch.reaped', reaped)
+        return reaped
+
+    def start_janitor(self, interval=None):
+        """Sweep now and then every ``interval`` seconds in a background thread.
+
+        Args:
+            interval (float, optional): Defaults to SCRATCH_JANITOR_INTERVAL
+        """
+        interval = interval or Config.SCRATCH_JANITOR_INTERVAL
+        with self._cond:
+            if self._janitor is not None and self._janitor.is_alive():
+                return
+            self._janitor = threading.Thread(
+                target=self._run_janitor, args=(interval,), name='scratch-janitor', daemon=True
+            )
+            self._janitor.start()
+
+    def _run_janitor(self, interval):
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Error sweeping scratch space: {str(e)}")
+            time.sleep(interval)
+
+
+# Shared by every transfer in this process
+scratch = ScratchSpace()
@@ -0,0 +1,119 @@
+import time
+import threading
+from metrics import metrics
+
+
+class _Call:
+    """One in-flight call that other callers can wait on."""
+
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapses concurrent identical read calls into one.
+
+    Calls are keyed by an owner (whose credentials they use) and the call's
+    parameters. While a call is in flight, identical calls wait for it and
+    share its result or exception instead of issuing their own. A result may
+    also be kept for ``ttl`` seconds, so a burst of reloads is served without
+    another request. invalidate() starts a new generation for an owner: later
+    calls neither join calls started before it nor see results cached before
+    it, so a change made through the app is visible on the next read.
+
+    Results are shared between callers and must not be modified.
+    """
+
+    def __init__(self, name, ttl=0.0, max_entries=1024):
+        """Initialize the group.
+
+        Args:
+            name (str): Metric prefix, e.g. 'drive.read'
+            ttl (float, optional): Seconds a result is reused (0 to only coalesce)
+            max_entries (int, optional): Cached results kept before expired ones are purged
+        """
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._results = {}  # key -> (result, expires_at)
+        self._generations = {}
+        self._executed = 0
+        self._shared = 0
+
+    def do(self, owner, key, fn):
+        """Run ``fn`` unless an identical call is in flight or cached.
+
+        Args:
+            owner (str): Identifies the credentials the call runs with
+            key (tuple): Call name and parameters
+            fn (callable): Performs the call
+
+        Returns:
+            The call's result, possibly shared with other callers
+        """
+        kind = key[0]
+        with self._lock:
+            full_key = (owner, self._generations.get(owner, 0)) + tuple(key)
+            cached = self._results.get(full_key)
+            if cached is not None and cached[1] > time.monotonic():
+                self._record(kind, 'cached')
+                return cached[0]
+            call = self._calls.get(full_key)
+            leader = call is None
+            if leader:
+                call = self._calls[full_key] = _Call()
+                self._record(kind, 'executed')
+            else:
+                self._record(kind, 'coalesced')
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(full_key, None)
+                if call.error is None and self.ttl > 0:
+                    self._store(full_key, call.result)
+            call.done.set()
+
+    def invalidate(self, owner):
+        """Make the next calls for ``owner`` go to the source again.
+
+        Args:
+            owner (str): Identifies the credentials whose data changed
+        """
+        with self._lock:
+            self._generations[owner] = self._generations.get(owner, 0) + 1
+
+    def _store(self, full_key, result):
+        """Cache a result; called with the lock held."""
+        now = time.monotonic()
+        if len(self._results) >= self.max_entries:
+            self._results = {k: v for k, v in self._results.items() if v[1] > now}
+        if len(self._results) < self.max_entries:
+            self._results[full_key] = (result, now + self.ttl)
+
+    def _record(self, kind, outcome):
+        """Count a call and publish the share of calls that needed no request."""
+        if outcome == 'executed':
+            self._executed += 1
+        else:
+            self._shared += 1
+        metrics.incr(f"{self.name}.{kind}.{outcome}")
+        metrics.set_gauge(f"{self.name}.shared_ratio",
+                          round(self._shared / (self._executed + self._shared), 4))
@@ -16,6 +16,12 @@ document.addEventListener('DOMContentLoaded', function() {
         urlUploadForm.addEventListener('submit', handleUrlUpload);
     }
     
+    // Initialize bulk URL import
+    const bulkUploadForm = document.getElementById('bulk-upload-form');
+    if (bulkUploadForm) {
+        bulkUploadForm.addEventListener('submit', handleBulkUpload);
+    }
+    
     // Initialize YouTube upload
     const youtubeUploadForm = document.getElementById('youtube-upload-form');
     if (youtubeUploadForm) {
@@ -25,6 +31,10 @@ document.addEventListener('DOMContentLoaded', function() {
 
 /**
  * Handle direct file upload
+ *
+ * Signed-in users send the file straight to Google Drive over a resumable
+ * session the server opens for them; archives to expand and API-key sessions
+ * are sent to this server in chunks instead.
  * @param {Event} event - Form submit event
  */
 function handleDirectUpload(event) {
@@ -42,55 +52,273 @@ function handleDirectUpload(event) {
     }
     
     const file = fileInput.files[0];
-    const formData = new FormData();
-    formData.append('file', file);
+    const setProgress = function(loaded, total) {
+        const percentComplete = total ? Math.round((loaded / total) * 100) : 100;
+        progressBarInner.style.width = percentComplete + '%';
+        progressBarInner.setAttribute('aria-valuenow', percentComplete);
+        progressBarInner.textContent = percentComplete + '%';
+    };
     
     // Show progress bar
     progressBar.classList.remove('d-none');
-    progressBarInner.style.width = '0%';
-    progressBarInner.setAttribute('aria-valuenow', 0);
-    
-    // Start upload
-    const xhr = new XMLHttpRequest();
+    setProgress(0, 1);
     
-    // Progress listener
-    xhr.upload.addEventListener('progress', function(e) {
-        if (e.lengthComputable) {
-            const percentComplete = Math.round((e.loaded / e.total) * 100);
-            progressBarInner.style.width = percentComplete + '%';
-            progressBarInner.setAttribute('aria-valuenow', percentComplete);
-            progressBarInner.textContent = percentComplete + '%';
-        }
-    });
+    // Archives are expanded by the server, so it needs the bytes
+    const expandCheckbox = form.querySelector('input[name="expand_archive"]');
+    const upload = expandCheckbox && expandCheckbox.checked
+        ? uploadThroughServer(form, file, setProgress)
+        : postJson('/upload/direct/session', { name: file.name, size: file.size, mime_type: file.type })
+            .then(session => {
+                if (session.fallback) {
+                    return uploadThroughServer(form, file, setProgress);
+                }
+                if (session.error) {
+                    throw new Error(session.error);
+                }
+                return uploadToDrive(file, session, setProgress)
+                    .then(driveFile => postJson('/upload/direct/complete', {
+                        file_id: driveFile.id,
+                        upload_token: session.upload_token
+                    }));
+            });
     
-    // Load listener
-    xhr.addEventListener('load', function() {
-        if (xhr.status >= 200 && xhr.status < 300) {
-            const response = JSON.parse(xhr.responseText);
-            showModal('Success', `File "${file.name}" has been uploaded successfully!`);
+    upload
+        .then(data => {
+            if (data.error) {
+                throw new Error(data.error);
+            }
+            if (data.results) {
+                showArchiveResult(data);
+            } else {
+                showModal('Success', `File "${file.name}" has been uploaded successfully!`);
+            }
             form.reset();
-        } else {
-            let errorMessage = 'Upload failed.';
-            try {
-                const response = JSON.parse(xhr.responseText);
-                errorMessage = response.error || errorMessage;
-            } catch (e) {
-                // Use default error message
+        })
+        .catch(error => {
+            showModal('Error', error.message || 'An error occurred during the upload. Please try again.');
+        })
+        .finally(() => {
+            progressBar.classList.add('d-none');
+        });
+}
+
+/**
+ * Upload a file to this server in numbered chunks
+ *
+ * Several chunks are in flight at once and each one is retried on its own
+ * with exponential backoff, so a dropped connection costs one chunk rather
+ * than the whole file. The server forwards chunks to Drive as they arrive.
+ * If the server instance holding the upload stops (410), the upload starts
+ * over once.
+ * @param {HTMLFormElement} form - Upload form
+ * @param {File} file - File to upload
+ * @param {Function} onProgress - Receives (bytes acknowledged, total bytes)
+ * @param {number} [restarts=0] - Times the upload has been started over
+ * @returns {Promise<Object>} The server's JSON response to finalize
+ */
+function uploadThroughServer(form, file, onProgress, restarts = 0) {
+    const expandCheckbox = form.querySelector('input[name="expand_archive"]');
+    const init = {
+        name: file.name,
+        size: file.size,
+        mime_type: file.type,
+        expand_archive: Boolean(expandCheckbox && expandCheckbox.checked)
+    };
+    
+    return postJson('/upload/chunked', init).then(upload => {
+        if (upload.error) {
+            throw new Error(upload.error);
+        }
+        
+        const sent = new Array(upload.total_chunks).fill(0);
+        const report = function() {
+            onProgress(sent.reduce((a, b) => a + b, 0), file.size);
+        };
+        let next = 0;
+        let failed = false;
+        
+        const sendChunk = function(index, attempt) {
+            return new Promise((resolve, reject) => {
+                const start = index * upload.chunk_size;
+                const xhr = new XMLHttpRequest();
+                const retry = function(reason) {
+                    sent[index] = 0;
+                    report();
+                    if (attempt >= upload.max_retries || failed) {
+                        reject(new Error(`Chunk ${index + 1} failed: ${reason}`));
+                        return;
+                    }
+                    const delay = Math.min(1000 * Math.pow(2, attempt), 30000);
+                    setTimeout(() => sendChunk(index, attempt + 1).then(resolve, reject), delay);
+                };
+                
+                xhr.upload.addEventListener('progress', function(e) {
+                    sent[index] = e.loaded;
+                    report();
+                });
+                xhr.addEventListener('load', function() {
+                    if (xhr.status >= 200 && xhr.status < 300) {
+                        sent[index] = Math.min(upload.chunk_size, file.size - start);
+                        report();
+                        resolve();
+                    } else if (xhr.status === 410) {
+                        reject(lostUploadError());
+                    } else if (xhr.status >= 500 || xhr.status === 408 || xhr.status === 429) {
+                        retry(`server returned ${xhr.status}`);
+                    } else {
+                        let message = `Upload failed (${xhr.status}).`;
+                        try {
+                            message = JSON.parse(xhr.responseText).error || message;
+                        } catch (e) {
+                            // Use default error message
+                        }
+                        reject(new Error(message));
+                    }
+                });
+                xhr.addEventListener('error', function() {
+                    retry('network error');
+                });
+                
+                xhr.open('PUT', `${upload.url}/${index}`, true);
+                xhr.send(file.slice(start, start + upload.chunk_size));
+            });
+        };
+        
+        // Each worker takes the next unsent chunk until none are left
+        const worker = function() {
+            if (failed || next >= upload.total_chunks) {
+                return Promise.resolve();
             }
-            showModal('Error', errorMessage);
+            return sendChunk(next++, 0).then(worker);
+        };
+        const workers = [];
+        for (let i = 0; i < Math.min(upload.parallel, upload.total_chunks); i++) {
+            workers.push(worker());
         }
-        progressBar.classList.add('d-none');
+        
+        const finalize = function() {
+            return fetch(`${upload.url}/finalize`, { method: 'POST' })
+                .then(response => response.json().then(data => {
+                    if (response.status === 410) {
+                        throw lostUploadError();
+                    }
+                    return response.status === 202 ? finalize() : data;
+                }));
+        };
+        
+        return Promise.all(workers)
+            .then(finalize)
+            .catch(error => {
+                failed = true;
+                if (error.lost && restarts < 1) {
+                    return uploadThroughServer(form, file, onProgress, restarts + 1);
+                }
+                fetch(upload.url, { method: 'DELETE' });
+                throw error;
+            });
     });
-    
-    // Error listener
-    xhr.addEventListener('error', function() {
-        showModal('Error', 'An error occurred during the upload. Please try again.');
-        progressBar.classList.add('d-none');
+}
+
+/**
+ * Error for an upload whose server instance stopped holding it
+ * @returns {Error} Error flagged as lost
+ */
+function lostUploadError() {
+    const error = new Error('The server lost the upload. Please try again.');
+    error.lost = true;
+    return error;
+}
+
+/**
+ * Send a file to a Google Drive resumable upload session, chunk by chunk
+ *
+ * A failed chunk is retried with exponential backoff after asking Google how
+ * many bytes it already stored, so only the missing part is sent again.
+ * @param {File} file - File to upload
+ * @param {Object} session - upload_url, chunk_size and max_retries from the server
+ * @param {Function} onProgress - Receives (bytes stored, total bytes)
+ * @returns {Promise<Object>} The Drive file resource
+ */
+function uploadToDrive(file, session, onProgress) {
+    return new Promise((resolve, reject) => {
+        let failures = 0;
+        let committed = 0;
+        
+        const retry = function(reason) {
+            failures += 1;
+            if (failures > session.max_retries) {
+                reject(new Error(`Upload failed: ${reason}`));
+                return;
+            }
+            const delay = Math.min(1000 * Math.pow(2, failures - 1), 30000);
+            setTimeout(() => send(null), delay);
+        };
+        
+        // offset null asks for the upload status instead of sending data
+        const send = function(offset) {
+            const xhr = new XMLHttpRequest();
+            let body = null;
+            xhr.open('PUT', session.upload_url, true);
+            if (offset === null || file.size === 0) {
+                xhr.setRequestHeader('Content-Range', `bytes */${file.size}`);
+            } else {
+                const end = Math.min(offset + session.chunk_size, file.size);
+                body = file.slice(offset, end);
+                xhr.setRequestHeader('Content-Range', `bytes ${offset}-${end - 1}/${file.size}`);
+                xhr.upload.addEventListener('progress', function(e) {
+                    onProgress(offset + e.loaded, file.size);
+                });
+            }
+            
+            xhr.addEventListener('load', function() {
+                if (xhr.status === 200 || xhr.status === 201) {
+                    onProgress(file.size, file.size);
+                    resolve(JSON.parse(xhr.responseText));
+                } else if (xhr.status === 308) {
+                    // Incomplete: Range tells how much Google has stored
+                    const range = xhr.getResponseHeader('Range');
+                    const stored = range ? parseInt(range.split('-')[1], 10) + 1 : 0;
+                    if (stored > committed) {
+                        committed = stored;
+                        failures = 0;
+                    } else if (offset !== null) {
+                        retry('no progress');
+                        return;
+                    }
+                    onProgress(stored, file.size);
+                    send(stored);
+                } else if (xhr.status === 404 || xhr.status === 410) {
+                    reject(new Error('The upload session expired. Please try again.'));
+                } else if (xhr.status >= 500 || xhr.status === 408 || xhr.status === 429) {
+                    retry(`Google Drive returned ${xhr.status}`);
+                } else {
+                    reject(new Error(`Google Drive rejected the upload (${xhr.status}).`));
+                }
+            });
+            
+            xhr.addEventListener('error', function() {
+                retry('network error');
+            });
+            
+            xhr.send(body);
+        };
+        
+        send(0);
     });
-    
-    // Open and send the request
-    xhr.open('POST', '/upload/file', true);
-    xhr.send(formData);
+}
+
+/**
+ * POST a JSON body and parse the JSON response
+ * @param {string} url - Endpoint
+ * @param {Object} payload - Request body
+ * @returns {Promise<Object>} Parsed response, whatever its status
+ */
+function postJson(url, payload) {
+    return fetch(url, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(payload)
+    }).then(response => response.json());
 }
 
 /**
@@ -131,6 +359,7 @@ function handleUrlUpload(event) {
     // Create form data
     const formData = new FormData();
     formData.append('url', urlInput.value);
+    appendArchiveOption(form, formData);
     
     // Send request
     fetch('/upload/url', {
@@ -138,13 +367,17 @@ function handleUrlUpload(event) {
         body: formData
     })
     .then(response => response.json())
+    .then(waitForJob)
     .then(data => {
         clearInterval(progressInterval);
         progressBarInner.style.width = '100%';
         progressBarInner.setAttribute('aria-valuenow', 100);
         progressBarInner.textContent = '100%';
         
-        if (data.success) {
+        if (data.results) {
+            showArchiveResult(data);
+            form.reset();
+        } else if (data.success) {
             showModal('Success', data.message);
             form.reset();
         } else {
@@ -163,6 +396,72 @@ function handleUrlUpload(event) {
     });
 }
 
+/**
+ * Handle bulk URL import
+ * @param {Event} event - Form submit event
+ */
+function handleBulkUpload(event) {
+    event.preventDefault();
+    
+    const form = event.target;
+    const urlsInput = form.querySelector('textarea[name="urls"]');
+    const fileInput = form.querySelector('input[name="url_file"]');
+    const progressBar = document.querySelector('#bulk-upload-progress');
+    
+    // Validate input
+    if (!urlsInput.value.trim() && !fileInput.files.length) {
+        showModal('Error', 'Please enter some URLs or choose a list file.');
+        return;
+    }
+    
+    const formData = new FormData();
+    formData.append('urls', urlsInput.value);
+    if (fileInput.files.length) {
+        formData.append('url_file', fileInput.files[0]);
+    }
+    
+    // The batch has no byte-level progress, so show an indeterminate bar
+    progressBar.classList.remove('d-none');
+    
+    fetch('/upload/bulk', {
+        method: 'POST',
+        body: formData
+    })
+    .then(response => response.json())
+    .then(waitForJob)
+    .then(data => {
+        progressBar.classList.add('d-none');
+        if (data.results) {
+            showBulkResult(data);
+            form.reset();
+        } else {
+            showModal('Error', data.error || 'Import failed. Please try again.');
+        }
+    })
+    .catch(error => {
+        progressBar.classList.add('d-none');
+        showModal('Error', 'An error occurred during the import. Please try again.');
+        console.error('Import error:', error);
+    });
+}
+
+/**
+ * Show the aggregate outcome of a bulk URL or playlist import
+ * @param {Object} data - Report from the import endpoint
+ */
+function showBulkResult(data) {
+    const failures = data.results.filter(entry => !entry.success);
+    let html = `<p>${escapeHtml(data.message)}</p>`;
+    if (failures.length) {
+        html += '<p><strong>Failed:</strong></p><ul>';
+        failures.forEach(entry => {
+            html += `<li>${escapeHtml(entry.title || entry.url)}: ${escapeHtml(entry.error)}</li>`;
+        });
+        html += '</ul>';
+    }
+    showModal(failures.length ? 'Partially Imported' : 'Success', html, true);
+}
+
 /**
  * Handle YouTube upload
  * @param {Event} event - Form submit event
@@ -184,14 +483,17 @@ function handleYoutubeUpload(event) {
     // Basic YouTube URL validation
     const youtubeUrl = youtubeUrlInput.value.trim();
     const youtubeRegex = /^(https?:\/\/)?(www\.)?(youtube\.com\/watch\?v=|youtu\.be\/|youtube\.com\/embed\/|youtube\.com\/v\/)([a-zA-Z0-9_-]{11})/;
+    const playlistRegex = /^(https?:\/\/)?(www\.|m\.)?youtube\.com\/(playlist\?(.*&)?list=|channel\/|c\/|user\/|@)[a-zA-Z0-9_.-]+/;
     
-    if (!youtubeRegex.test(youtubeUrl)) {
-        showModal('Error', `<p>The URL you entered doesn't appear to be a valid YouTube video URL.</p>
+    if (!youtubeRegex.test(youtubeUrl) && !playlistRegex.test(youtubeUrl)) {
+        showModal('Error', `<p>The URL you entered doesn't appear to be a valid YouTube video, playlist or channel URL.</p>
                           <p>Please enter a URL in one of these formats:</p>
                           <ul>
                             <li>https://www.youtube.com/watch?v=VIDEO_ID</li>
                             <li>https://youtu.be/VIDEO_ID</li>
                             <li>https://www.youtube.com/embed/VIDEO_ID</li>
+                            <li>https://www.youtube.com/playlist?list=PLAYLIST_ID</li>
+                            <li>https://www.youtube.com/@CHANNEL</li>
                           </ul>`, true);
         return;
     }
@@ -221,6 +523,18 @@ function handleYoutubeUpload(event) {
     // Create form data
     const formData = new FormData();
     formData.append('youtube_url', youtubeUrlInput.value);
+    formData.append('import_playlist', form.querySelector('input[name="import_playlist"]').checked ? '1' : '0');
+    formData.append('playlist_folder', form.querySelector('input[name="playlist_folder"]').checked ? '1' : '0');
+    formData.append('max_height', form.querySelector('select[name="max_height"]').value);
+    formData.append('container', form.querySelector('select[name="container"]').value);
+    if (form.querySelector('input[name="audio_only"]').checked) {
+        formData.append('audio_only', '1');
+    }
+    
+    // For a single video, report the selected format and size while it downloads
+    if (youtubeRegex.test(youtubeUrl) && !form.querySelector('input[name="import_playlist"]').checked) {
+        showExpectedSize(formData);
+    }
     
     // Send request
     fetch('/upload/youtube', {
@@ -228,13 +542,17 @@ function handleYoutubeUpload(event) {
         body: formData
     })
     .then(response => response.json())
+    .then(waitForJob)
     .then(data => {
         clearInterval(progressInterval);
         progressBarInner.style.width = '100%';
         progressBarInner.setAttribute('aria-valuenow', 100);
         progressBarInner.textContent = '100%';
         
-        if (data.success) {
+        if (data.results) {
+            showBulkResult(data);
+            form.reset();
+        } else if (data.success) {
             showModal('Success', data.message);
             form.reset();
         } else {
@@ -285,6 +603,114 @@ function handleYoutubeUpload(event) {
     });
 }
 
+/**
+ * Look up the format a YouTube import will download and add it to the processing message
+ * @param {FormData} formData - The YouTube upload request body
+ */
+function showExpectedSize(formData) {
+    fetch('/api/youtube/info', {
+        method: 'POST',
+        body: formData
+    })
+    .then(response => response.json())
+    .then(info => {
+        const modalBody = document.getElementById('responseModalBody');
+        if (info.error || !modalBody) {
+            return;
+        }
+        const size = info.expected_size ? formatBytes(info.expected_size) : 'unknown size';
+        const kind = info.audio_only ? 'audio' : (info.height ? `${info.height}p video` : 'video');
+        const note = document.createElement('p');
+        note.textContent = `Selected ${kind} (${info.ext}), ${size}.`;
+        modalBody.appendChild(note);
+    })
+    .catch(error => console.error('Format lookup error:', error));
+}
+
+/**
+ * Format a byte count for display
+ * @param {number} bytes - Size in bytes
+ * @returns {string} Human readable size
+ */
+function formatBytes(bytes) {
+    const units = ['B', 'KB', 'MB', 'GB'];
+    let size = bytes;
+    let unit = 0;
+    while (size >= 1024 && unit < units.length - 1) {
+        size /= 1024;
+        unit++;
+    }
+    return `${size.toFixed(unit ? 1 : 0)} ${units[unit]}`;
+}
+
+/**
+ * Wait for a queued transfer to finish, polling its status URL
+ * @param {Object} data - Response from the upload endpoint
+ * @returns {Promise<Object>} The transfer result, or the response itself if it was not queued
+ */
+function waitForJob(data) {
+    if (!data.queued) {
+        return Promise.resolve(data);
+    }
+    return new Promise((resolve, reject) => {
+        const poll = function() {
+            fetch(data.status_url)
+                .then(response => response.json())
+                .then(job => {
+                    if (job.status === 'succeeded') {
+                        resolve(job.result);
+                    } else if (job.status === 'failed' || !job.status) {
+                        resolve({ success: false, error: job.error || 'Transfer failed.' });
+                    } else {
+                        setTimeout(poll, 2000);
+                    }
+                })
+                .catch(reject);
+        };
+        setTimeout(poll, 1000);
+    });
+}
+
+/**
+ * Add the "expand archive" flag to the request if the form's checkbox is ticked
+ * @param {HTMLFormElement} form - Upload form
+ * @param {FormData} formData - Request body
+ */
+function appendArchiveOption(form, formData) {
+    const expandCheckbox = form.querySelector('input[name="expand_archive"]');
+    if (expandCheckbox && expandCheckbox.checked) {
+        formData.append('expand_archive', '1');
+    }
+}
+
+/**
+ * Show the per-entry outcome of an expanded archive
+ * @param {Object} data - Response from the upload endpoint
+ */
+function showArchiveResult(data) {
+    const failures = data.results.filter(entry => !entry.success);
+    let html = `<p>${escapeHtml(data.message)}</p>`;
+    if (failures.length) {
+        html += '<p><strong>Failed entries:</strong></p><ul>';
+        failures.forEach(entry => {
+            html += `<li>${escapeHtml(entry.path)}: ${escapeHtml(entry.error)}</li>`;
+        });
+        html += '</ul>';
+    }
+    showModal(failures.length ? 'Partially Uploaded' : 'Success', html, true);
+}
+
+/**
+ * Escape text for safe insertion into HTML
+ * @param {string} text - Raw text
+ * @returns {string} Escaped text
+ */
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text;
+    return div.innerHTML;
+}
+
 /**
  * Show modal with message
  * @param {string} title - Modal title
@@ -0,0 +1,19 @@
+"""Cold-start budget: importing main must stay fast and must not load deferred modules."""
+from benchmarks import startup
+
+
+def test_deferred_modules_not_imported_at_startup():
+    _, modules = startup.measure(1)
+
+    loaded = set(modules)
+    assert 'main' in loaded
+    assert [name for name in startup.DEFERRED_MODULES if name in loaded] == []
+
+
+def test_startup_within_budget(capsys):
+    assert startup.main(['--runs', '3', '--top', '0']) == 0, capsys.readouterr().out
+
+
+def test_main_fails_when_a_deferred_module_loads(capsys):
+    assert startup.main(['--runs', '1', '--top', '0', '--deferred', 'flask']) == 1
+    assert 'FAIL: flask is imported at startup' in capsys.readouterr().out
@@ -0,0 +1,148 @@
+"""Tests for the database-backed transfer queue."""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+
+from app import db
+from config import Config
+from models import TransferJob
+from transfer_jobs import TransferQueue, TransferWorker, QUEUED, RUNNING, SUCCEEDED, FAILED
+
+CREDENTIALS = {'api_key': 'k', 'client_id': 'c', 'client_secret': 's'}
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'jobs.db'}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture(params=['skip_locked', 'compare_and_swap'])
+def queue(request, app, monkeypatch):
+    """A queue using each lease path; SQLite accepts and ignores FOR UPDATE."""
+    queue = TransferQueue(lease_seconds=60, max_attempts=2)
+    monkeypatch.setattr(queue, '_skip_locked', lambda: request.param == 'skip_locked')
+    return queue
+
+
+def test_lease_claims_each_job_once(queue):
+    first = queue.enqueue('url', {'n': 1}, 'owner').id
+    second = queue.enqueue('url', {'n': 2}, 'owner').id
+
+    leased = [queue.lease('a'), queue.lease('b')]
+
+    assert [job.id for job in leased] == [first, second]
+    assert [job.lease_owner for job in leased] == ['a', 'b']
+    assert all(job.status == RUNNING and job.attempts == 1 for job in leased)
+    assert queue.lease('c') is None
+
+
+def test_lease_skips_jobs_not_yet_available(queue):
+    job = queue.enqueue('url', {}, 'owner')
+    job.available_at = datetime.utcnow() + timedelta(minutes=5)
+    db.session.commit()
+
+    assert queue.lease('a') is None
+
+
+def test_lease_does_not_reclaim_running_job(queue):
+    job_id = queue.enqueue('url', {}, 'owner').id
+    assert queue.lease('a').id == job_id
+
+    assert queue.lease('b') is None
+    assert not queue.heartbeat(job_id, 'b')
+    assert queue.heartbeat(job_id, 'a')
+
+
+def test_complete_clears_credentials(queue):
+    job_id = queue.enqueue('url', {}, 'owner', credentials=CREDENTIALS).id
+    queue.lease('a')
+
+    assert queue.complete(job_id, 'a', {'file_id': 'f'})
+
+    job = db.session.get(TransferJob, job_id)
+    assert job.status == SUCCEEDED
+    assert json.loads(job.result) == {'file_id': 'f'}
+    assert job.credentials is None
+
+
+def test_fail_retries_then_clears_credentials(queue):
+    job_id = queue.enqueue('url', {}, 'owner', credentials=CREDENTIALS).id
+    queue.lease('a')
+    assert queue.fail(job_id, 'a', 'boom')
+
+    job = db.session.get(TransferJob, job_id)
+    assert job.status == QUEUED
+    assert json.loads(job.credentials) == CREDENTIALS
+
+    job.available_at = datetime.utcnow()
+    db.session.commit()
+    assert queue.lease('a').attempts == 2
+    assert queue.fail(job_id, 'a', 'boom again')
+
+    db.session.expire_all()
+    job = db.session.get(TransferJob, job_id)
+    assert job.status == FAILED
+    assert job.credentials is None
+
+
+def expire_lease(job_id):
+    db.session.get(TransferJob, job_id).lease_expires_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+
+
+def test_reclaim_expired_requeues_then_fails(queue):
+    job_id = queue.enqueue('url', {}, 'owner', credentials=CREDENTIALS).id
+    queue.lease('dead')
+    assert queue.reclaim_expired() == 0
+
+    expire_lease(job_id)
+    assert queue.reclaim_expired() == 1
+    db.session.expire_all()
+    job = db.session.get(TransferJob, job_id)
+    assert job.status == QUEUED
+    assert job.lease_owner is None
+    assert job.credentials is not None
+
+    # The old worker lost its lease; the new one can finish the job
+    assert queue.lease('alive').id == job_id
+    assert not queue.heartbeat(job_id, 'dead')
+
+    expire_lease(job_id)
+    assert queue.reclaim_expired() == 1
+    db.session.expire_all()
+    job = db.session.get(TransferJob, job_id)
+    assert job.status == FAILED
+    assert job.error == 'Worker lease expired'
+    assert job.credentials is None
+    assert queue.lease('alive') is None
+
+
+def test_worker_cancels_handler_when_lease_is_lost(app, monkeypatch):
+    monkeypatch.setattr(Config, 'TRANSFER_HEARTBEAT_SECONDS', 0.05)
+    queue = TransferQueue(lease_seconds=60)
+    job_id = queue.enqueue('slow', {}, 'owner').id
+    seen = {}
+
+    def handler(job, payload, cancelled):
+        # Another worker reclaims the job while this one is still running it
+        TransferJob.query.filter_by(id=job.id).update({'lease_owner': 'other'})
+        db.session.commit()
+        seen['cancelled'] = cancelled.wait(5)
+        raise Exception('Transfer cancelled')
+
+    worker = TransferWorker(app, queue, {'slow': handler})
+    worker._execute(queue.lease('me'), 'me')
+
+    assert seen['cancelled']
+    db.session.expire_all()
+    job = db.session.get(TransferJob, job_id)
+    assert job.status == RUNNING
+    assert job.lease_owner == 'other'
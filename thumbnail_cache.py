@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class ThumbnailCache:
+    """Size-bounded, least-recently-used thumbnail cache on local disk.
+
+    Each entry is stored as ``<sha1>.bin`` (the image) plus ``<sha1>.json``
+    (content type, upstream validators and fetch time). Recency is tracked in
+    memory and mirrored to the data file's mtime, so the LRU order survives a
+    restart. Several worker processes may share the directory; each keeps its
+    own index and treats files that disappeared underneath it as misses.
+    """
+
+    def __init__(self, directory, max_bytes):
+        """Initialize the cache, indexing whatever is already on disk.
+
+        Args:
+            directory (str): Cache directory (created if missing)
+            max_bytes (int): Total size budget for cached images
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # digest -> size, least recently used first
+        self._total = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """Index existing entries in mtime order and trim to the budget."""
+        found = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.bin'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            found.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, digest, size in sorted(found):
+            self._entries[digest] = size
+            self._total += size
+        with self._lock:
+            self._evict()
+
+    def _digest(self, key):
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _paths(self, digest):
+        base = os.path.join(self.directory, digest)
+        return base + '.bin', base + '.json'
+
+    def get(self, key):
+        """Look up an entry and mark it as recently used.
+
+        Args:
+            key (str): Cache key
+
+        Returns:
+            dict: Stored metadata plus 'path', or None on a miss
+        """
+        digest = self._digest(key)
+        data_path, meta_path = self._paths(digest)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            os.utime(data_path)
+        except (OSError, ValueError):
+            with self._lock:
+                size = self._entries.pop(digest, None)
+                if size is not None:
+                    self._total -= size
+            return None
+
+        with self._lock:
+            if digest in self._entries:
+                self._entries.move_to_end(digest)
+            else:
+                # Written by another worker process
+                size = os.path.getsize(data_path)
+                self._entries[digest] = size
+                self._total += size
+                self._evict()
+        meta['path'] = data_path
+        return meta
+
+    def put(self, key, content, **meta):
+        """Store an entry, evicting least recently used ones if over budget.
+
+        Args:
+            key (str): Cache key
+            content (bytes): Image bytes
+            **meta: Metadata to keep with the entry (content_type, etag...)
+
+        Returns:
+            dict: Stored metadata plus 'path'
+        """
+        digest = self._digest(key)
+        data_path, meta_path = self._paths(digest)
+        meta['fetched_at'] = time.time()
+        meta['size'] = len(content)
+
+        # Write to temporary names and rename so readers never see partial files
+        suffix = f'.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(data_path + suffix, 'wb') as f:
+            f.write(content)
+        with open(meta_path + suffix, 'w') as f:
+            json.dump(meta, f)
+        os.replace(data_path + suffix, data_path)
+        os.replace(meta_path + suffix, meta_path)
+
+        with self._lock:
+            previous = self._entries.pop(digest, None)
+            if previous is not None:
+                self._total -= previous
+            self._entries[digest] = len(content)
+            self._total += len(content)
+            self._evict()
+        meta['path'] = data_path
+        return meta
+
+    def refresh(self, key, **meta):
+        """Mark an entry as revalidated, optionally updating its metadata.
+
+        Args:
+            key (str): Cache key
+            **meta: Metadata fields to update
+
+        Returns:
+            dict: Updated metadata plus 'path', or None if the entry is gone
+        """
+        entry = self.get(key)
+        if entry is None:
+            return None
+        entry.pop('path')
+        entry.update(meta)
+        entry['fetched_at'] = time.time()
+        _, meta_path = self._paths(self._digest(key))
+        suffix = f'.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(meta_path + suffix, 'w') as f:
+            json.dump(entry, f)
+        os.replace(meta_path + suffix, meta_path)
+        entry['path'] = self._paths(self._digest(key))[0]
+        return entry
+
+    def _evict(self):
+        """Drop least recently used entries until under budget. Caller holds the lock."""
+        while self._total > self.max_bytes and self._entries:
+            digest, size = self._entries.popitem(last=False)
+            self._total -= size
+            for path in self._paths(digest):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+
+    @property
+    def total_bytes(self):
+        return self._total
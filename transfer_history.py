@@ -0,0 +1,267 @@
+import time
+import queue
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+from sqlalchemy import func, case
+from app import db
+from config import Config
+from metrics import metrics
+from models import Transfer
+
+logger = logging.getLogger(__name__)
+
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+# The transfer being measured by the current thread (see TransferHistory.track)
+_local = threading.local()
+
+
+class TransferRecord:
+    """Measurements of one transfer, collected while it runs."""
+
+    def __init__(self, source_kind, source_host, user_id=None, owner_key=None):
+        """Initialize the record.
+
+        Args:
+            source_kind (str): 'file', 'url' or 'youtube'
+            source_host (str): Host the content came from (None for browser uploads)
+            user_id (int, optional): OAuth user who started the transfer
+            owner_key (str, optional): Identifies whose Drive received the file
+        """
+        self.source_kind = source_kind
+        self.source_host = source_host
+        self.user_id = user_id
+        self.owner_key = owner_key
+        self.bytes = 0
+        self.download_seconds = 0.0
+        self.upload_seconds = 0.0
+        self.retries = 0
+        self.file_id = None
+        self.created_at = datetime.utcnow()
+
+    def to_row(self, outcome, error=None):
+        """Column values for the Transfer table."""
+        return {
+            'user_id': self.user_id,
+            'owner_key': self.owner_key,
+            'source_kind': self.source_kind,
+            'source_host': self.source_host,
+            'bytes': self.bytes,
+            'download_seconds': round(self.download_seconds, 3),
+            'upload_seconds': round(self.upload_seconds, 3),
+            'retries': self.retries,
+            'outcome': outcome,
+            'error': error[:1000] if error else None,
+            'file_id': self.file_id,
+            'created_at': self.created_at,
+            'hour': self.created_at.replace(minute=0, second=0, microsecond=0),
+        }
+
+
+def current():
+    """Return the calling thread's TransferRecord, or None."""
+    return getattr(_local, 'record', None)
+
+
+@contextmanager
+def phase(name):
+    """Add the time spent in the block to the current transfer's 'download' or 'upload' phase.
+
+    Does nothing when the thread isn't running a tracked transfer. A phase
+    nested inside another of the same name is already being timed and adds
+    nothing.
+    """
+    record = current()
+    active = getattr(_local, 'phases', None)
+    if active is None:
+        active = _local.phases = set()
+    if record is None or name in active:
+        yield
+        return
+    active.add(name)
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        active.discard(name)
+        setattr(record, f"{name}_seconds",
+                getattr(record, f"{name}_seconds") + time.monotonic() - started)
+
+
+def timed(name):
+    """Decorator form of phase()."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def add_bytes(count):
+    """Count bytes written to Drive by the current transfer."""
+    record = current()
+    if record is not None and count:
+        record.bytes += count
+
+
+def note_retry():
+    """Count a retried chunk or a fallback download in the current transfer."""
+    record = current()
+    if record is not None:
+        record.retries += 1
+
+
+def source_host(url):
+    """Host part of a source URL, lowercased (None if there is none)."""
+    return urlparse(url).hostname if url else None
+
+
+class TransferHistory:
+    """Records finished transfers in the database without delaying requests.
+
+    track() measures a transfer on the calling thread; the finished record is
+    put on an in-memory queue and a background thread inserts queued records
+    in batches. If the database falls behind and the queue fills up, records
+    are dropped (and counted) rather than blocking the transfer. Records
+    still queued when the process exits are lost.
+    """
+
+    def __init__(self, app, enabled=None, max_queued=None, batch_size=None):
+        """Initialize the recorder.
+
+        Args:
+            app (Flask): Application providing the database context
+            enabled (bool, optional): Defaults to TRANSFER_HISTORY_ENABLED
+            max_queued (int, optional): Records waiting to be written before new ones are dropped
+            batch_size (int, optional): Records inserted per transaction
+        """
+        self.app = app
+        self.enabled = Config.TRANSFER_HISTORY_ENABLED if enabled is None else enabled
+        self.batch_size = batch_size or Config.TRANSFER_HISTORY_BATCH_SIZE
+        self._queue = queue.Queue(max_queued or Config.TRANSFER_HISTORY_MAX_QUEUED)
+        self._writer = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def track(self, source_kind, source_url=None, user_id=None, owner_key=None):
+        """Measure the transfer run inside the block and record its outcome.
+
+        Yields:
+            TransferRecord: Set its file_id once known
+        """
+        record = TransferRecord(source_kind, source_host(source_url), user_id, owner_key)
+        outer = current()
+        _local.record = record
+        try:
+            yield record
+        except Exception as e:
+            self.submit(record.to_row(FAILED, str(e)))
+            raise
+        else:
+            self.submit(record.to_row(SUCCEEDED))
+        finally:
+            _local.record = outer
+
+    def submit(self, row):
+        """Queue a Transfer row for the background writer."""
+        if not self.enabled:
+            return
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            metrics.incr('transfer.history.dropped')
+
+    def _ensure_writer(self):
+        with self._lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._run, name='transfer-history', daemon=True)
+                self._writer.start()
+
+    def _run(self):
+        while True:
+            rows = [self._queue.get()]
+            while len(rows) < self.batch_size:
+                try:
+                    rows.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(rows)
+            for _ in rows:
+                self._queue.task_done()
+
+    def _write(self, rows):
+        """Insert a batch of rows, dropping it if the database refuses."""
+        try:
+            with self.app.app_context():
+                db.session.bulk_insert_mappings(Transfer, rows)
+                db.session.commit()
+            metrics.incr('transfer.history.written', len(rows))
+        except Exception as e:
+            logger.error(f"Error recording transfer history: {str(e)}")
+            metrics.incr('transfer.history.dropped', len(rows))
+
+    def flush(self, timeout=5.0):
+        """Wait until queued records have been written, e.g. before shutting down."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+
+def throughput_stats(group_by='host', hours=24, owner_key=None):
+    """Aggregate recorded transfers per source host or per hour.
+
+    Must run inside an application context.
+
+    Args:
+        group_by (str): 'host' or 'hour'
+        hours (int): How far back to look
+        owner_key (str, optional): Only count this owner's transfers
+
+    Returns:
+        list: One dict per group, busiest first for hosts and oldest first for hours
+    """
+    column = Transfer.source_host if group_by == 'host' else Transfer.hour
+    succeeded = Transfer.outcome == SUCCEEDED
+    ok_bytes = func.sum(case((succeeded, Transfer.bytes), else_=0))
+    ok_download = func.sum(case((succeeded, Transfer.download_seconds), else_=0.0))
+    ok_upload = func.sum(case((succeeded, Transfer.upload_seconds), else_=0.0))
+    query = db.session.query(
+        column,
+        func.count(Transfer.id),
+        func.sum(case((succeeded, 0), else_=1)),
+        ok_bytes,
+        ok_download,
+        ok_upload,
+        func.sum(Transfer.retries),
+    ).filter(Transfer.hour >= datetime.utcnow() - timedelta(hours=hours))
+    if owner_key is not None:
+        query = query.filter(Transfer.owner_key == owner_key)
+    query = query.group_by(column)
+    query = query.order_by(ok_bytes.desc()) if group_by == 'host' else query.order_by(column)
+
+    def rate(byte_count, seconds):
+        return round(byte_count / seconds / (1024 * 1024), 3) if seconds else None
+
+    stats = []
+    for key, count, failed, byte_count, download, upload, retries in query:
+        byte_count, download, upload = int(byte_count or 0), float(download or 0), float(upload or 0)
+        stats.append({
+            group_by: key.isoformat() if isinstance(key, datetime) else key,
+            'transfers': count,
+            'failed': int(failed or 0),
+            'error_rate': round((failed or 0) / count, 4),
+            'retries': int(retries or 0),
+            'bytes': byte_count,
+            'download_mb_s': rate(byte_count, download),
+            'upload_mb_s': rate(byte_count, upload),
+            'end_to_end_mb_s': rate(byte_count, download + upload),
+        })
+    return stats
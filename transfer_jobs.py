@@ -0,0 +1,414 @@
+import os
+import json
+import time
+import socket
+import logging
+import threading
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import and_
+from app import db
+from config import Config
+from metrics import metrics
+from models import TransferJob
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+# Dialects that understand SELECT ... FOR UPDATE SKIP LOCKED
+SKIP_LOCKED_DIALECTS = {'postgresql', 'mysql', 'mariadb', 'oracle'}
+
+# Queued jobs tried per lease attempt by the compare-and-swap fallback
+FALLBACK_CANDIDATES = 8
+
+
+class TransferQueue:
+    """Durable transfer queue stored in the application database.
+
+    Jobs are claimed with a lease: the claiming worker owns the job until
+    lease_expires_at and must extend it with heartbeats while it works. Jobs
+    whose lease expired (the worker or its instance died) are put back in the
+    queue by reclaim_expired(), or failed once they have used up their attempts.
+
+    On PostgreSQL (and other databases supporting it) a job is claimed with
+    SELECT ... FOR UPDATE SKIP LOCKED so concurrent workers never block on or
+    double-claim the same row. SQLite has no row locks, so there a candidate is
+    claimed with a conditional UPDATE that only succeeds if nobody else
+    claimed it first. Every method must run inside an application context.
+
+    API credentials stored with a job are only needed while it can still run,
+    so they are cleared as soon as the job succeeds or finally fails.
+    """
+
+    def __init__(self, lease_seconds=None, max_attempts=None):
+        """Initialize the queue.
+
+        Args:
+            lease_seconds (int, optional): Lease length (defaults to TRANSFER_LEASE_SECONDS)
+            max_attempts (int, optional): Attempts before a job fails (defaults to TRANSFER_MAX_ATTEMPTS)
+        """
+        self.lease_seconds = lease_seconds or Config.TRANSFER_LEASE_SECONDS
+        self.max_attempts = max_attempts or Config.TRANSFER_MAX_ATTEMPTS
+
+    def enqueue(self, kind, payload, owner_key, user_id=None, credentials=None):
+        """Add a job to the queue.
+
+        Args:
+            kind (str): Handler name
+            payload (dict): JSON-serialisable handler arguments
+            owner_key (str): Identifies whose Drive the job writes to
+            user_id (int, optional): OAuth user whose tokens the job uses
+            credentials (dict, optional): API credentials when there is no OAuth user
+
+        Returns:
+            TransferJob: The queued job
+        """
+        job = TransferJob(
+            kind=kind,
+            payload=json.dumps(payload),
+            owner_key=owner_key,
+            user_id=user_id,
+            credentials=json.dumps(credentials) if credentials else None,
+            status=QUEUED,
+            available_at=datetime.utcnow(),
+        )
+        db.session.add(job)
+        db.session.commit()
+        metrics.incr('transfer.jobs.enqueued')
+        return job
+
+    def get(self, job_id):
+        """Return a job by ID, or None."""
+        return db.session.get(TransferJob, job_id)
+
+    def _skip_locked(self):
+        return db.engine.dialect.name in SKIP_LOCKED_DIALECTS
+
+    def lease(self, worker_id):
+        """Claim the oldest available job.
+
+        Args:
+            worker_id (str): Unique ID of the claiming worker
+
+        Returns:
+            TransferJob: The claimed job, or None if the queue is empty
+        """
+        now = datetime.utcnow()
+        available = TransferJob.query.filter(
+            TransferJob.status == QUEUED, TransferJob.available_at <= now
+        ).order_by(TransferJob.id)
+        claim = {
+            'status': RUNNING,
+            'lease_owner': worker_id,
+            'lease_expires_at': now + timedelta(seconds=self.lease_seconds),
+            'heartbeat_at': now,
+            'started_at': now,
+        }
+
+        if self._skip_locked():
+            job = available.with_for_update(skip_locked=True).first()
+            if job is None:
+                db.session.rollback()
+                return None
+            for field, value in claim.items():
+                setattr(job, field, value)
+            job.attempts += 1
+            db.session.commit()
+            metrics.incr('transfer.jobs.leased')
+            return job
+
+        # No row locks: claim with a compare-and-swap UPDATE on status
+        candidates = [job.id for job in available.limit(FALLBACK_CANDIDATES)]
+        db.session.rollback()
+        for job_id in candidates:
+            job = self.claim(job_id, worker_id)
+            if job is not None:
+                return job
+        return None
+
+    def claim(self, job_id, worker_id):
+        """Claim one queued job by ID, if nobody else claimed it first.
+
+        Args:
+            job_id (int): Job to claim
+            worker_id (str): Unique ID of the claiming worker
+
+        Returns:
+            TransferJob: The claimed job, or None if it is no longer queued
+        """
+        now = datetime.utcnow()
+        claimed = TransferJob.query.filter(
+            TransferJob.id == job_id, TransferJob.status == QUEUED
+        ).update({
+            'status': RUNNING,
+            'lease_owner': worker_id,
+            'lease_expires_at': now + timedelta(seconds=self.lease_seconds),
+            'heartbeat_at': now,
+            'started_at': now,
+            'attempts': TransferJob.attempts + 1,
+        }, synchronize_session=False)
+        db.session.commit()
+        if not claimed:
+            return None
+        metrics.incr('transfer.jobs.leased')
+        return self.get(job_id)
+
+    def _update_owned(self, job_id, worker_id, values):
+        """Update a job only while `worker_id` still holds its lease."""
+        updated = TransferJob.query.filter(
+            TransferJob.id == job_id,
+            TransferJob.status == RUNNING,
+            TransferJob.lease_owner == worker_id,
+        ).update(values, synchronize_session=False)
+        db.session.commit()
+        return bool(updated)
+
+    def heartbeat(self, job_id, worker_id):
+        """Extend a lease.
+
+        Args:
+            job_id (int): Job being worked on
+            worker_id (str): Worker holding the lease
+
+        Returns:
+            bool: False if the lease was lost (expired and reclaimed)
+        """
+        now = datetime.utcnow()
+        return self._update_owned(job_id, worker_id, {
+            'heartbeat_at': now,
+            'lease_expires_at': now + timedelta(seconds=self.lease_seconds),
+        })
+
+    def complete(self, job_id, worker_id, result):
+        """Mark a job as done.
+
+        Args:
+            job_id (int): Job ID
+            worker_id (str): Worker holding the lease
+            result (dict): JSON-serialisable result
+
+        Returns:
+            bool: False if the lease was lost and the result discarded
+        """
+        done = self._update_owned(job_id, worker_id, {
+            'status': SUCCEEDED,
+            'result': json.dumps(result),
+            'error': None,
+            'finished_at': datetime.utcnow(),
+            'lease_owner': None,
+            'lease_expires_at': None,
+            'credentials': None,
+        })
+        if done:
+            metrics.incr('transfer.jobs.succeeded')
+        return done
+
+    def fail(self, job_id, worker_id, error, retry=True):
+        """Record a failed attempt, re-queueing the job if attempts remain.
+
+        Args:
+            job_id (int): Job ID
+            worker_id (str): Worker holding the lease
+            error (str): Error message
+            retry (bool): Whether the failure may be transient
+
+        Returns:
+            bool: False if the lease was lost
+        """
+        job = self.get(job_id)
+        if job is None:
+            return False
+        now = datetime.utcnow()
+        values = {'error': error, 'lease_owner': None, 'lease_expires_at': None}
+        if retry and job.attempts < self.max_attempts:
+            backoff = Config.TRANSFER_RETRY_BACKOFF_SECONDS * 2 ** (job.attempts - 1)
+            values.update(status=QUEUED, available_at=now + timedelta(seconds=backoff))
+            metrics.incr('transfer.jobs.retried')
+        else:
+            values.update(status=FAILED, finished_at=now, credentials=None)
+            metrics.incr('transfer.jobs.failed')
+        return self._update_owned(job_id, worker_id, values)
+
+    def reclaim_expired(self):
+        """Return jobs whose worker stopped sending heartbeats to the queue.
+
+        Returns:
+            int: Number of jobs re-queued or failed
+        """
+        now = datetime.utcnow()
+        expired = and_(TransferJob.status == RUNNING, TransferJob.lease_expires_at < now)
+        requeued = TransferJob.query.filter(
+            expired, TransferJob.attempts < self.max_attempts
+        ).update({
+            'status': QUEUED,
+            'lease_owner': None,
+            'lease_expires_at': None,
+            'available_at': now,
+            'error': 'Worker lease expired',
+        }, synchronize_session=False)
+        failed = TransferJob.query.filter(
+            expired, TransferJob.attempts >= self.max_attempts
+        ).update({
+            'status': FAILED,
+            'lease_owner': None,
+            'lease_expires_at': None,
+            'finished_at': now,
+            'error': 'Worker lease expired',
+            'credentials': None,
+        }, synchronize_session=False)
+        db.session.commit()
+        if requeued or failed:
+            logger.warning(f"Reclaimed {requeued + failed} transfer job(s) with expired leases")
+            metrics.incr('transfer.jobs.reclaimed', requeued + failed)
+        return requeued + failed
+
+
+class TransferWorker:
+    """Background threads that run queued transfers in this process.
+
+    Every app instance runs its own workers, so queued transfers spread over
+    all instances rather than running where the request arrived. Handlers are
+    called as handler(job, payload, cancelled) inside an application context
+    and return a JSON-serialisable result; raising fails the attempt.
+    `cancelled` is a threading.Event set when the worker loses the job's
+    lease: the job may already be running elsewhere, so the handler must stop
+    writing as soon as it can.
+    """
+
+    def __init__(self, app, queue, handlers, threads=None):
+        """Initialize the worker.
+
+        Args:
+            app (Flask): Application providing the database context
+            queue (TransferQueue): Queue to lease jobs from
+            handlers (dict): Job kind -> handler function
+            threads (int, optional): Worker threads (defaults to TRANSFER_WORKER_THREADS)
+        """
+        self.app = app
+        self.queue = queue
+        self.handlers = handlers
+        self.threads = threads or Config.TRANSFER_WORKER_THREADS
+        self.instance_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._stop = threading.Event()
+        self._threads = []
+        self._last_reclaim = 0.0
+        self._reclaim_lock = threading.Lock()
+
+    def start(self):
+        """Start the worker threads."""
+        for index in range(self.threads):
+            thread = threading.Thread(
+                target=self._run, args=(f"{self.instance_id}/{index}",),
+                name=f"transfer-worker-{index}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started {self.threads} transfer worker(s) as {self.instance_id}")
+
+    def stop(self, timeout=None):
+        """Ask the worker threads to exit after their current job."""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def run(self, job):
+        """Run one queued job on a new background thread of this process.
+
+        Used when no worker threads poll the queue: the job is still leased
+        and heartbeated, so its status is reported like any queued transfer.
+
+        Args:
+            job (TransferJob): Job just returned by TransferQueue.enqueue()
+        """
+        thread = threading.Thread(
+            target=self._run_one, args=(job.id, f"{self.instance_id}/job-{job.id}"),
+            name=f"transfer-job-{job.id}", daemon=True
+        )
+        thread.start()
+
+    def _run_one(self, job_id, worker_id):
+        try:
+            with self.app.app_context():
+                job = self.queue.claim(job_id, worker_id)
+                if job is not None:
+                    self._execute(job, worker_id)
+        except Exception as e:
+            logger.error(f"Error running transfer job {job_id}: {str(e)}")
+
+    def _run(self, worker_id):
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    self._maybe_reclaim()
+                    job = self.queue.lease(worker_id)
+                    if job is not None:
+                        self._execute(job, worker_id)
+                        continue
+            except Exception as e:
+                logger.error(f"Error in transfer worker {worker_id}: {str(e)}")
+            self._stop.wait(Config.TRANSFER_POLL_SECONDS)
+
+    def _maybe_reclaim(self):
+        """Reclaim expired leases at most once per heartbeat interval per process."""
+        with self._reclaim_lock:
+            if time.monotonic() - self._last_reclaim < Config.TRANSFER_HEARTBEAT_SECONDS:
+                return
+            self._last_reclaim = time.monotonic()
+        self.queue.reclaim_expired()
+
+    def _execute(self, job, worker_id):
+        """Run one leased job, heartbeating until the handler returns."""
+        job_id = job.id
+        handler = self.handlers.get(job.kind)
+        if handler is None:
+            self.queue.fail(job_id, worker_id, f"Unknown job kind: {job.kind}", retry=False)
+            return
+
+        # Detach the loaded job and end the transaction so no database
+        # connection sits idle in a transaction for the whole transfer
+        db.session.expunge(job)
+        db.session.commit()
+
+        done = threading.Event()
+        cancelled = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._heartbeat, args=(job_id, worker_id, done, cancelled), daemon=True
+        )
+        heartbeat.start()
+        started = time.monotonic()
+        try:
+            result = handler(job, json.loads(job.payload), cancelled)
+        except Exception as e:
+            if cancelled.is_set():
+                logger.warning(f"Stopped transfer job {job_id} after losing its lease")
+                done.set()
+                heartbeat.join()
+                return
+            logger.error(f"Error running transfer job {job_id}: {str(e)}")
+            done.set()
+            heartbeat.join()
+            self.queue.fail(job_id, worker_id, str(e))
+            return
+        done.set()
+        heartbeat.join()
+        metrics.observe('transfer.jobs.duration_seconds', time.monotonic() - started)
+        if not self.queue.complete(job_id, worker_id, result):
+            logger.warning(f"Lost lease on transfer job {job_id} before it completed")
+
+    def _heartbeat(self, job_id, worker_id, done, cancelled):
+        while not done.wait(Config.TRANSFER_HEARTBEAT_SECONDS):
+            try:
+                with self.app.app_context():
+                    if not self.queue.heartbeat(job_id, worker_id):
+                        # Reclaimed by another worker: stop the handler so the
+                        # job doesn't run twice at once
+                        logger.warning(f"Lost lease on transfer job {job_id}; cancelling it")
+                        metrics.incr('transfer.jobs.cancelled')
+                        cancelled.set()
+                        return
+            except Exception as e:
+                logger.error(f"Error renewing lease on transfer job {job_id}: {str(e)}")
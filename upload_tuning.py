@@ -0,0 +1,139 @@
+import threading
+from googleapiclient.http import MediaIoBaseUpload
+from config import Config
+from metrics import metrics
+
+# Drive requires resumable chunks to be multiples of 256 KB
+CHUNK_ALIGNMENT = 256 * 1024
+
+# Smoothing factor for throughput estimates
+_EWMA_ALPHA = 0.3
+
+_estimate_lock = threading.Lock()
+_throughput_estimate = None  # bytes/second, shared by all transfers in this process
+
+
+def align_chunk_size(size):
+    """Round a chunk size down to a multiple of 256 KB (at least one unit).
+
+    Args:
+        size (float): Desired chunk size in bytes
+
+    Returns:
+        int: Aligned chunk size
+    """
+    return max(CHUNK_ALIGNMENT, int(size) // CHUNK_ALIGNMENT * CHUNK_ALIGNMENT)
+
+
+def use_simple_upload(size):
+    """Whether a transfer is small enough for a single-request upload.
+
+    Args:
+        size (int): Total transfer size in bytes, or None if unknown
+
+    Returns:
+        bool: True to upload with one multipart request
+    """
+    return size is not None and size <= Config.UPLOAD_SIMPLE_MAX_SIZE
+
+
+class ChunkTuner:
+    """Chooses the chunk size of one resumable upload.
+
+    The first chunk is sized from the process-wide throughput estimate (or
+    UPLOAD_CHUNK_INITIAL_SIZE when nothing has been measured yet). After every
+    chunk the size is re-aimed so that a chunk takes about
+    UPLOAD_CHUNK_TARGET_SECONDS at the measured throughput, growing at most 2x
+    per step. Errors halve the chunk so that a flaky link re-sends less data,
+    and a high error rate caps the chunk at a quarter of the maximum.
+    """
+
+    def __init__(self, total_size=None):
+        """Initialize a tuner for one upload.
+
+        Args:
+            total_size (int, optional): Total bytes to upload, if known
+        """
+        self.total_size = total_size
+        self.min_size = align_chunk_size(Config.UPLOAD_CHUNK_MIN_SIZE)
+        self.max_size = align_chunk_size(Config.UPLOAD_CHUNK_MAX_SIZE)
+        self.target_seconds = Config.UPLOAD_CHUNK_TARGET_SECONDS
+        self.chunks = 0
+        self.errors = 0
+        self.throughput = None
+
+        estimate = _throughput_estimate
+        if estimate:
+            initial = estimate * self.target_seconds
+        else:
+            initial = Config.UPLOAD_CHUNK_INITIAL_SIZE
+        self.chunk_size = self._clamp(initial)
+
+    def _clamp(self, size):
+        """Clamp and align a proposed chunk size."""
+        upper = self.max_size
+        if self.chunks + self.errors >= 4 and self.errors / (self.chunks + self.errors) > 0.2:
+            upper = max(self.min_size, align_chunk_size(self.max_size // 4))
+        if self.total_size:
+            # No point in a chunk bigger than the whole upload
+            upper = min(upper, align_chunk_size(self.total_size + CHUNK_ALIGNMENT - 1))
+        return align_chunk_size(min(max(size, self.min_size), max(upper, self.min_size)))
+
+    def record_chunk(self, nbytes, seconds):
+        """Feed back a successfully uploaded chunk.
+
+        Args:
+            nbytes (int): Bytes sent in the chunk
+            seconds (float): Wall time of the chunk request
+        """
+        global _throughput_estimate
+
+        self.chunks += 1
+        metrics.observe('drive.upload.chunk_size', self.chunk_size)
+        if nbytes <= 0 or seconds <= 0:
+            return
+
+        rate = nbytes / seconds
+        if self.throughput is None:
+            self.throughput = rate
+        else:
+            self.throughput = _EWMA_ALPHA * rate + (1 - _EWMA_ALPHA) * self.throughput
+        with _estimate_lock:
+            if _throughput_estimate is None:
+                _throughput_estimate = rate
+            else:
+                _throughput_estimate = _EWMA_ALPHA * rate + (1 - _EWMA_ALPHA) * _throughput_estimate
+            metrics.set_gauge('drive.upload.throughput_estimate_bps', round(_throughput_estimate))
+
+        proposed = min(self.throughput * self.target_seconds, self.chunk_size * 2)
+        self.chunk_size = self._clamp(proposed)
+
+    def record_error(self):
+        """Feed back a failed chunk attempt."""
+        self.errors += 1
+        metrics.incr('drive.upload.chunk_errors')
+        self.chunk_size = self._clamp(self.chunk_size // 2)
+
+
+class AdaptiveMediaIoBaseUpload(MediaIoBaseUpload):
+    """Resumable MediaIoBaseUpload whose chunk size is read from a ChunkTuner.
+
+    googleapiclient asks the media object for its chunk size before every
+    chunk, so changing ``tuner.chunk_size`` between ``next_chunk()`` calls
+    takes effect on the next request.
+    """
+
+    def __init__(self, fd, mimetype, tuner):
+        """Initialize the media upload.
+
+        Args:
+            fd (io.Base): Seekable file-like object to upload
+            mimetype (str): MIME type of the content
+            tuner (ChunkTuner): Tuner that decides the chunk sizes
+        """
+        super().__init__(fd, mimetype, chunksize=tuner.chunk_size, resumable=True)
+        self.tuner = tuner
+
+    def chunksize(self):
+        """Chunk size for the next request."""
+        return self.tuner.chunk_size
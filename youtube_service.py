@@ -1,13 +1,83 @@
 import os
-import tempfile
 import logging
 import re
 import subprocess
 import json
+from contextlib import contextmanager, ExitStack
 from urllib.parse import urlparse, parse_qs
+from mime_detection import registry as mime_registry, SNIFF_BYTES
+from metrics import metrics
+from scratch_space import scratch
+import transfer_history
 
 logger = logging.getLogger(__name__)
 
+# Output heights offered to users (None means the best available). Without
+# ffmpeg only single-file formats can be downloaded, and those stop at 720p,
+# so higher caps would change nothing.
+MAX_HEIGHTS = (720, 480, 360, 240, 144)
+VIDEO_CONTAINERS = ('mp4', 'webm')
+AUDIO_CONTAINERS = ('m4a', 'webm')
+
+# Audio-only downloads come in video containers; name them as audio
+AUDIO_MIME_TYPES = {
+    'video/mp4': 'audio/mp4',
+    'video/webm': 'audio/webm',
+    'video/x-matroska': 'audio/x-matroska',
+}
+
+def format_selector(options=None):
+    """Build a youtube-dl format selector for the requested download options.
+    
+    Only single-file formats are selected, so no ffmpeg merge step is needed.
+    That limits video to what sites serve with audio included, at most 720p
+    on YouTube.
+    Each filter falls back to a looser one, so a video that lacks the exact
+    combination still downloads instead of failing.
+    
+    Args:
+        options (dict, optional): max_height (int), container (str) and
+            audio_only (bool)
+        
+    Returns:
+        str: Format selector for youtube-dl's -f option
+    """
+    options = options or {}
+    container = options.get('container')
+    
+    if options.get('audio_only'):
+        # MP4's audio-only files are M4A. Never fall back to a format with
+        # video: an audio-only request gets audio or fails.
+        container = 'm4a' if container == 'mp4' else container
+        if container in AUDIO_CONTAINERS:
+            return f"bestaudio[ext={container}]/bestaudio/best[vcodec=none]"
+        return "bestaudio/best[vcodec=none]"
+    
+    container = 'mp4' if container == 'm4a' else container
+    height = f"[height<=?{options['max_height']}]" if options.get('max_height') else ''
+    ext = f"[ext={container}]" if container in VIDEO_CONTAINERS else ''
+    selectors = [f"best{height}{ext}", f"best{height}", "best"]
+    # Drop duplicates left when no filter was requested
+    return '/'.join(dict.fromkeys(selectors))
+
+def expected_size(video_info):
+    """Return the expected download size of the selected format, if known.
+    
+    Args:
+        video_info (dict): youtube-dl JSON info for the selected format
+        
+    Returns:
+        int: Size in bytes, or None
+    """
+    formats = video_info.get('requested_formats') or [video_info]
+    total = 0
+    for fmt in formats:
+        size = fmt.get('filesize') or fmt.get('filesize_approx')
+        if not size:
+            return None
+        total += int(size)
+    return total
+
 class YouTubeService:
     """Service class for YouTube operations."""
     
@@ -47,6 +117,94 @@ class YouTubeService:
             
         return None
     
+    def _extract_playlist_id(self, youtube_url):
+        """Extract playlist ID from YouTube URL.
+        
+        Args:
+            youtube_url (str): YouTube playlist or video URL
+            
+        Returns:
+            str: YouTube playlist ID or None
+        """
+        parsed_url = urlparse(youtube_url)
+        if 'youtube.com' not in parsed_url.netloc and 'youtu.be' not in parsed_url.netloc:
+            return None
+        query = parse_qs(parsed_url.query)
+        if 'list' in query:
+            return query['list'][0]
+        return None
+    
+    def is_playlist_url(self, youtube_url, include_video_lists=False):
+        """Whether a URL names a playlist or channel rather than a single video.
+        
+        Args:
+            youtube_url (str): YouTube URL
+            include_video_lists (bool): Also treat a video URL with a list=
+                parameter as its playlist
+            
+        Returns:
+            bool: True for playlist and channel URLs
+        """
+        parsed_url = urlparse(youtube_url)
+        if 'youtube.com' not in parsed_url.netloc:
+            return include_video_lists and self._extract_playlist_id(youtube_url) is not None
+        path = parsed_url.path
+        if path.startswith('/playlist'):
+            return self._extract_playlist_id(youtube_url) is not None
+        if re.match(r'^/(channel/|c/|user/|@)', path):
+            return True
+        return include_video_lists and self._extract_playlist_id(youtube_url) is not None
+    
+    def list_playlist(self, playlist_url):
+        """List the videos of a playlist or channel with a single flat extraction.
+        
+        Only the playlist page is fetched; the videos themselves are not
+        resolved, so this takes one request however long the playlist is.
+        
+        Args:
+            playlist_url (str): YouTube playlist or channel URL
+            
+        Returns:
+            dict: id, title and entries (each with id, title and url)
+        """
+        playlist_id = self._extract_playlist_id(playlist_url)
+        if playlist_id and not urlparse(playlist_url).path.startswith('/playlist'):
+            # A video URL with list=: expand the list, not the video
+            playlist_url = f"https://www.youtube.com/playlist?list={playlist_id}"
+        
+        cmd = [
+            'youtube-dl',
+            '--flat-playlist',
+            '--dump-single-json',
+            playlist_url
+        ]
+        
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+            info = json.loads(result.stdout)
+        except subprocess.CalledProcessError as e:
+            logger.error(f"YouTube playlist subprocess error: {e.stderr}")
+            raise Exception(self._format_error_message(e.stderr))
+        except ValueError as e:
+            raise Exception(f"Failed to read YouTube playlist: {str(e)}")
+        
+        entries = []
+        for entry in info.get('entries') or []:
+            video_id = entry.get('id')
+            if not video_id:
+                continue
+            entries.append({
+                'id': video_id,
+                'title': entry.get('title') or video_id,
+                'url': f"https://www.youtube.com/watch?v={video_id}"
+            })
+        
+        return {
+            'id': info.get('id') or playlist_id,
+            'title': info.get('title') or playlist_id or 'YouTube playlist',
+            'entries': entries
+        }
+    
     def _format_error_message(self, error_msg, video_id=None):
         """Format error message to be more user-friendly.
         
@@ -78,6 +236,10 @@ class YouTubeService:
         if "This video has been removed" in error_msg:
             return f"This video has been removed or deleted from YouTube{vid_info}. Please try another video."
         
+        # No format passed the selector's filters (only audio-only requests can miss)
+        if "requested format not available" in error_msg.lower():
+            return f"No audio-only format is available for this video{vid_info}. Please try another video or download it with video."
+        
         # YouTube extractor errors
         if "Unable to extract" in error_msg:
             return f"Unable to process this YouTube video{vid_info}. This might be due to YouTube changing their site. Please try another video or try again later."
@@ -85,111 +247,172 @@ class YouTubeService:
         # Fallback error message
         return f"Failed to download YouTube video{vid_info}: {error_msg}"
     
-    def download_video(self, youtube_url):
-        """Download a video from YouTube.
+    def _video_info(self, youtube_url, selector):
+        """Run youtube-dl --dump-json for the format a download would pick."""
+        cmd = [
+            'youtube-dl',
+            '--no-playlist',
+            '-f', selector,
+            '--dump-json',
+            youtube_url
+        ]
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        return json.loads(result.stdout)
+    
+    def _describe(self, video_info, selector):
+        """Summarise the selected format of a video."""
+        return {
+            'id': video_info.get('id'),
+            'title': video_info.get('title', 'youtube_video'),
+            'format_id': video_info.get('format_id'),
+            'format_selector': selector,
+            'ext': video_info.get('ext'),
+            'height': video_info.get('height'),
+            'audio_only': video_info.get('vcodec') == 'none',
+            'duration': video_info.get('duration'),
+            'expected_size': expected_size(video_info)
+        }
+    
+    def _check_selected(self, description, options, video_id):
+        """Refuse a selected format that has video when only audio was asked for."""
+        if (options or {}).get('audio_only') and not description['audio_only']:
+            vid_info = f" (Video ID: {video_id})" if video_id else ""
+            raise Exception(f"No audio-only format is available for this video{vid_info}. Please try another video or download it with video.")
+    
+    def probe(self, youtube_url, options=None):
+        """Describe what a download with these options would fetch.
         
         Args:
             youtube_url (str): YouTube video URL
+            options (dict, optional): Download options (see format_selector)
             
         Returns:
+            dict: Title, selected format and expected size in bytes (None if unknown)
+        """
+        video_id = self._extract_video_id(youtube_url)
+        selector = format_selector(options)
+        try:
+            description = self._describe(self._video_info(youtube_url, selector), selector)
+            self._check_selected(description, options, video_id)
+            return description
+        except subprocess.CalledProcessError as e:
+            logger.error(f"YouTube info subprocess error: {e.stderr}")
+            raise Exception(self._format_error_message(e.stderr, video_id))
+        except ValueError as e:
+            raise Exception(self._format_error_message(str(e), video_id))
+    
+    @contextmanager
+    def download_video(self, youtube_url, options=None, on_info=None):
+        """Download a video from YouTube into scratch space.
+        
+        Use it as a context manager: the download is deleted when the block
+        exits. Space for the expected size is reserved before youtube-dl
+        starts, so a burst of imports waits for disk instead of filling it.
+        
+        Args:
+            youtube_url (str): YouTube video URL
+            options (dict, optional): max_height, container and audio_only
+                (see format_selector); defaults to the best single file
+            on_info (callable, optional): Called with the probe() description,
+                including the expected size, before the download starts
+            
+        Yields:
             tuple: (file_path, filename, mime_type)
         """
         video_id = None  # Initialize here to avoid undefined variable error
-        temp_dir = None
         
-        try:
-            # Create a temporary directory
-            temp_dir = tempfile.mkdtemp()
-            video_id = self._extract_video_id(youtube_url)
-            if not video_id:
-                raise Exception("Could not extract YouTube video ID from URL")
-                
-            output_template = os.path.join(temp_dir, '%(title)s.%(ext)s')
-            
-            # First try to get info without downloading to check availability
-            logger.info(f"Checking YouTube video: {youtube_url}")
-            
-            # Run command with python-subprocess instead of using youtube_dl directly
-            # This gives us more control and helps isolate issues
-            cmd = [
-                'youtube-dl', 
-                '--no-playlist',
-                '--dump-json',
-                youtube_url
-            ]
-            
+        with ExitStack() as stack:
             try:
-                # Get video info to check if downloadable
-                result = subprocess.run(
-                    cmd, 
-                    capture_output=True, 
-                    text=True, 
-                    check=True
-                )
-                
-                # If we get here, the video info was successfully extracted
-                video_info = json.loads(result.stdout)
-                title = video_info.get('title', 'youtube_video')
-                
-                # Now download the actual video
-                download_cmd = [
-                    'youtube-dl',
-                    '--no-playlist',
-                    '-f', 'best',  # Get best quality
-                    '-o', output_template,
-                    youtube_url
-                ]
-                
-                logger.info(f"Downloading video: {title}")
-                download_result = subprocess.run(
-                    download_cmd,
-                    capture_output=True,
-                    text=True,
-                    check=True
-                )
-                
-                # Get the output filename
-                # This is a bit tricky as youtube-dl might change the extension
-                files = os.listdir(temp_dir)
-                if not files:
-                    raise Exception("Download completed but no file was created.")
-                
-                downloaded_file = os.path.join(temp_dir, files[0])
-                file_extension = os.path.splitext(downloaded_file)[1][1:]  # Remove the dot
+                video_id = self._extract_video_id(youtube_url)
+                if not video_id:
+                    raise Exception("Could not extract YouTube video ID from URL")
                 
-                # Get mime type based on extension
-                mime_type = 'video/mp4'  # Default
-                if file_extension == 'mp4':
-                    mime_type = 'video/mp4'
-                elif file_extension == 'webm':
-                    mime_type = 'video/webm'
-                elif file_extension == 'mkv':
-                    mime_type = 'video/x-matroska'
-                elif file_extension in ['m4a', 'mp3', 'ogg', 'wav']:
-                    mime_type = f'audio/{file_extension}'
+                # First try to get info without downloading to check availability
+                logger.info(f"Checking YouTube video: {youtube_url}")
                 
-                return downloaded_file, f"{title}.{file_extension}", mime_type
+                # Run command with python-subprocess instead of using youtube_dl directly
+                # This gives us more control and helps isolate issues
+                selector = format_selector(options)
                 
-            except subprocess.CalledProcessError as e:
-                error_output = e.stderr
-                logger.error(f"YouTube download subprocess error: {error_output}")
-                raise Exception(self._format_error_message(error_output, video_id))
+                try:
+                    # Get info for the selected format to check if downloadable
+                    video_info = self._video_info(youtube_url, selector)
+                    
+                    # If we get here, the video info was successfully extracted
+                    description = self._describe(video_info, selector)
+                    self._check_selected(description, options, video_id)
+                    title = description['title']
+                    size = description['expected_size']
+                    size_text = f"{size / (1024 * 1024):.1f} MB" if size else "unknown size"
+                    logger.info(
+                        f"Selected format {description['format_id']} ({description['ext']}) "
+                        f"for {title}: {size_text}"
+                    )
+                    if size:
+                        metrics.observe('youtube.download.expected_bytes', size)
+                    if on_info:
+                        on_info(description)
+                    
+                    # Reserve the space first; removed with its contents when the block exits
+                    allocation = stack.enter_context(
+                        scratch.allocate(size, prefix='youtube-', directory=True)
+                    )
+                    output_template = os.path.join(allocation.path, '%(title)s.%(ext)s')
+                    
+                    # Now download the actual video
+                    download_cmd = [
+                        'youtube-dl',
+                        '--no-playlist',
+                        '-f', selector,
+                        '-o', output_template,
+                        youtube_url
+                    ]
+                    
+                    logger.info(f"Downloading video: {title}")
+                    with transfer_history.phase('download'):
+                        subprocess.run(
+                            download_cmd,
+                            capture_output=True,
+                            text=True,
+                            check=True
+                        )
+                    
+                    # Get the output filename
+                    # This is a bit tricky as youtube-dl might change the extension
+                    files = os.listdir(allocation.path)
+                    if not files:
+                        raise Exception("Download completed but no file was created.")
+                    
+                    downloaded_file = os.path.join(allocation.path, files[0])
+                    file_extension = os.path.splitext(downloaded_file)[1][1:]  # Remove the dot
+                    allocation.resize(os.path.getsize(downloaded_file))
+                    
+                    # Get mime type from the container signature and extension
+                    with open(downloaded_file, 'rb') as f:
+                        mime_type = mime_registry.detect(downloaded_file, f.read(SNIFF_BYTES))
+                    if mime_type == 'application/octet-stream':
+                        mime_type = 'video/mp4'  # Default
+                    if description['audio_only']:
+                        mime_type = AUDIO_MIME_TYPES.get(mime_type, mime_type)
+                    
+                except subprocess.CalledProcessError as e:
+                    error_output = e.stderr
+                    logger.error(f"YouTube download subprocess error: {error_output}")
+                    raise Exception(self._format_error_message(error_output, video_id))
+                    
+            except Exception as e:
+                error_msg = str(e)
+                logger.error(f"Error downloading YouTube video: {error_msg}")
                 
-        except Exception as e:
-            error_msg = str(e)
-            logger.error(f"Error downloading YouTube video: {error_msg}")
-            
-            # Clean up temporary directory if it exists
-            if temp_dir and os.path.exists(temp_dir):
-                import shutil
-                shutil.rmtree(temp_dir, ignore_errors=True)
+                # Get video_id if not defined yet or empty (might happen if error occurs before extraction)
+                if video_id is None or not video_id:
+                    video_id = self._extract_video_id(youtube_url)
                 
-            # Get video_id if not defined yet or empty (might happen if error occurs before extraction)
-            if video_id is None or not video_id:
-                video_id = self._extract_video_id(youtube_url)
+                # If the error is already formatted, just pass it through
+                if "Try a different video" in error_msg or "Please try another video" in error_msg:
+                    raise Exception(error_msg)
+                else:
+                    raise Exception(self._format_error_message(error_msg, video_id))
             
-            # If the error is already formatted, just pass it through
-            if "Try a different video" in error_msg or "Please try another video" in error_msg:
-                raise Exception(error_msg)
-            else:
-                raise Exception(self._format_error_message(error_msg, video_id))
+            # Outside the try: errors of the caller's block are not download errors
+            yield downloaded_file, f"{title}.{file_extension}", mime_type